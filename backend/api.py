@@ -8,22 +8,61 @@ All file I/O, validation, and error handling happens here - Core is pure busines
 from __future__ import annotations
 
 import asyncio
+import contextlib
+import functools
 import json
 import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
 from pathlib import Path
-from typing import Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 from fastapi import FastAPI, HTTPException, Query, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
 from fastapi.exceptions import RequestValidationError
 
+from autosave_journal import (
+    SNAPSHOT_ID_KEY,
+    AutosaveJournal,
+    externalize_op,
+    get_journal_path,
+    new_snapshot_id,
+    replay_journal,
+)
+from config_store import ConfigStore
+from atomic_io import atomic_write, atomic_write_bytes, atomic_write_json, set_fsync_policy
+from autosave_generations import GenerationWriter, get_generations_dir, list_generations, read_generation
+from autosave_scheduler import AutosaveScheduler
+from blob_store import (
+    BlobNotFoundError,
+    BlobStore,
+    externalize_session,
+    hydrate_session,
+    iter_refs,
+    missing_refs,
+)
 from core import ScriptboardCore
+from session_index import INDEX_FILENAME, SORT_FIELDS as SESSION_SORT_FIELDS, SessionIndex
+from session_format import (
+    FORMAT_BINARY,
+    FORMAT_EXTENSIONS,
+    FORMAT_JSON,
+    SESSION_FORMATS,
+    dump_session,
+    json_dumps,
+    json_loads,
+    loads_session,
+)
 from fileman import fileman_router
 from orchestrator import router as orchestrator_router
 from coderef_api import router as coderef_router
 from schemas import (
     AddPromptPayload,
+    AttachmentFilePayload,
     AttachmentTextPayload,
     ErrorCode,
     ErrorInfo,
@@ -33,14 +72,26 @@ from schemas import (
     MacroRecordResponse,
     MacroSavePayload,
     PromptPreloadedPayload,
+    SearchMode,
     TextPayload,
 )
 
 # Global ScriptboardCore instance
 core = ScriptboardCore()
 
-# Autosave debounce state
-_autosave_task: Optional[asyncio.Task] = None
+# Autosave journal state (the scheduler is created next to _autosave below)
+_autosave_journal = AutosaveJournal()
+
+# Background writer for the ring of compressed autosave generations
+_generation_writer = GenerationWriter()
+
+# Background token counting state; deferred items are read this many at a time
+_token_count_task: Optional[asyncio.Task] = None
+DEFERRED_BATCH = 64
+
+# Polling of memory-mapped attachments for file changes
+MAPPED_FILE_POLL_INTERVAL = 1.0
+_mapped_watch_task: Optional[asyncio.Task] = None
 
 # Global KeyLogger instance
 try:
@@ -93,9 +144,13 @@ async def startup_event():
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    """Stop file watcher on application shutdown."""
+    """Stop file watcher and save pending autosave edits on application shutdown."""
     from file_watcher import stop_watching
     stop_watching()
+    await _autosave_scheduler.flush()
+    # Waiting for the generation writer blocks; keep it off the event loop
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, functools.partial(_generation_writer.flush, timeout=5.0))
 
 
 def get_config_path() -> Path:
@@ -114,6 +169,19 @@ def get_sessions_dir() -> Path:
     return sessions_dir
 
 
+def get_blobs_dir() -> Path:
+    """Get path to the content-addressed blob store directory."""
+    home = Path.home()
+    blobs_dir = home / ".scriptboard" / "blobs"
+    blobs_dir.mkdir(parents=True, exist_ok=True)
+    return blobs_dir
+
+
+def get_session_index() -> SessionIndex:
+    """Get the metadata and full-text index of the sessions directory."""
+    return SessionIndex(get_sessions_dir(), content_loader=BlobStore(get_blobs_dir()).read_ref)
+
+
 def get_autosave_path() -> Path:
     """Get path to autosave file."""
     home = Path.home()
@@ -130,117 +198,299 @@ def get_macros_dir() -> Path:
     return macros_dir
 
 
-def save_session(session_data: dict, filename: Optional[str] = None) -> Path:
+def save_session(
+    session_data: dict,
+    filename: Optional[str] = None,
+    fmt: str = FORMAT_JSON,
+    total_tokens: Optional[int] = None,
+) -> Path:
     """
-    Save session to JSON file.
+    Save session to file and record it in the session index.
+    
+    The index entry includes a full-text index of the session (without a
+    copy of its text), for /sessions/search; snippets are taken from the
+    session file when results are shown.
+    
+    In JSON format the file is a manifest: attachment and response content is
+    written to the blob store (only blobs not already stored) and referenced
+    by hash. In binary format the file is self-contained, with content stored
+    inline in the length-prefixed body (see session_format.py).
     
     Args:
         session_data: Session dictionary from core.to_dict()
-        filename: Optional filename (default: timestamp-based)
+        filename: Optional filename (default: timestamp-based); the format's
+                  extension is appended when it does not already end with it,
+                  so the session index and blob garbage collection see the file
+        fmt: FORMAT_JSON or FORMAT_BINARY
+        total_tokens: Session token total to store in the index, if known
         
     Returns:
         Path to saved session file
     """
+    if fmt not in SESSION_FORMATS:
+        raise ValueError(f"Unsupported session format: {fmt}")
+    
     sessions_dir = get_sessions_dir()
+    store = BlobStore(get_blobs_dir())
     
     if filename:
-        session_path = sessions_dir / filename
+        extension = FORMAT_EXTENSIONS[fmt]
+        session_path = sessions_dir / (filename if filename.endswith(extension) else filename + extension)
     else:
         from datetime import datetime
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        session_path = sessions_dir / f"{timestamp}.json"
+        session_path = sessions_dir / f"{timestamp}{FORMAT_EXTENSIONS[fmt]}"
     
-    # Validate session data size (10MB limit)
-    import sys
-    size_estimate = sys.getsizeof(json.dumps(session_data))
-    if size_estimate > 10 * 1024 * 1024:  # 10MB
-        raise ValueError("Session data exceeds 10MB limit")
+    if fmt == FORMAT_BINARY:
+        atomic_write(session_path, lambda f: dump_session(session_data, f, FORMAT_BINARY))
+    else:
+        manifest = externalize_session(session_data, store)
+        payload = json_dumps(manifest)
+        
+        # Validate manifest size (10MB limit)
+        if len(payload) > 10 * 1024 * 1024:  # 10MB
+            raise ValueError("Session data exceeds 10MB limit")
+        
+        atomic_write_bytes(session_path, payload)
     
-    with open(session_path, "w", encoding="utf-8") as f:
-        json.dump(session_data, f, indent=2, ensure_ascii=False)
+    try:
+        get_session_index().record(session_path, session_data, total_tokens=total_tokens)
+    except sqlite3.Error:
+        pass  # The next listing picks the file up when it rescans the directory
     
     return session_path
 
 
-def load_session(session_path: Path) -> dict:
+def load_session(session_path: Path, lazy: bool = False) -> dict:
     """
-    Load session from JSON file.
+    Load session from file, resolving blob references.
+    
+    JSON and binary files are told apart by their first bytes. Each distinct
+    blob is read once; sessions with inline content (binary files, or JSON
+    saved before the blob store) load unchanged.
     
     Args:
         session_path: Path to session file
+        lazy: Return the manifest with blob references unresolved (only
+              checking the blobs exist), for core.load_from_dict(content_loader=...)
         
     Returns:
         Session dictionary
         
     Raises:
         FileNotFoundError: If session file doesn't exist
-        ValueError: If session file is invalid
+        ValueError: If session file is invalid or references missing blobs
     """
     if not session_path.exists():
         raise FileNotFoundError(f"Session file not found: {session_path}")
     
+    store = BlobStore(get_blobs_dir())
     try:
-        with open(session_path, "r", encoding="utf-8") as f:
-            session_data = json.load(f)
-        return session_data
-    except json.JSONDecodeError as e:
-        raise ValueError(f"Invalid JSON in session file: {e}")
+        session_data = loads_session(session_path.read_bytes())
+        if lazy:
+            missing = missing_refs(session_data, store)
+            if missing:
+                raise BlobNotFoundError(f"{len(missing)} blob(s), first: {missing[0]}")
+            return session_data
+        return hydrate_session(session_data, store)
+    except BlobNotFoundError as e:
+        raise ValueError(f"Session content missing from blob store: {e}")
+    except ValueError as e:
+        raise ValueError(f"Invalid session file: {e}")
 
 
-def write_autosave(session_data: dict) -> None:
+def read_autosave_fallbacks(autosave_path: Path) -> Iterator[bytes]:
     """
-    Write autosave file with rotation if >2MB.
+    Read older autosave snapshots to recover from, newest first.
+    
+    Args:
+        autosave_path: Current autosave path
+        
+    Yields:
+        Snapshot bytes of each generation, then of the pre-generation
+        autosave.old.json (unreadable files are skipped)
+    """
+    generations_dir = get_generations_dir(autosave_path)
+    for gen in list_generations(generations_dir):
+        try:
+            yield read_generation(generations_dir, gen["id"])
+        except (OSError, RuntimeError, EOFError):
+            continue
+    legacy_path = autosave_path.parent / "autosave.old.json"
+    if legacy_path.exists():
+        yield legacy_path.read_bytes()
+
+
+def write_autosave(session_data: dict) -> int:
+    """
+    Write autosave snapshot file and queue it as a compressed generation.
+    
+    The snapshot replaces autosave.json atomically, so a crash mid-write
+    never corrupts it; the generation is compressed and written by the
+    background generation writer.
     
     Args:
         session_data: Session dictionary from core.to_dict()
+        
+    Returns:
+        Bytes written (the generation is written later, off this thread)
     """
     autosave_path = get_autosave_path()
-    old_autosave_path = autosave_path.parent / "autosave.old.json"
-    
-    # Check size before writing
-    import sys
-    size_estimate = sys.getsizeof(json.dumps(session_data))
+    payload = json_dumps(session_data)
+    written = atomic_write_bytes(autosave_path, payload)
+    _generation_writer.submit(get_generations_dir(autosave_path), payload)
+    return written
+
+
+def flush_autosave(ops: list, meta: dict, session_data: Optional[dict] = None) -> Optional[int]:
+    """
+    Persist pending autosave state: a compacted snapshot or journal operations.
     
-    # Rotate if current autosave exists and new data would exceed 2MB
-    if autosave_path.exists() and size_estimate > 2 * 1024 * 1024:  # 2MB
-        if old_autosave_path.exists():
-            old_autosave_path.unlink()
-        autosave_path.rename(old_autosave_path)
+    Args:
+        ops: Operations from core.drain_journal()
+        meta: Session metadata from core.session_metadata()
+        session_data: Full session from core.to_dict() to compact into a new
+                      snapshot, or None to append ops to the journal
+        
+    Returns:
+        Bytes written (snapshot plus journal), or None if nothing had changed
+    """
+    autosave_path = get_autosave_path()
+    journal_path = get_journal_path(autosave_path)
+    store = BlobStore(get_blobs_dir())
     
-    # Write autosave
-    with open(autosave_path, "w", encoding="utf-8") as f:
-        json.dump(session_data, f, indent=2, ensure_ascii=False)
+    with _autosave_journal.lock:
+        try:
+            if session_data is not None:
+                snapshot_id = new_snapshot_id()
+                manifest = externalize_session(session_data, store)
+                written = write_autosave({**manifest, SNAPSHOT_ID_KEY: snapshot_id})
+                _autosave_journal.start(journal_path, snapshot_id, meta)
+                return written + _autosave_journal.bytes
+            
+            ops = [externalize_op(op, store) for op in ops]
+            if meta != _autosave_journal.meta:
+                ops.append({"op": "set_meta", "fields": meta})
+            if not ops:
+                return None
+            journal_bytes = _autosave_journal.bytes
+            _autosave_journal.append(journal_path, ops, meta)
+            return _autosave_journal.bytes - journal_bytes
+        except Exception:
+            _autosave_journal.invalidate()
+            raise
 
 
-def read_autosave() -> Optional[dict]:
+def read_autosave(generation_id: Optional[str] = None) -> Optional[dict]:
     """
-    Read autosave file if it exists.
+    Read autosave file if it exists, replaying its journal on top.
+    
+    The journal only applies to the snapshot it was started on, so an older
+    generation recovers the session as of that generation's autosave.
+    
+    Args:
+        generation_id: Recover this generation (from /autosave/status)
+                       instead of the latest autosave
     
     Returns:
         Session dictionary or None if autosave doesn't exist
+        
+    Raises:
+        FileNotFoundError: If generation_id names no stored generation
+        ValueError: If that generation cannot be read
     """
     autosave_path = get_autosave_path()
+    journal_path = get_journal_path(autosave_path)
+    store = BlobStore(get_blobs_dir())
+    
+    def recover(data: bytes) -> dict:
+        return hydrate_session(replay_journal(loads_session(data), journal_path), store)
+    
+    if generation_id is not None:
+        generations_dir = get_generations_dir(autosave_path)
+        if not any(gen["id"] == generation_id for gen in list_generations(generations_dir)):
+            raise FileNotFoundError(f"Autosave generation not found: {generation_id}")
+        try:
+            return recover(read_generation(generations_dir, generation_id))
+        except (IOError, RuntimeError, EOFError) as e:
+            raise ValueError(f"Autosave generation unreadable: {e}")
     
     if not autosave_path.exists():
         return None
     
     try:
-        with open(autosave_path, "r", encoding="utf-8") as f:
-            session_data = json.load(f)
-        return session_data
-    except (json.JSONDecodeError, IOError):
-        # Try old autosave if current is corrupted
-        old_autosave_path = autosave_path.parent / "autosave.old.json"
-        if old_autosave_path.exists():
+        return recover(autosave_path.read_bytes())
+    except (ValueError, IOError):
+        # Try older generations if current is corrupted (missing blobs raise IOError too)
+        for data in read_autosave_fallbacks(autosave_path):
             try:
-                with open(old_autosave_path, "r", encoding="utf-8") as f:
-                    session_data = json.load(f)
-                return session_data
-            except (json.JSONDecodeError, IOError):
-                return None
+                return recover(data)
+            except (ValueError, IOError):
+                continue
         return None
 
 
+def iter_saved_refs() -> Iterator[str]:
+    """
+    Yield the blob references of everything saved on disk.
+    
+    Covers every file under the sessions directory (whatever its name, so
+    sessions saved without an extension count too), the autosave snapshot,
+    every operation in its journal, and the older generations and
+    autosave.old.json it can be recovered from. The loaded session's
+    content comes from a saved session or the autosave state, so its
+    references are among these.
+    
+    Yields:
+        Content references (duplicates included)
+        
+    Raises:
+        OSError, ValueError: If any file in the sessions directory or the
+            autosave snapshot cannot be read; its references are unknown, so
+            callers must not treat any blob as unreferenced
+    """
+    for path in sorted(get_sessions_dir().rglob("*")):
+        # The session index database (and its journal files) is not a session
+        if path.name.startswith(INDEX_FILENAME) or not path.is_file():
+            continue
+        yield from iter_refs(loads_session(path.read_bytes()))
+    
+    autosave_path = get_autosave_path()
+    if autosave_path.exists():
+        yield from iter_refs(loads_session(autosave_path.read_bytes()))
+    
+    journal_path = get_journal_path(autosave_path)
+    if journal_path.exists():
+        with open(journal_path, "rb") as f:
+            lines = f.readlines()
+        for line in lines:
+            try:
+                op = json_loads(line)
+            except ValueError:
+                break  # Torn write from a crash mid-append
+            yield from iter_refs(op)
+    
+    for data in read_autosave_fallbacks(autosave_path):
+        try:
+            yield from iter_refs(loads_session(data))
+        except ValueError:
+            continue  # Unrecoverable, so its blobs are not needed either
+
+
+def collect_blob_garbage() -> Tuple[int, int]:
+    """
+    Delete blobs that no saved session or autosave state references.
+    
+    Blobs written in the grace period (see blob_store.collect_garbage) are
+    kept, so content of a session being saved meanwhile is never lost.
+    
+    Returns:
+        (blobs deleted, bytes freed)
+    """
+    refs = set(iter_saved_refs())
+    return BlobStore(get_blobs_dir()).collect_garbage(refs)
+
+
 def load_profile(profile_name: str) -> dict:
     """
     Load a workspace profile from config.
@@ -369,15 +619,17 @@ def sync_prompts_from_settings(config_prompts: dict) -> tuple[dict, bool]:
     return config_prompts, modified
 
 
-def load_config() -> dict:
+def read_config_file(config_path: Path) -> tuple[dict, bool]:
     """
-    Load configuration from ~/.scriptboard/config.json with validation and fallback to defaults.
+    Read and validate a config file, falling back to defaults.
     
+    Args:
+        config_path: Path to config.json
+        
     Returns:
-        Configuration dictionary
+        tuple: (config dictionary, whether it changed during validation
+        (migrated or synced prompts) and should be written back)
     """
-    config_path = get_config_path()
-    
     # If config doesn't exist, return defaults with 4-digit keys
     if not config_path.exists():
         from settings import DEFAULT_FAVORITES, DEFAULT_LLM_URLS, PRELOADED_PROMPTS
@@ -402,7 +654,7 @@ def load_config() -> dict:
             "keymap": {},
             "theme": None,
             "prompts": prompts,
-        }
+        }, False
     
     try:
         with open(config_path, "r", encoding="utf-8") as f:
@@ -449,13 +701,8 @@ def load_config() -> dict:
                     "text": text
                 }
             config["prompts"] = prompts
-            # Save migrated prompts to config file
-            try:
-                config_path = get_config_path()
-                with open(config_path, "w", encoding="utf-8") as f:
-                    json.dump(config, f, indent=2, ensure_ascii=False)
-            except (IOError, OSError):
-                pass  # If save fails, continue with in-memory config
+            # Migrated prompts are written back to the config file
+            return config, True
         else:
             # Migrate existing keys to 4-digit format if needed
             prompts = config["prompts"]
@@ -473,20 +720,8 @@ def load_config() -> dict:
             # Sync any new prompts from settings.py
             config["prompts"], sync_modified = sync_prompts_from_settings(config["prompts"])
             
-            # Save if migration or sync occurred
-            if needs_migration or sync_modified:
-                try:
-                    config_path = get_config_path()
-                    import tempfile
-                    import shutil
-                    temp_path = config_path.with_suffix(".tmp")
-                    with open(temp_path, "w", encoding="utf-8") as f:
-                        json.dump(config, f, indent=2, ensure_ascii=False)
-                    shutil.move(str(temp_path), str(config_path))
-                except (IOError, OSError):
-                    pass  # If save fails, continue with in-memory config
-        
-        return config
+            # Written back if migration or sync occurred
+            return config, needs_migration or sync_modified
     
     except (json.JSONDecodeError, IOError) as e:
         # Invalid config - return defaults with 4-digit keys
@@ -512,7 +747,41 @@ def load_config() -> dict:
             "keymap": {},
             "theme": None,
             "prompts": prompts,
-        }
+        }, False
+
+
+_config_store = ConfigStore(read_config_file)
+
+
+def load_config() -> dict:
+    """
+    Load configuration from ~/.scriptboard/config.json with validation and fallback to defaults.
+    
+    The parsed config is cached and only re-read when the file's mtime or
+    size changes. The returned dictionary is shared: treat it as read-only
+    and change the config with update_config().
+    
+    Returns:
+        Configuration dictionary
+    """
+    return _config_store.load(get_config_path())
+
+
+def update_config(mutate: Callable[[dict], Any]) -> Any:
+    """
+    Change the config under the config lock and write it atomically.
+    
+    Args:
+        mutate: Function modifying a copy of the config in place (may raise
+                HTTPException to abort without writing)
+        
+    Returns:
+        Whatever mutate returns
+        
+    Raises:
+        OSError: If the config file cannot be written
+    """
+    return _config_store.update(get_config_path(), mutate)
 
 
 # --------------------------------------------------------------------------- #
@@ -577,36 +846,134 @@ async def general_exception_handler(request: Request, exc: Exception):
     )
 
 
-async def _debounced_autosave():
-    """Debounced autosave function (1s delay)."""
-    await asyncio.sleep(1.0)  # 1 second debounce
+async def _autosave(sections: frozenset) -> Optional[int]:
+    """
+    Save edits since the last autosave (called by the autosave scheduler).
+    
+    The journal is drained and the session captured on the event loop, so no
+    edit is lost or saved twice; serialization and writes run in the thread pool.
+    
+    Args:
+        sections: Sections edited since the last autosave
+        
+    Returns:
+        Bytes written, or None if nothing had changed
+    """
+    ops, needs_snapshot = core.drain_journal()
+    meta = core.session_metadata()
+    # Only serialize the whole session when compacting into a new snapshot;
+    # content already in the blob store is referenced, not hashed again
+    build_snapshot = None
+    if needs_snapshot or _autosave_journal.needs_compaction():
+        build_snapshot = core.snapshot_builder(keep_refs=True, content_saver=BlobStore(get_blobs_dir()).write_ref)
+    
+    def flush() -> Optional[int]:
+        session_data = build_snapshot() if build_snapshot is not None else None
+        return flush_autosave(ops, meta, session_data)
+    
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, flush)
+
+
+_autosave_scheduler = AutosaveScheduler(_autosave)
+
+
+def trigger_autosave(section: str = "session"):
+    """
+    Schedule an autosave: after 1s without edits, at most 5s after the first unsaved edit.
+    
+    Args:
+        section: Edited part of the session (reported in autosave metrics)
+    """
+    _autosave_scheduler.mark_dirty(section)
+
+
+async def _count_pending_tokens():
+    """
+    Count pending token work in the thread pool until none is left.
+    
+    Deferred content (lazily loaded sessions, mapped files) is read first, in
+    batches of DEFERRED_BATCH items, and indexed for search from the same read.
+    """
+    loop = asyncio.get_event_loop()
+    while True:
+        deferred = core.pending_deferred_items(DEFERRED_BATCH)
+        if deferred:
+            try:
+                derived = await loop.run_in_executor(None, core.derive_deferred, deferred)
+            except Exception:
+                # Unreadable content stays unindexed (searches read it directly); count what is left
+                derived = None
+            if derived is not None:
+                core.apply_derived(deferred, derived)
+                continue
+        items = core.pending_token_items()
+        if not items:
+            return
+        try:
+            counts = await loop.run_in_executor(None, core.count_tokens_for, items)
+        except Exception:
+            # Leave items pending - next trigger retries them
+            return
+        core.apply_token_counts(items, counts)
+
+
+def trigger_token_count():
+    """Start the background token counter if it is not already running."""
+    global _token_count_task
     
     try:
-        session_data = core.to_dict()
-        # Run write_autosave in thread pool to avoid blocking
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, write_autosave, session_data)
-    except Exception:
-        # Silently fail autosave - don't break user workflow
-        pass
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # No event loop running, counts stay pending until /tokens?wait=true
+        return
+    
+    # A running worker picks up new items on its next pass
+    if _token_count_task and not _token_count_task.done() and _token_count_task.get_loop() is loop:
+        return
+    
+    _token_count_task = loop.create_task(_count_pending_tokens())
+
 
+async def _watch_mapped_files():
+    """Poll memory-mapped attachments for file changes while there are any."""
+    while core.has_mapped_attachments:
+        await asyncio.sleep(MAPPED_FILE_POLL_INTERVAL)
+        await _refresh_mapped_attachments()
 
-def trigger_autosave():
-    """Trigger autosave with 1s debounce."""
-    global _autosave_task
+
+async def _refresh_mapped_attachments():
+    """Re-index and re-count mapped attachments whose file changed."""
+    files = core.mapped_files()
+    if not files:
+        return
+    # Checking each file is a stat and re-mapping decodes it to count it;
+    # keep both off the event loop
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, functools.partial(_remap_files, files))
+    if core.refresh_mapped_attachments():
+        trigger_token_count()
+
+
+def _remap_files(files: list) -> None:
+    """Re-map mapped files that changed (thread pool)."""
+    for mapped in files:
+        mapped.refresh()
+
+
+def trigger_mapped_file_watch():
+    """Start polling mapped attachments for changes if it is not already running."""
+    global _mapped_watch_task
     
     try:
         loop = asyncio.get_running_loop()
     except RuntimeError:
-        # No event loop running, skip autosave
         return
     
-    # Cancel previous autosave task if it exists
-    if _autosave_task and not _autosave_task.done():
-        _autosave_task.cancel()
+    if _mapped_watch_task and not _mapped_watch_task.done() and _mapped_watch_task.get_loop() is loop:
+        return
     
-    # Create new autosave task
-    _autosave_task = loop.create_task(_debounced_autosave())
+    _mapped_watch_task = loop.create_task(_watch_mapped_files())
 
 
 # Initialize core with config on startup
@@ -620,6 +987,38 @@ async def startup_event():
     # Reinitialize core with loaded config
     global core
     core = ScriptboardCore(favorites=favorites, llm_urls=llm_urls)
+    
+    # Durability/throughput trade-off for every file write (see atomic_io)
+    if config.get("fsync_policy"):
+        try:
+            set_fsync_policy(config["fsync_policy"])
+        except ValueError as e:
+            print(f"Ignoring config fsync_policy: {e}")
+    
+    # Index session files added or changed while the app was not running, and
+    # drop blobs left behind by deleted or re-saved sessions
+    loop = asyncio.get_running_loop()
+    loop.run_in_executor(None, _sync_session_index)
+    loop.run_in_executor(None, _collect_blob_garbage)
+
+
+def _sync_session_index() -> None:
+    """Reconcile the session index with the sessions directory (thread pool)."""
+    try:
+        get_session_index().sync()
+    except (sqlite3.Error, OSError) as e:
+        print(f"Session index sync failed: {e}")
+
+
+def _collect_blob_garbage() -> None:
+    """Delete unreferenced blobs from the blob store (thread pool)."""
+    try:
+        deleted, freed = collect_blob_garbage()
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"Blob garbage collection skipped: {e}")
+        return
+    if deleted:
+        print(f"Deleted {deleted} unreferenced blob(s), {freed / (1024 * 1024):.1f} MB")
 
 
 # --------------------------------------------------------------------------- #
@@ -670,7 +1069,8 @@ async def get_session():
 async def set_prompt(payload: TextPayload):
     """Set the current prompt from text."""
     core.set_prompt(payload.text, source="manual")
-    trigger_autosave()
+    trigger_autosave("prompt")
+    trigger_token_count()
     return {"status": "ok"}
 
 
@@ -678,7 +1078,7 @@ async def set_prompt(payload: TextPayload):
 async def clear_prompt():
     """Clear the current prompt."""
     core.clear_prompt()
-    trigger_autosave()
+    trigger_autosave("prompt")
     return {"status": "ok"}
 
 
@@ -709,29 +1109,23 @@ async def get_preloaded_prompts():
 @app.post("/prompts")
 async def add_preloaded_prompt(payload: AddPromptPayload):
     """Add a new preloaded prompt to config.json with auto-generated 4-digit key."""
-    config = load_config()
-    prompts = config.get("prompts", {})
-    
-    # Auto-generate next 4-digit key
-    new_key = generate_next_prompt_key(prompts)
-    
-    # Add to prompts
-    prompts[new_key] = {
-        "label": payload.label,
-        "text": payload.text
-    }
-    config["prompts"] = prompts
+    def add_prompt(config: dict) -> str:
+        prompts = config.get("prompts", {})
+        
+        # Auto-generate next 4-digit key
+        new_key = generate_next_prompt_key(prompts)
+        
+        # Add to prompts
+        prompts[new_key] = {
+            "label": payload.label,
+            "text": payload.text
+        }
+        config["prompts"] = prompts
+        return new_key
     
-    # Save config
-    config_path = get_config_path()
+    # Save config (atomic write)
     try:
-        # Atomic write: write to temp file, then rename
-        import tempfile
-        import shutil
-        temp_path = config_path.with_suffix(".tmp")
-        with open(temp_path, "w", encoding="utf-8") as f:
-            json.dump(config, f, indent=2, ensure_ascii=False)
-        shutil.move(str(temp_path), str(config_path))
+        new_key = update_config(add_prompt)
     except (IOError, OSError) as e:
         raise HTTPException(
             status_code=500,
@@ -762,7 +1156,8 @@ async def use_preloaded_prompt(payload: PromptPreloadedPayload):
         prompt_text = prompt_text.replace("{{DATE}}", today)
 
         core.set_prompt(prompt_text, source=f"preloaded:{payload.key}")
-        trigger_autosave()
+        trigger_autosave("prompt")
+        trigger_token_count()
         return {"status": "ok"}
 
     raise HTTPException(
@@ -782,7 +1177,8 @@ async def add_attachment_text(payload: AttachmentTextPayload):
         payload.text,
         suggested_name=payload.suggested_name
     )
-    trigger_autosave()
+    trigger_autosave("attachments")
+    trigger_token_count()
     from schemas import AttachmentSummary
     return AttachmentSummary(
         id=attachment.id,
@@ -792,6 +1188,72 @@ async def add_attachment_text(payload: AttachmentTextPayload):
     )
 
 
+@app.post("/attachments/file")
+async def add_attachment_file(payload: AttachmentFilePayload):
+    """
+    Attach a file from disk.
+
+    Large text files (or any file with mmap=true) are memory-mapped: their
+    content is decoded on demand instead of being held in memory, and
+    saved sessions refer to the file by path. Files with NUL bytes near the
+    start are attached as binary metadata.
+    """
+    from folder_import import SNIFF_BYTES, read_text_file
+    from mapped_file import MAP_THRESHOLD_BYTES, MappedText
+
+    path = Path(payload.path)
+    try:
+        if not path.is_file():
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid file path",
+            )
+        size = path.stat().st_size
+        with open(path, "rb") as f:
+            binary = b"\x00" in f.read(SNIFF_BYTES)
+    except OSError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid path: {str(e)}",
+        )
+
+    use_mmap = payload.mmap
+    if use_mmap is None:
+        use_mmap = MAP_THRESHOLD_BYTES is not None and size >= MAP_THRESHOLD_BYTES
+    loop = asyncio.get_running_loop()
+    try:
+        if binary:
+            attachment = core.add_attachment_from_path(str(path), content="", binary=True)
+        elif use_mmap:
+            # Mapping counts lines and characters in one pass over the file
+            mapped = await loop.run_in_executor(None, MappedText, str(path))
+            attachment = core.add_attachment_from_mapped_file(mapped, suggested_name=payload.suggested_name)
+        else:
+            text = await loop.run_in_executor(None, read_text_file, str(path))
+            # None: binary content past the sniffed prefix (or the file changed
+            # since); empty text from a non-empty file: nothing decodable
+            if text is None or (size and not text):
+                raise ValueError("not a UTF-8 text file")
+            attachment = core.add_attachment_from_text(text, suggested_name=payload.suggested_name or path.name)
+    except (OSError, ValueError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Could not read file: {str(e)}",
+        )
+
+    trigger_autosave("attachments")
+    trigger_token_count()
+    trigger_mapped_file_watch()
+    from schemas import AttachmentSummary
+    return AttachmentSummary(
+        id=attachment.id,
+        filename=attachment.filename,
+        lines=attachment.lines,
+        binary=attachment.binary,
+        mapped=attachment.content_mapped is not None,
+    )
+
+
 @app.get("/attachments")
 async def list_attachments():
     """Get list of all attachments."""
@@ -802,21 +1264,29 @@ async def list_attachments():
         filename=att.filename,
         lines=att.lines,
         binary=att.binary,
+        mapped=att.content_mapped is not None,
     ) for att in attachments]
 
 
-@app.post("/attachments/folder")
-async def import_folder(payload: dict):
-    """Import all text files from a folder recursively."""
+# Files applied to the session per batch, and seconds between progress
+# updates while a folder import is running
+FOLDER_IMPORT_BATCH = 200
+FOLDER_IMPORT_PROGRESS_INTERVAL = 0.25
+
+# Cancel events of running folder imports by import ID
+_folder_imports: dict = {}
+
+
+def _validate_folder(payload: dict) -> Path:
+    """Get the folder from an import payload, raising 400 if it is not a directory."""
     folder_path = payload.get("path")
-    
+
     if not folder_path:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Folder path is required",
         )
-    
-    # Validate path
+
     try:
         folder = Path(folder_path)
         if not folder.exists() or not folder.is_dir():
@@ -829,53 +1299,337 @@ async def import_folder(payload: dict):
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Invalid path: {str(e)}",
         )
-    
-    # Recursively find all text files
-    text_extensions = {".txt", ".py", ".js", ".ts", ".tsx", ".jsx", ".json", ".md", ".yml", ".yaml", ".xml", ".html", ".css", ".scss", ".sql", ".sh", ".bat", ".ps1"}
-    imported = []
-    skipped = []
-    
-    for file_path in folder.rglob("*"):
-        if file_path.is_file():
-            # Check if it's a text file
-            if file_path.suffix.lower() in text_extensions or file_path.suffix == "":
-                try:
-                    # Try to read as text
-                    content = file_path.read_text(encoding="utf-8", errors="ignore")
-                    # Check if it's actually text (basic heuristic: no null bytes)
-                    if "\x00" not in content:
-                        # Add as attachment
-                        rel_path = file_path.relative_to(folder)
-                        core.add_attachment_from_text(
-                            content,
-                            suggested_name=str(rel_path)
-                        )
-                        imported.append(str(rel_path))
-                    else:
-                        skipped.append(str(file_path.relative_to(folder)))
-                except Exception as e:
-                    skipped.append(str(file_path.relative_to(folder)))
-            else:
-                # Binary file - add as metadata only
-                rel_path = file_path.relative_to(folder)
-                core.add_attachment_from_path(str(file_path), content="", binary=True)
-                imported.append(f"{rel_path} (binary)")
-    
-    trigger_autosave()
-    
+    return folder
+
+
+def _folder_import_options(payload: dict):
+    """
+    Build folder import filters from a request payload, raising 400 if invalid.
+
+    Optional keys: include and exclude (lists of gitignore-style globs),
+    respect_ignore (honour .gitignore/.ignore files, default true),
+    max_file_bytes (default 1 MiB, null for no cap; applies to files that are
+    not mapped), max_mapped_bytes (cap for mapped files, default 64 MiB, null
+    for no cap), max_total_bytes and max_tokens (default unlimited), and
+    map_threshold (memory-map text files at least this large, default 1 MiB,
+    or null on Windows; null never maps).
+    """
+    from folder_import import ImportOptions
+
+    options = ImportOptions()
+    for key in ("include", "exclude"):
+        globs = payload.get(key) or []
+        if not isinstance(globs, list) or not all(isinstance(glob, str) for glob in globs):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"{key} must be a list of glob patterns",
+            )
+        setattr(options, key, globs)
+    options.use_ignore_files = bool(payload.get("respect_ignore", True))
+    for key in ("max_file_bytes", "max_mapped_bytes", "max_total_bytes", "max_tokens", "map_threshold"):
+        if key not in payload:
+            continue
+        limit = payload[key]
+        if limit is not None and (not isinstance(limit, int) or isinstance(limit, bool) or limit < 0):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"{key} must be a non-negative integer or null",
+            )
+        setattr(options, key, limit)
+    return options
+
+
+def _count_import_tokens(text: str) -> int:
+    """Count tokens for a folder import budget, warming the session's token cache."""
+    return core.count_tokens_for({"text": text})["text"]
+
+
+async def _import_folder(folder: Path, cancel: threading.Event, options=None, sync: bool = False):
+    """
+    Import a folder, yielding a progress dictionary after each batch.
+
+    Walking and reading run in the thread pool (see folder_import); only
+    adding attachments to the session runs on the event loop. Every file
+    is recorded in the folder's manifest (core.folder_sources).
+
+    With sync=True the folder must have been imported before and its stored
+    filters and budgets are reused: files unchanged since the manifest was
+    recorded are not read (but count against the budgets with their recorded
+    size and tokens), changed files update their attachment in place
+    (keeping its ID), new files are added, and files that no longer exist
+    are removed. The file a budget stopped at is recorded in the manifest,
+    so a sync of an unchanged folder stops at the same place.
+    """
+    from folder_import import (
+        BUDGET_EXHAUSTED,
+        STATUS_BINARY,
+        STATUS_TEXT,
+        STATUS_UNCHANGED,
+        ImportOptions,
+        iter_import,
+        next_batch,
+    )
+
+    root = str(folder.resolve())
+    manifest = None
+    if sync:
+        source = core.folder_sources[root]
+        manifest = source["files"]
+        options = ImportOptions.from_dict(source["options"])
+    options = options or ImportOptions()
+    options_dict = options.to_dict()
+    if not sync and root in core.folder_sources:
+        # A fresh import starts a new manifest; earlier attachments stay as they are
+        core.update_folder_source(root, options_dict, {}, removed=list(core.folder_sources[root]["files"]))
+
+    loop = asyncio.get_running_loop()
+    files = iter_import(str(folder), cancel=cancel, options=options, count_tokens=_count_import_tokens, manifest=manifest)
+    take = functools.partial(next_batch, files, FOLDER_IMPORT_BATCH, FOLDER_IMPORT_PROGRESS_INTERVAL)
+    progress = {
+        "imported": 0,
+        "updated": 0,
+        "removed": 0,
+        "unchanged": 0,
+        "skipped": 0,
+        "bytes": 0,
+        "budget_exhausted": False,
+        "files": [],
+    }
+    seen = set()
+    attachment_ids = {att.id for att in core.list_attachments()} if sync else set()
+    try:
+        while not cancel.is_set():
+            batch = await loop.run_in_executor(None, take)
+            if not batch:
+                break
+            names = []
+            entries = {}
+            for record in batch:
+                seen.add(record.rel_path)
+                if record.status == STATUS_UNCHANGED:
+                    progress["unchanged"] += 1
+                    continue
+
+                previous = manifest.get(record.rel_path, {}) if manifest is not None else {}
+                att_id = previous.get("id") if previous.get("id") in attachment_ids else None
+                if record.error == BUDGET_EXHAUSTED:
+                    if att_id is not None:
+                        # Over budget now that earlier files grew
+                        core.remove_attachments([att_id])
+                        progress["removed"] += 1
+                    progress["skipped"] += 1
+                    progress["budget_exhausted"] = True
+                    entries[record.rel_path] = {
+                        "id": None,
+                        "mtime_ns": record.mtime_ns,
+                        "size": record.size,
+                        "hash": None,
+                        "budget_exhausted": True,
+                    }
+                    continue
+                content = record.mapped if record.mapped is not None else record.content
+                if (
+                    record.status == STATUS_TEXT
+                    and att_id is not None
+                    and record.hash is not None
+                    and previous.get("hash") == record.hash
+                ):
+                    progress["unchanged"] += 1  # Touched but identical
+                elif record.status == STATUS_TEXT and att_id is not None:
+                    core.update_attachment(att_id, content)
+                    progress["updated"] += 1
+                    progress["bytes"] += record.size
+                elif record.status == STATUS_TEXT and record.mapped is not None:
+                    att_id = core.add_attachment_from_mapped_file(record.mapped, suggested_name=record.rel_path).id
+                    names.append(record.rel_path)
+                    progress["bytes"] += record.size
+                elif record.status == STATUS_TEXT:
+                    att_id = core.add_attachment_from_text(record.content, suggested_name=record.rel_path).id
+                    names.append(record.rel_path)
+                    progress["bytes"] += record.size
+                elif record.status == STATUS_BINARY and att_id is None:
+                    att_id = core.add_attachment_from_path(record.path, content="", binary=True).id
+                    names.append(f"{record.rel_path} (binary)")
+                elif record.status != STATUS_BINARY:
+                    if att_id is not None:
+                        # Became binary, too large, or unreadable since the last import
+                        core.remove_attachments([att_id])
+                        progress["removed"] += 1
+                        att_id = None
+                    progress["skipped"] += 1
+                entries[record.rel_path] = {
+                    "id": att_id,
+                    "mtime_ns": record.mtime_ns,
+                    "size": record.size,
+                    "hash": record.hash,
+                    "text": record.status == STATUS_TEXT,
+                    "tokens": record.tokens,
+                }
+            progress["imported"] += len(names)
+            progress["files"] = names
+            if entries:
+                core.update_folder_source(root, options_dict, entries)
+            trigger_autosave("attachments")
+            yield progress
+
+        if sync and not cancel.is_set():
+            deleted = [rel_path for rel_path in manifest if rel_path not in seen]
+            if progress["budget_exhausted"] and deleted:
+                # The walk stopped at the budget: unseen files may still exist
+                deleted = await loop.run_in_executor(
+                    None, lambda: [rel_path for rel_path in deleted if not os.path.exists(os.path.join(root, rel_path))]
+                )
+            if deleted:
+                progress["removed"] += core.remove_attachments(manifest[rel_path]["id"] for rel_path in deleted)
+                core.update_folder_source(root, options_dict, {}, removed=deleted)
+                progress["files"] = []
+                trigger_autosave("attachments")
+                yield progress
+    finally:
+        try:
+            await loop.run_in_executor(None, files.close)
+        except ValueError:
+            cancel.set()  # A batch is still being read for a cancelled task; stop it there
+        trigger_token_count()
+        trigger_mapped_file_watch()
+
+
+@app.post("/attachments/folder")
+async def import_folder(payload: dict):
+    """
+    Import text files from a folder recursively.
+
+    Directories such as node_modules and .git, and paths matched by
+    .gitignore/.ignore files, are skipped; see _folder_import_options for
+    the optional filter and budget keys. The folder can later be refreshed
+    with /attachments/folder/sync.
+    """
+    folder = _validate_folder(payload)
+    options = _folder_import_options(payload)
+
+    files = []
+    progress = {"imported": 0, "skipped": 0, "budget_exhausted": False}
+    async for progress in _import_folder(folder, threading.Event(), options):
+        files.extend(progress["files"][:50 - len(files)])
+
     return {
         "status": "ok",
-        "imported": len(imported),
-        "skipped": len(skipped),
-        "files": imported[:50],  # Limit to first 50 for response size
+        "imported": progress["imported"],
+        "skipped": progress["skipped"],
+        "budget_exhausted": progress["budget_exhausted"],
+        "files": files,  # Limit to first 50 for response size
     }
 
 
+@app.post("/attachments/folder/sync")
+async def sync_folder(payload: dict):
+    """
+    Re-sync a previously imported folder with its attachments.
+
+    Only files whose mtime or size changed are read; changed files keep
+    their attachment ID (so token counts and search entries of the others
+    stay valid), new files are added and deleted files are removed. The
+    filters and budgets given at import time are reused.
+    """
+    folder = _validate_folder(payload)
+    if str(folder.resolve()) not in core.folder_sources:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Folder has not been imported",
+        )
+
+    files = []
+    progress = {"imported": 0, "updated": 0, "removed": 0, "unchanged": 0, "skipped": 0, "budget_exhausted": False}
+    async for progress in _import_folder(folder, threading.Event(), sync=True):
+        files.extend(progress["files"][:50 - len(files)])
+
+    return {
+        "status": "ok",
+        "imported": progress["imported"],
+        "updated": progress["updated"],
+        "removed": progress["removed"],
+        "unchanged": progress["unchanged"],
+        "skipped": progress["skipped"],
+        "budget_exhausted": progress["budget_exhausted"],
+        "files": files,  # Limit to first 50 for response size
+    }
+
+
+@app.post("/attachments/folder/stream")
+async def import_folder_stream(request: Request, payload: dict):
+    """
+    Import a folder, streaming progress as Server-Sent Events.
+
+    The first 'start' event carries an import_id that can be passed to
+    /attachments/folder/cancel/{import_id}; disconnecting also cancels the
+    import. Each 'progress' event reports running totals and the files
+    added by the last batch. A final 'done' event reports the totals and
+    whether the import was cancelled; files imported before cancelling
+    are kept. Accepts the same filters as /attachments/folder.
+    """
+    folder = _validate_folder(payload)
+    options = _folder_import_options(payload)
+    import_id = uuid.uuid4().hex
+    cancel = threading.Event()
+    _folder_imports[import_id] = cancel
+
+    async def event_generator():
+        start = time.perf_counter()
+        progress = {"imported": 0, "skipped": 0, "bytes": 0, "budget_exhausted": False}
+        try:
+            yield f"data: {json.dumps({'type': 'start', 'import_id': import_id, 'path': str(folder)})}\n\n"
+            try:
+                async with contextlib.aclosing(_import_folder(folder, cancel, options)) as updates:
+                    async for progress in updates:
+                        if await request.is_disconnected():
+                            cancel.set()
+                            return
+                        yield f"data: {json.dumps({'type': 'progress', **progress})}\n\n"
+                elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+                done = {
+                    "type": "done",
+                    "imported": progress["imported"],
+                    "skipped": progress["skipped"],
+                    "bytes": progress["bytes"],
+                    "budget_exhausted": progress["budget_exhausted"],
+                    "cancelled": cancel.is_set(),
+                    "elapsed_ms": elapsed_ms,
+                }
+                yield f"data: {json.dumps(done)}\n\n"
+            except Exception as e:
+                yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+        finally:
+            _folder_imports.pop(import_id, None)
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        }
+    )
+
+
+@app.post("/attachments/folder/cancel/{import_id}")
+async def cancel_folder_import(import_id: str):
+    """Cancel a running streamed folder import."""
+    cancel = _folder_imports.get(import_id)
+    if cancel is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Folder import not found: {import_id}",
+        )
+    cancel.set()
+    return {"status": "ok"}
+
+
 @app.delete("/attachments")
 async def clear_attachments():
     """Clear all attachments."""
     core.clear_attachments()
-    trigger_autosave()
+    trigger_autosave("attachments")
     return {"status": "ok"}
 
 
@@ -887,7 +1641,8 @@ async def clear_attachments():
 async def add_response(payload: TextPayload):
     """Add a new LLM response."""
     response = core.add_response(payload.text, source="manual")
-    trigger_autosave()
+    trigger_autosave("responses")
+    trigger_token_count()
     from schemas import ResponseSummaryItem
     return ResponseSummaryItem(
         id=response.id,
@@ -934,7 +1689,7 @@ async def get_responses():
 async def clear_responses():
     """Clear all responses."""
     core.clear_responses()
-    trigger_autosave()
+    trigger_autosave("responses")
     return {"status": "ok"}
 
 
@@ -958,19 +1713,69 @@ async def get_preview_full():
     return PreviewResponse(preview=preview_text)
 
 
-@app.get("/export/markdown")
-async def export_markdown():
-    """Export session as Markdown."""
-    preview = core.build_combined_preview()
-    
-    # Convert preview to markdown format
+def _markdown_from_preview(preview: str) -> str:
+    """Convert combined preview text (or a chunk of it) to Markdown headings."""
     markdown = preview.replace("=== PROMPT ===", "# Prompt\n\n")
     markdown = markdown.replace("=== ATTACHMENTS ===", "\n\n# Attachments\n\n")
     markdown = markdown.replace("=== RESPONSES ===", "\n\n# Responses\n\n")
+    return markdown
+
+
+def _require_stream_for_gzip(stream: bool, gzip: bool) -> None:
+    """Reject gzip=true on a JSON export, which would otherwise be returned uncompressed."""
+    if gzip and not stream:
+        raise HTTPException(status_code=400, detail="gzip=true requires stream=true")
+
+
+def _export_stream(chunks: Iterator[str], media_type: str, filename: str, gzip: bool) -> StreamingResponse:
+    """
+    Serve export text chunks with chunked transfer encoding.
+    
+    The chunk generator is synchronous, so Starlette drives it (and the
+    optional compression) from its thread pool rather than the event loop.
+    
+    Args:
+        chunks: Text chunks from a ScriptboardCore iter_* export generator
+        media_type: Response media type
+        filename: Suggested download filename
+        gzip: Compress the body with gzip (Content-Encoding: gzip)
+    """
+    def encode_chunks():
+        compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if gzip else None
+        for chunk in chunks:
+            data = chunk.encode("utf-8", errors="replace")
+            if compressor is not None:
+                data = compressor.compress(data)
+            if data:
+                yield data
+        if compressor is not None:
+            yield compressor.flush()
+    
+    headers = {
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    }
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(encode_chunks(), media_type=media_type, headers=headers)
+
+
+@app.get("/export/markdown")
+async def export_markdown(
+    stream: bool = Query(False, description="Stream the Markdown body instead of returning JSON"),
+    gzip: bool = Query(False, description="Gzip the streamed body (requires stream=true)"),
+):
+    """Export session as Markdown."""
+    _require_stream_for_gzip(stream, gzip)
+    filename = f"scriptboard_{int(time.time())}.md"
+    if stream:
+        chunks = (_markdown_from_preview(chunk) for chunk in core.iter_combined_preview())
+        return _export_stream(chunks, "text/markdown; charset=utf-8", filename, gzip)
     
     return {
-        "markdown": markdown,
-        "filename": f"scriptboard_{int(time.time())}.md",
+        "markdown": _markdown_from_preview(core.build_combined_preview()),
+        "filename": filename,
     }
 
 
@@ -1004,8 +1809,25 @@ async def export_llm_friendly_responses():
 
 
 @app.get("/export/llm")
-async def export_llm_friendly():
+async def export_llm_friendly(
+    stream: bool = Query(False, description="Stream the text body instead of returning JSON"),
+    gzip: bool = Query(False, description="Gzip the streamed body (requires stream=true)"),
+    budget: Optional[int] = Query(None, ge=1, description="Token budget; attachments are selected and truncated to fit"),
+    model: str = Query("gpt-4", description="Model whose tokenizer measures the budget"),
+):
     """Export session in LLM-friendly text format for pasting into chat interfaces."""
+    _require_stream_for_gzip(stream, gzip)
+    if stream:
+        filename = f"scriptboard_{int(time.time())}.txt"
+        chunks = core.iter_llm_friendly_export(budget, model)
+        return _export_stream(chunks, "text/plain; charset=utf-8", filename, gzip)
+    if budget is not None:
+        # Packing tokenizes uncached content, keep it off the event loop
+        loop = asyncio.get_running_loop()
+        text = await loop.run_in_executor(
+            None, functools.partial(core.build_llm_friendly_export, token_budget=budget, model=model)
+        )
+        return {"text": text}
     text = core.build_llm_friendly_export()
     return {"text": text}
 
@@ -1015,35 +1837,316 @@ async def export_llm_friendly():
 # --------------------------------------------------------------------------- #
 
 @app.get("/search")
-async def search(q: str, limit: int = 20, offset: int = 0):
-    """Search across prompt, attachments, and responses."""
+async def search(
+    q: str,
+    limit: int = 20,
+    offset: int = 0,
+    ranked: bool = False,
+    mode: SearchMode = SearchMode.EXACT,
+    budget_ms: int = Query(500, ge=1, le=10000),
+):
+    """
+    Search across prompt, attachments, and responses.
+
+    With ranked=true, results are ordered by BM25 relevance and each result
+    carries every match offset so the UI can jump between hits locally.
+
+    mode=regex and mode=fuzzy run in the thread pool and stop after budget_ms,
+    returning partial results with timed_out=true, so a slow pattern cannot
+    stall the event loop.
+    """
     from schemas import SearchResponse
-    results = core.search(q, limit=limit, offset=offset)
+    await _refresh_mapped_attachments()
+    search_call = functools.partial(
+        core.search,
+        q,
+        limit=limit,
+        offset=offset,
+        ranked=ranked,
+        mode=mode,
+        time_budget=budget_ms / 1000,
+    )
+    try:
+        # Exact searches use the index; deferred content not indexed yet is read, off the loop
+        if mode == SearchMode.EXACT and not core.has_unindexed_content:
+            results = search_call()
+        else:
+            loop = asyncio.get_event_loop()
+            results = await loop.run_in_executor(None, search_call)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     return SearchResponse(**results)
 
 
+# Results handed from the scanning thread per batch, and seconds after which
+# a partial (possibly empty) batch is sent, while a streamed search is running
+SEARCH_STREAM_BATCH = 20
+SEARCH_STREAM_INTERVAL = 0.05
+
+# Documents scanned without a match between heartbeats (see core.iter_search)
+SEARCH_STREAM_HEARTBEAT_DOCS = 50
+
+
+def _next_search_results(
+    results: Iterator[Optional[Dict]], max_results: int, max_wait: float
+) -> Tuple[List[Dict], bool]:
+    """
+    Take the next batch of results from core.iter_search() (runs in the thread pool).
+
+    Heartbeats let the batch end on time even while no document matches.
+
+    Args:
+        results: Iterator from core.iter_search() with heartbeats
+        max_results: Largest batch
+        max_wait: Seconds after which a partial batch is returned
+
+    Returns:
+        (results, finished) tuple; finished is True once the scan is over
+    """
+    batch: List[Dict] = []
+    deadline = time.monotonic() + max_wait
+    for result in results:
+        if result is not None:
+            batch.append(result)
+        if len(batch) >= max_results or time.monotonic() >= deadline:
+            return batch, False
+    return batch, True
+
+
+@app.get("/search/stream")
+async def search_stream(
+    request: Request,
+    q: str,
+    limit: int = 20,
+    offset: int = 0,
+    mode: SearchMode = SearchMode.EXACT,
+    budget_ms: int = Query(500, ge=1, le=10000),
+):
+    """
+    Stream search results as Server-Sent Events while documents are scanned.
+
+    Documents are scanned in the thread pool, so a slow regex or fuzzy scan
+    cannot stall the event loop; matches are sent in small batches as soon
+    as they are found. Scanning stops once `limit` results have been sent,
+    or as soon as the client disconnects, so abandoned type-ahead queries
+    do not keep scanning. A final 'done' event reports how many results
+    were sent.
+    """
+    from search_index import SearchTimeoutError
+    await _refresh_mapped_attachments()
+
+    async def event_generator():
+        sent = 0
+        skipped = 0
+        has_more = False
+        timed_out = False
+        deadline = None if mode == SearchMode.EXACT else time.monotonic() + budget_ms / 1000
+        results = core.iter_search(q, mode=mode, deadline=deadline, heartbeat=SEARCH_STREAM_HEARTBEAT_DOCS)
+        take = functools.partial(_next_search_results, results, SEARCH_STREAM_BATCH, SEARCH_STREAM_INTERVAL)
+        loop = asyncio.get_running_loop()
+        try:
+            try:
+                finished = False
+                while not finished and not has_more:
+                    # Batches end at least every SEARCH_STREAM_INTERVAL, matches or not,
+                    # so a dropped client stops the scan within about that long
+                    batch, finished = await loop.run_in_executor(None, take)
+                    if await request.is_disconnected():
+                        return
+                    for result in batch:
+                        if skipped < offset:
+                            skipped += 1
+                            continue
+                        if sent >= limit:
+                            has_more = True
+                            break
+                        result["type"] = result["type"].value
+                        yield f"data: {json.dumps({'type': 'result', 'item': result})}\n\n"
+                        sent += 1
+            except SearchTimeoutError:
+                timed_out = True
+            yield f"data: {json.dumps({'type': 'done', 'count': sent, 'has_more': has_more, 'timed_out': timed_out})}\n\n"
+        except Exception as e:
+            yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+        finally:
+            try:
+                results.close()
+            except ValueError:
+                pass  # Still scanning in the thread pool for a dropped client; the scan ends on its own
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        }
+    )
+
+
 # --------------------------------------------------------------------------- #
 # Tokens Endpoint
 # --------------------------------------------------------------------------- #
 
 @app.get("/tokens")
-async def get_tokens():
-    """Get token counts for prompt, attachments, and responses."""
-    from schemas import TokenCounts
+async def get_tokens(
+    wait: bool = False,
+    models: Optional[str] = Query(None, description="Comma-separated models, e.g. gpt-4,gpt-4o,claude-3"),
+    approximate: bool = False,
+):
+    """
+    Get token counts for prompt, attachments, and responses.
+
+    Totals are kept up to date by a background counter, so this returns
+    immediately; `pending` is the number of items not yet counted. Pass
+    wait=true to block until every item has been counted.
+
+    With models=..., also returns per-section counts for each listed model,
+    computed in parallel in the thread pool. approximate=true estimates very
+    large documents from sampled slices.
+    """
+    from schemas import TokensResponse
+    if wait:
+        trigger_token_count()
+        if _token_count_task is not None and _token_count_task.get_loop() is asyncio.get_running_loop():
+            await _token_count_task
+        if core.get_token_counts()["pending"]:
+            # No worker ran (or it failed) - count inline in the thread pool
+            loop = asyncio.get_event_loop()
+            items = core.pending_token_items()
+            core.apply_token_counts(items, await loop.run_in_executor(None, core.count_tokens_for, items))
     counts = core.get_token_counts()
-    return TokenCounts(**counts)
+    model_list = [m.strip() for m in (models or "").split(",") if m.strip()]
+    if model_list:
+        loop = asyncio.get_event_loop()
+        counts["models"] = await loop.run_in_executor(
+            None, functools.partial(core.get_token_matrix, model_list, approximate=approximate)
+        )
+    return TokensResponse(**counts)
 
 
 # --------------------------------------------------------------------------- #
 # Session and Autosave Endpoints
 # --------------------------------------------------------------------------- #
 
+def list_sessions(offset: int, limit: int, sort: str, descending: bool) -> tuple:
+    """
+    Page through saved sessions using the session index.
+    
+    The index is reconciled with the sessions directory first, so files added
+    or deleted outside the app are reflected; only those files are parsed.
+    
+    Args:
+        offset: Entries to skip
+        limit: Maximum entries to return
+        sort: Sort field from session_index.SORT_FIELDS
+        descending: Sort order
+        
+    Returns:
+        (total session count, page of entry dictionaries)
+    """
+    index = get_session_index()
+    index.sync()
+    return index.list(offset=offset, limit=limit, sort=sort, descending=descending)
+
+
+@app.get("/sessions")
+async def list_sessions_endpoint(
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    sort: str = Query("saved_at", description="Sort field: " + ", ".join(SESSION_SORT_FIELDS)),
+    order: str = Query("desc", description="Sort order: asc or desc"),
+):
+    """
+    List saved sessions with their metadata, paged and sorted.
+    
+    Entries come from a SQLite sidecar index maintained by /sessions/save,
+    so listing never opens session files that are already indexed.
+    """
+    from schemas import SessionListResponse
+    if sort not in SESSION_SORT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"Invalid sort field: {sort}")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail=f"Invalid sort order: {order}")
+    try:
+        loop = asyncio.get_running_loop()
+        total, entries = await loop.run_in_executor(
+            None, functools.partial(list_sessions, offset, limit, sort, order == "desc")
+        )
+    except sqlite3.Error as e:
+        raise HTTPException(status_code=500, detail=f"Session index error: {e}")
+    return SessionListResponse(total=total, limit=limit, offset=offset, sessions=entries)
+
+
+def search_sessions(q: str, limit: int, offset: int) -> tuple:
+    """
+    Full-text search across saved sessions using the session index.
+    
+    Args:
+        q: Search text
+        limit: Maximum results to return
+        offset: Results to skip
+        
+    Returns:
+        (total match count, page of result dictionaries)
+    """
+    index = get_session_index()
+    index.sync()
+    return index.search(q, limit=limit, offset=offset)
+
+
+@app.get("/sessions/search")
+async def search_sessions_endpoint(
+    q: str = Query(..., min_length=1, description="Search text; every word must match"),
+    limit: int = Query(20, ge=1, le=200),
+    offset: int = Query(0, ge=0),
+):
+    """
+    Search the prompts, attachments, and responses of every saved session.
+    
+    Unlike /search, which only sees the loaded session, this queries the
+    FTS5 index that /sessions/save keeps up to date. Each result names the
+    session file (loadable with /sessions/load) and the matching item.
+    """
+    from schemas import SessionSearchResponse
+    try:
+        loop = asyncio.get_running_loop()
+        total, results = await loop.run_in_executor(
+            None, functools.partial(search_sessions, q, limit, offset)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except sqlite3.Error as e:
+        raise HTTPException(status_code=500, detail=f"Session index error: {e}")
+    return SessionSearchResponse(query=q, total=total, limit=limit, offset=offset, results=results)
+
+
 @app.post("/sessions/save")
-async def save_session_endpoint(filename: Optional[str] = None):
+async def save_session_endpoint(
+    filename: Optional[str] = None,
+    fmt: str = Query(FORMAT_JSON, alias="format", description="Session file format: json or binary"),
+):
     """Save current session to file."""
-    session_data = core.to_dict()
+    if fmt not in SESSION_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported session format: {fmt}")
+    # JSON manifests save lazily loaded content that was never read by reference;
+    # binary files are self-contained. Mapped files are saved by content, not
+    # path, so the session does not change when the file does
+    build_session = core.snapshot_builder(keep_refs=(fmt == FORMAT_JSON), keep_mapped=False)
+    counts = core.get_token_counts()
+    total_tokens = counts["total_tokens"] if not counts["pending"] else None
+    
+    def save() -> Path:
+        # Deferred and mapped content is read here without being kept loaded
+        return save_session(build_session(), filename=filename, fmt=fmt, total_tokens=total_tokens)
+    
     try:
-        session_path = save_session(session_data, filename=filename)
+        # Serialization, blob writes, and compression run in the thread pool
+        loop = asyncio.get_running_loop()
+        session_path = await loop.run_in_executor(None, save)
         return {
             "status": "ok",
             "path": str(session_path),
@@ -1058,7 +2161,11 @@ async def load_session_endpoint(payload: dict):
     """
     Load session from file.
     
-    Expected payload: {"path": "path/to/session.json"}
+    Expected payload: {"path": "path/to/session.json", "lazy": true}
+    
+    With lazy (the default), attachment and response content stored in the
+    blob store is only read when preview, search, export, or token counting
+    needs it, so metadata endpoints answer immediately for large sessions.
     """
     session_path_str = payload.get("path")
     if not session_path_str:
@@ -1076,9 +2183,16 @@ async def load_session_endpoint(payload: dict):
     except (OSError, ValueError):
         raise HTTPException(status_code=400, detail="Invalid session path")
     
+    lazy = bool(payload.get("lazy", True))
     try:
-        session_data = load_session(session_path)
-        core.load_from_dict(session_data)
+        loop = asyncio.get_running_loop()
+        session_data = await loop.run_in_executor(
+            None, functools.partial(load_session, session_path, lazy=lazy)
+        )
+        content_loader = BlobStore(get_blobs_dir()).read_ref if lazy else None
+        core.load_from_dict(session_data, content_loader=content_loader)
+        trigger_token_count()
+        trigger_mapped_file_watch()
         return {"status": "ok"}
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Session file not found")
@@ -1090,33 +2204,59 @@ async def load_session_endpoint(payload: dict):
 async def get_autosave_status():
     """Get autosave file status."""
     autosave_path = get_autosave_path()
-    old_autosave_path = autosave_path.parent / "autosave.old.json"
     
     has_autosave = autosave_path.exists()
-    has_old_autosave = old_autosave_path.exists()
+    generations = list_generations(get_generations_dir(autosave_path))
     
     size = 0
+    snapshot_mtime = float("inf")
     if has_autosave:
-        size = autosave_path.stat().st_size
+        st = autosave_path.stat()
+        size, snapshot_mtime = st.st_size, st.st_mtime
+    
+    # A generation is queued right after its snapshot is written, so the ones
+    # created since the current snapshot hold nothing older than it
+    has_old_autosave = (
+        any(gen["created"] < snapshot_mtime for gen in generations)
+        or (autosave_path.parent / "autosave.old.json").exists()
+    )
+    
+    journal_path = get_journal_path(autosave_path)
+    journal_size = journal_path.stat().st_size if journal_path.exists() else 0
     
     return {
         "has_autosave": has_autosave,
         "has_old_autosave": has_old_autosave,
         "size": size,
         "path": str(autosave_path) if has_autosave else None,
+        "journal_size": journal_size,
+        "journal_ops": _autosave_journal.ops,
+        "scheduler": _autosave_scheduler.metrics(),
+        "generations": generations,
+        "generation_writer": _generation_writer.metrics(),
     }
 
 
 @app.post("/autosave/recover")
-async def recover_autosave():
-    """Recover session from autosave file."""
-    session_data = read_autosave()
+async def recover_autosave(
+    generation: Optional[str] = Query(None, description="Generation ID from /autosave/status (default: latest)"),
+):
+    """Recover session from autosave file, or from an older autosave generation."""
+    try:
+        loop = asyncio.get_running_loop()
+        session_data = await loop.run_in_executor(None, read_autosave, generation)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Autosave generation '{generation}' not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     if session_data is None:
         raise HTTPException(status_code=404, detail="No autosave file found")
     
     try:
         core.load_from_dict(session_data)
+        trigger_token_count()
+        trigger_mapped_file_watch()
         return {"status": "ok", "recovered": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to recover autosave: {str(e)}")
@@ -1186,7 +2326,7 @@ async def enqueue_batch(payload: dict):
         )
     
     jobs = core.enqueue_batch(prompt, models)
-    trigger_autosave()
+    trigger_autosave("batch_jobs")
     
     from schemas import BatchJobStatus
     return {
@@ -1243,7 +2383,7 @@ async def cancel_batch_job(job_id: str):
     
     job.status = BatchJobStatus.CANCELLED
     job.error = "Cancelled by user"
-    trigger_autosave()
+    trigger_autosave("batch_jobs")
     
     return {
         "id": job.id,
@@ -1656,11 +2796,8 @@ async def scan_for_git_repos(payload: dict):
         raise HTTPException(status_code=400, detail="Root path is not a directory")
 
     # Directories to skip during scan
-    skip_dirs = {
-        "node_modules", ".git", "__pycache__", "venv", ".venv",
-        "env", ".env", "dist", "build", ".next", "target",
-        "vendor", "packages", ".cargo", ".rustup"
-    }
+    from folder_import import SKIP_DIRS
+    skip_dirs = SKIP_DIRS | {"vendor", "packages"}
 
     repos = []
 
@@ -1736,33 +2873,27 @@ async def get_config_endpoint():
 async def add_favorite(payload: FavoriteEntry):
     """Add a new favorite folder to config.json."""
     
-    config = load_config()
-    favorites = config.get("favorites", [])
-    
-    # Check for duplicates (same path)
-    for fav in favorites:
-        if fav.get("path") == payload.path:
-            raise HTTPException(
-                status_code=409,
-                detail=f"Favorite with path '{payload.path}' already exists"
-            )
-    
-    # Add new favorite
-    favorites.append({
-        "label": payload.label,
-        "path": payload.path
-    })
-    config["favorites"] = favorites
+    def add(config: dict) -> None:
+        favorites = config.get("favorites", [])
+        
+        # Check for duplicates (same path)
+        for fav in favorites:
+            if fav.get("path") == payload.path:
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"Favorite with path '{payload.path}' already exists"
+                )
+        
+        # Add new favorite
+        favorites.append({
+            "label": payload.label,
+            "path": payload.path
+        })
+        config["favorites"] = favorites
     
     # Save config (atomic write)
-    config_path = get_config_path()
     try:
-        import tempfile
-        import shutil
-        temp_path = config_path.with_suffix(".tmp")
-        with open(temp_path, "w", encoding="utf-8") as f:
-            json.dump(config, f, indent=2, ensure_ascii=False)
-        shutil.move(str(temp_path), str(config_path))
+        update_config(add)
     except (IOError, OSError) as e:
         raise HTTPException(
             status_code=500,
@@ -1775,28 +2906,22 @@ async def add_favorite(payload: FavoriteEntry):
 @app.delete("/favorites/{index}")
 async def remove_favorite(index: int):
     """Remove a favorite folder by index from config.json."""
-    config = load_config()
-    favorites = config.get("favorites", [])
-    
-    if index < 0 or index >= len(favorites):
-        raise HTTPException(
-            status_code=404,
-            detail=f"Favorite at index {index} not found"
-        )
-    
-    # Remove favorite at index
-    favorites.pop(index)
-    config["favorites"] = favorites
+    def remove(config: dict) -> None:
+        favorites = config.get("favorites", [])
+        
+        if index < 0 or index >= len(favorites):
+            raise HTTPException(
+                status_code=404,
+                detail=f"Favorite at index {index} not found"
+            )
+        
+        # Remove favorite at index
+        favorites.pop(index)
+        config["favorites"] = favorites
     
     # Save config (atomic write)
-    config_path = get_config_path()
     try:
-        import tempfile
-        import shutil
-        temp_path = config_path.with_suffix(".tmp")
-        with open(temp_path, "w", encoding="utf-8") as f:
-            json.dump(config, f, indent=2, ensure_ascii=False)
-        shutil.move(str(temp_path), str(config_path))
+        update_config(remove)
     except (IOError, OSError) as e:
         raise HTTPException(
             status_code=500,
@@ -1996,17 +3121,9 @@ async def save_macro(payload: MacroSavePayload):
     macros_dir = get_macros_dir()
     macro_path = macros_dir / filename
     
-    # Atomic write: write to temp file first, then move
+    # Atomic write: write to temp file first, then replace
     try:
-        import tempfile
-        import shutil
-        temp_path = macro_path.with_suffix(".tmp")
-        
-        with open(temp_path, "w", encoding="utf-8") as f:
-            json.dump(macro_data, f, indent=2, ensure_ascii=False)
-        
-        # Atomic move
-        shutil.move(str(temp_path), str(macro_path))
+        atomic_write_json(macro_path, macro_data)
     except (IOError, OSError) as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
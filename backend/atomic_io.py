@@ -0,0 +1,192 @@
+"""
+Crash-safe file writes shared by every module that persists state.
+
+Files are written to a temporary file in the target's directory, flushed,
+optionally fsynced, and moved over the target with os.replace(). A process
+crash leaves either the old file or the new one, never a torn mix; whether
+that also holds across a power loss or OS crash depends on the fsync policy:
+
+- "always":  fsync every write, and the directory after the rename; the
+             old-or-new guarantee holds across power loss
+- "batched": fsync at most once per FSYNC_BATCH_INTERVAL seconds, trading
+             durability for throughput: a write that skipped its fsync was
+             renamed before its data reached the disk, so after a power
+             loss the target can be the old version, empty, or partially
+             written
+- "never":   leave flushing to the OS (fastest; the same risk as a skipped
+             batched fsync on every write)
+
+The policy defaults to the SCRIPTBOARD_FSYNC environment variable ("always"
+if unset) and can be changed at runtime with set_fsync_policy() (the
+"fsync_policy" key in config.json is applied at startup).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import stat
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Optional, Union
+
+FSYNC_ALWAYS = "always"
+FSYNC_BATCHED = "batched"
+FSYNC_NEVER = "never"
+FSYNC_POLICIES = (FSYNC_ALWAYS, FSYNC_BATCHED, FSYNC_NEVER)
+
+# Minimum seconds between fsyncs under the "batched" policy
+FSYNC_BATCH_INTERVAL = 2.0
+
+_policy = os.environ.get("SCRIPTBOARD_FSYNC", FSYNC_ALWAYS)
+if _policy not in FSYNC_POLICIES:
+    _policy = FSYNC_ALWAYS
+_last_fsync = float("-inf")  # The first batched write always fsyncs
+_fsync_lock = threading.Lock()
+
+PathLike = Union[str, Path]
+
+# Process umask, read once at import (reading it means setting it); new files
+# get 0666 & ~umask, as open() would give them
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def get_fsync_policy() -> str:
+    """Get the current fsync policy."""
+    return _policy
+
+
+def set_fsync_policy(policy: str) -> None:
+    """
+    Set the fsync policy used by writes that do not pass one explicitly.
+
+    Args:
+        policy: One of FSYNC_POLICIES
+
+    Raises:
+        ValueError: If policy is not a known policy
+    """
+    global _policy
+    if policy not in FSYNC_POLICIES:
+        raise ValueError(f"Unknown fsync policy: {policy} (expected one of {', '.join(FSYNC_POLICIES)})")
+    _policy = policy
+
+
+def _should_fsync(policy: Optional[str]) -> bool:
+    global _last_fsync
+    policy = policy or _policy
+    if policy == FSYNC_ALWAYS:
+        return True
+    if policy == FSYNC_NEVER:
+        return False
+    with _fsync_lock:
+        now = time.monotonic()
+        if now - _last_fsync < FSYNC_BATCH_INTERVAL:
+            return False
+        _last_fsync = now
+        return True
+
+
+def _fsync_dir(directory: PathLike) -> None:
+    """Persist a rename by fsyncing its directory (not supported on Windows)."""
+    if os.name == "nt":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def sync_file(f, policy: Optional[str] = None) -> bool:
+    """
+    Flush an open file and fsync it if the policy says so (e.g. after appending).
+
+    Args:
+        f: File object opened for writing
+        policy: fsync policy for this write (default: the current policy)
+
+    Returns:
+        True if the file was fsynced
+    """
+    f.flush()
+    if not _should_fsync(policy):
+        return False
+    os.fsync(f.fileno())
+    return True
+
+
+def _target_mode(path: Path) -> int:
+    """Get the permission bits a replacement of path should have."""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+
+def atomic_write(path: PathLike, write: Callable[[BinaryIO], Any], fsync: Optional[str] = None) -> None:
+    """
+    Atomically replace a file with content produced by a writer callback.
+
+    The file keeps its permission bits (mkstemp creates 0600 temporary
+    files); a new file gets the usual 0666 & ~umask.
+
+    Args:
+        path: Target file
+        write: Called with the temporary file opened in binary mode
+        fsync: fsync policy for this write (default: the current policy)
+
+    Raises:
+        OSError: If the file cannot be written; the target is left unchanged
+    """
+    path = Path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+            synced = sync_file(f, fsync)
+        os.chmod(tmp_path, _target_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    if synced:
+        _fsync_dir(path.parent)
+
+
+def atomic_write_bytes(path: PathLike, data: bytes, fsync: Optional[str] = None) -> int:
+    """
+    Atomically replace a file with bytes.
+
+    Args:
+        path: Target file
+        data: File content
+        fsync: fsync policy for this write (default: the current policy)
+
+    Returns:
+        Bytes written
+    """
+    atomic_write(path, lambda f: f.write(data), fsync)
+    return len(data)
+
+
+def atomic_write_json(path: PathLike, obj: Any, indent: Optional[int] = 2, fsync: Optional[str] = None) -> int:
+    """
+    Atomically replace a file with pretty-printed UTF-8 JSON.
+
+    Args:
+        path: Target file
+        obj: JSON-serializable object
+        indent: JSON indentation (None for compact)
+        fsync: fsync policy for this write (default: the current policy)
+
+    Returns:
+        Bytes written
+    """
+    data = json.dumps(obj, indent=indent, ensure_ascii=False).encode("utf-8")
+    return atomic_write_bytes(path, data, fsync)
+
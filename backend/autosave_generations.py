@@ -0,0 +1,189 @@
+"""
+Ring of compressed autosave generations for point-in-time recovery.
+
+Every autosave snapshot is also kept as a compressed generation under
+~/.scriptboard/autosave_generations, newest AUTOSAVE_GENERATIONS kept.
+Compression and writing happen on a background thread fed by a bounded
+queue, so an autosave only pays for writing the live snapshot; if the
+writer falls behind, new generations are dropped (and counted) rather
+than stalling autosave.
+
+Generation files are named <UTC timestamp>-<sequence>.json<codec suffix>,
+so names sort chronologically and double as generation IDs.
+"""
+
+from __future__ import annotations
+
+import os
+import queue
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from atomic_io import atomic_write_bytes
+from blob_store import compress_bytes, decompress_bytes
+
+GENERATIONS_DIRNAME = "autosave_generations"
+
+# Generations kept in the ring
+AUTOSAVE_GENERATIONS = 5
+
+# Snapshots waiting for the background writer before new ones are dropped
+GENERATION_QUEUE_DEPTH = 2
+
+_GENERATION_NAME = re.compile(r"^(?P<id>\d{8}T\d{6}\d{6}Z-\d+)\.json(?P<suffix>\.zst|\.gz)?$")
+
+
+def get_generations_dir(autosave_path: Path) -> Path:
+    """Get the generations directory next to an autosave snapshot."""
+    return autosave_path.parent / GENERATIONS_DIRNAME
+
+
+def list_generations(directory: Path) -> List[Dict]:
+    """
+    List stored generations, newest first.
+
+    Args:
+        directory: Generations directory
+
+    Returns:
+        One dictionary per generation with id, path, size, codec, and
+        created (Unix time)
+    """
+    if not directory.is_dir():
+        return []
+    generations = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            match = _GENERATION_NAME.match(entry.name)
+            if not match or not entry.is_file():
+                continue
+            created = datetime.strptime(match["id"].split("-")[0], "%Y%m%dT%H%M%S%fZ")
+            generations.append({
+                "id": match["id"],
+                "path": entry.path,
+                "size": entry.stat().st_size,
+                "codec": (match["suffix"] or "").lstrip(".") or "none",
+                "created": created.replace(tzinfo=timezone.utc).timestamp(),
+            })
+    generations.sort(key=lambda gen: gen["id"], reverse=True)
+    return generations
+
+
+def read_generation(directory: Path, generation_id: str) -> bytes:
+    """
+    Read and decompress a generation.
+
+    Args:
+        directory: Generations directory
+        generation_id: ID from list_generations()
+
+    Returns:
+        The snapshot bytes as written by write_autosave()
+
+    Raises:
+        FileNotFoundError: If no generation has this ID
+    """
+    for gen in list_generations(directory):
+        if gen["id"] == generation_id:
+            path = Path(gen["path"])
+            suffix = path.suffix if path.suffix in (".zst", ".gz") else ""
+            return decompress_bytes(path.read_bytes(), suffix)
+    raise FileNotFoundError(f"Autosave generation not found: {generation_id}")
+
+
+class GenerationWriter:
+    """
+    Background thread compressing snapshots into the generation ring.
+
+    The thread starts on the first submit() and runs as a daemon.
+    """
+
+    def __init__(self, keep: int = AUTOSAVE_GENERATIONS, queue_depth: int = GENERATION_QUEUE_DEPTH) -> None:
+        self.keep = keep
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_depth)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._sequence = 0
+        self.written = 0
+        self.dropped = 0
+        self.failures = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def submit(self, directory: Path, payload: bytes) -> bool:
+        """
+        Queue a snapshot to be stored as a new generation.
+
+        Args:
+            directory: Generations directory
+            payload: Snapshot bytes
+
+        Returns:
+            False if the queue was full and the snapshot was dropped
+        """
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="autosave-generations", daemon=True)
+                self._thread.start()
+            self._sequence += 1
+            sequence = self._sequence
+        created = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+        try:
+            self._queue.put_nowait((directory, f"{created}-{sequence}", payload))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until every queued snapshot has been written.
+
+        Args:
+            timeout: Maximum seconds to wait (None waits indefinitely)
+
+        Returns:
+            True if the queue drained in time
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _run(self) -> None:
+        while True:
+            directory, generation_id, payload = self._queue.get()
+            try:
+                self._write(directory, generation_id, payload)
+            except Exception:
+                self.failures += 1  # A lost generation must not stop the writer
+            finally:
+                self._queue.task_done()
+
+    def _write(self, directory: Path, generation_id: str, payload: bytes) -> None:
+        data, suffix = compress_bytes(payload)
+        directory.mkdir(parents=True, exist_ok=True)
+        atomic_write_bytes(directory / f"{generation_id}.json{suffix}", data)
+        self.written += 1
+        self.bytes_in += len(payload)
+        self.bytes_out += len(data)
+        for old in list_generations(directory)[self.keep:]:
+            os.unlink(old["path"])
+
+    def metrics(self) -> Dict:
+        """Get writer counters (generations written/dropped, bytes before and after compression)."""
+        return {
+            "keep": self.keep,
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "failures": self.failures,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+        }
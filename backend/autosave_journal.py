@@ -0,0 +1,223 @@
+"""
+Append-only operation journal for session autosave.
+
+A full snapshot of the session (autosave.json) is only written on compaction.
+Between compactions each autosave appends the operations recorded by
+ScriptboardCore since the previous autosave to autosave.journal.jsonl, so the
+cost of an autosave scales with the size of the change rather than the size
+of the session.
+
+The first journal line names the snapshot it extends. Recovery loads the
+snapshot and replays the journal only if it belongs to that snapshot, so a
+crash between writing a new snapshot and resetting the journal never applies
+operations twice. A torn last line (crash mid-append) is ignored.
+"""
+
+from __future__ import annotations
+
+import threading
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from atomic_io import atomic_write_bytes, sync_file
+from blob_store import BlobStore, externalize_item
+from session_format import json_dumps, json_loads
+
+# Key in the snapshot JSON holding the snapshot ID
+SNAPSHOT_ID_KEY = "autosave_id"
+
+JOURNAL_FILENAME = "autosave.journal.jsonl"
+
+# Compact (write a fresh snapshot) once the journal grows past either limit
+COMPACT_AFTER_OPS = 500
+COMPACT_AFTER_BYTES = 4 * 1024 * 1024
+
+
+def get_journal_path(autosave_path: Path) -> Path:
+    """Get path to the journal next to an autosave snapshot."""
+    return autosave_path.parent / JOURNAL_FILENAME
+
+
+def new_snapshot_id() -> str:
+    """Generate an ID tying a snapshot to its journal."""
+    return uuid.uuid4().hex
+
+
+def apply_op(session_data: Dict, op: Dict) -> None:
+    """
+    Apply one journal operation to a session dictionary in place.
+
+    Args:
+        session_data: Session dictionary in ScriptboardCore.to_dict() format
+        op: Operation recorded by ScriptboardCore (unknown operations are skipped)
+    """
+    kind = op.get("op")
+    if kind == "set_prompt":
+        session_data["prompt"] = op.get("text", "")
+        session_data["prompt_source"] = op.get("source")
+    elif kind == "clear_prompt":
+        session_data["prompt"] = ""
+        session_data["prompt_source"] = None
+    elif kind == "add_attachment":
+        session_data.setdefault("attachments", []).append(op["attachment"])
+    elif kind == "update_attachment":
+        updated = op["attachment"]
+        session_data["attachments"] = [
+            updated if att.get("id") == updated["id"] else att
+            for att in session_data.get("attachments", [])
+        ]
+    elif kind == "remove_attachments":
+        ids = set(op.get("ids", []))
+        session_data["attachments"] = [att for att in session_data.get("attachments", []) if att.get("id") not in ids]
+    elif kind == "clear_attachments":
+        session_data["attachments"] = []
+        session_data["folder_sources"] = {}
+    elif kind == "update_folder_source":
+        sources = session_data.setdefault("folder_sources", {})
+        files = dict(sources.get(op["root"], {}).get("files", {}))
+        for rel_path in op.get("removed", []):
+            files.pop(rel_path, None)
+        files.update(op.get("files", {}))
+        sources[op["root"]] = {"options": op.get("options", {}), "files": files}
+    elif kind == "add_response":
+        session_data.setdefault("responses", []).append(op["response"])
+    elif kind == "clear_responses":
+        session_data["responses"] = []
+    elif kind == "set_meta":
+        session_data.update(op.get("fields", {}))
+
+
+def externalize_op(op: Dict, store: BlobStore) -> Dict:
+    """
+    Move an operation's attachment or response content into the blob store.
+
+    Args:
+        op: Operation recorded by ScriptboardCore
+        store: Blob store receiving the content
+
+    Returns:
+        Operation referencing its content by hash (other operations unchanged)
+    """
+    if op.get("op") in ("add_attachment", "update_attachment"):
+        return {**op, "attachment": externalize_item(op["attachment"], store)}
+    if op.get("op") == "add_response":
+        return {**op, "response": externalize_item(op["response"], store)}
+    return op
+
+
+def read_journal(path: Path, snapshot_id: str) -> List[Dict]:
+    """
+    Read the operations journaled on top of a snapshot.
+
+    Args:
+        path: Journal file path
+        snapshot_id: ID of the snapshot being recovered
+
+    Returns:
+        Operations in order, or an empty list if the journal is missing or
+        belongs to a different snapshot
+    """
+    ops = []
+    try:
+        with open(path, "rb") as f:
+            try:
+                header = json_loads(f.readline())
+            except ValueError:
+                return []
+            if not isinstance(header, dict) or header.get("snapshot") != snapshot_id:
+                return []
+            for line in f:
+                try:
+                    ops.append(json_loads(line))
+                except ValueError:
+                    break  # Torn write from a crash mid-append
+    except (FileNotFoundError, IOError):
+        return []
+    return ops
+
+
+def replay_journal(session_data: Dict, path: Path) -> Dict:
+    """
+    Bring a loaded snapshot up to date with its journal.
+
+    Args:
+        session_data: Snapshot dictionary (its SNAPSHOT_ID_KEY is removed)
+        path: Journal file path
+
+    Returns:
+        The updated session dictionary
+    """
+    snapshot_id = session_data.pop(SNAPSHOT_ID_KEY, None)
+    if snapshot_id is None:
+        return session_data
+    for op in read_journal(path, snapshot_id):
+        apply_op(session_data, op)
+    return session_data
+
+
+class AutosaveJournal:
+    """
+    Tracks the snapshot the on-disk journal extends and when to compact it.
+
+    Writes run on the thread pool; the lock keeps a compaction and an append
+    from interleaving if two autosaves overlap.
+    """
+
+    def __init__(
+        self,
+        compact_after_ops: int = COMPACT_AFTER_OPS,
+        compact_after_bytes: int = COMPACT_AFTER_BYTES,
+    ) -> None:
+        self.compact_after_ops = compact_after_ops
+        self.compact_after_bytes = compact_after_bytes
+        self.lock = threading.Lock()
+        self.snapshot_id: Optional[str] = None
+        self.ops = 0
+        self.bytes = 0
+        self.meta: Optional[Dict] = None  # Session metadata as of the last write
+
+    def needs_compaction(self) -> bool:
+        """Check whether the next autosave should write a full snapshot."""
+        return (
+            self.snapshot_id is None
+            or self.ops >= self.compact_after_ops
+            or self.bytes >= self.compact_after_bytes
+        )
+
+    def start(self, path: Path, snapshot_id: str, meta: Optional[Dict] = None) -> None:
+        """
+        Begin a new, empty journal on top of a freshly written snapshot.
+
+        Args:
+            path: Journal file path
+            snapshot_id: ID stored in the snapshot
+            meta: Session metadata contained in the snapshot
+        """
+        header = json_dumps({"snapshot": snapshot_id}) + b"\n"
+        atomic_write_bytes(path, header)
+        self.snapshot_id = snapshot_id
+        self.ops = 0
+        self.bytes = len(header)
+        self.meta = meta
+
+    def append(self, path: Path, ops: List[Dict], meta: Optional[Dict] = None) -> None:
+        """
+        Append operations to the journal.
+
+        Args:
+            path: Journal file path
+            ops: Operations recorded since the last autosave
+            meta: Session metadata after these operations
+        """
+        payload = b"".join(json_dumps(op) + b"\n" for op in ops)
+        with open(path, "ab") as f:
+            f.write(payload)
+            sync_file(f)
+        self.ops += len(ops)
+        self.bytes += len(payload)
+        self.meta = meta
+
+    def invalidate(self) -> None:
+        """Force the next autosave to write a full snapshot (e.g. after a failed write)."""
+        self.snapshot_id = None
@@ -0,0 +1,169 @@
+"""
+Debounced, coalescing autosave scheduler.
+
+Mutations mark the session dirty instead of (re)starting a save. One worker
+task per event loop waits until edits pause for `debounce` seconds, but
+never longer than `max_wait` seconds after the first unsaved edit, so a
+steady stream of edits (bulk attachment posts, folder imports) still gets
+saved regularly instead of being postponed indefinitely. Edits made while
+a save is running are picked up by the next one.
+
+Saves never overlap: the worker and flush() take the same lock, so a flush
+on shutdown waits for a save already in flight and then writes the edits
+made since, rather than racing it.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, FrozenSet, Optional, Set
+
+# Seconds without edits before saving
+AUTOSAVE_DEBOUNCE = 1.0
+
+# Maximum seconds an edit stays unsaved while edits keep arriving
+AUTOSAVE_MAX_WAIT = 5.0
+
+# Save callback: receives the dirty sections, returns bytes written or None
+# if there was nothing to write
+SaveCallback = Callable[[FrozenSet[str]], Awaitable[Optional[int]]]
+
+
+class AutosaveScheduler:
+    """
+    Coalesces autosave requests and runs the save callback on a schedule.
+
+    Metrics are kept for /autosave/status: saves, bytes written, skipped
+    saves (nothing had changed), coalesced requests, and failures.
+    """
+
+    def __init__(
+        self,
+        save: SaveCallback,
+        debounce: float = AUTOSAVE_DEBOUNCE,
+        max_wait: float = AUTOSAVE_MAX_WAIT,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._save = save
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self._clock = clock
+        self._dirty: Set[str] = set()
+        self._first_dirty = 0.0
+        self._last_change = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self.saves = 0
+        self.saves_skipped = 0
+        self.coalesced = 0
+        self.failures = 0
+        self.bytes_written = 0
+        self.last_bytes = 0
+        self.last_save_time: Optional[float] = None  # Unix time
+        self.last_duration = 0.0
+        self.last_sections: FrozenSet[str] = frozenset()
+        self.last_error: Optional[str] = None
+
+    def mark_dirty(self, section: str = "session") -> None:
+        """
+        Record an edit and make sure a save is scheduled.
+
+        Without a running event loop the edit stays recorded and is saved
+        after the next mark_dirty() made from inside one.
+
+        Args:
+            section: Changed part of the session (e.g. "prompt", "attachments")
+        """
+        now = self._clock()
+        if self._dirty:
+            self.coalesced += 1
+        else:
+            self._first_dirty = now
+        self._dirty.add(section)
+        self._last_change = now
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self._run())
+
+    def _deadline(self) -> float:
+        return min(self._last_change + self.debounce, self._first_dirty + self.max_wait)
+
+    async def _run(self) -> None:
+        """Worker: sleep until the deadline, save, repeat while edits remain."""
+        while self._dirty:
+            delay = self._deadline() - self._clock()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue  # New edits may have moved the deadline
+            await self._save_now()
+
+    def _save_lock(self) -> asyncio.Lock:
+        """Get the lock serializing saves on the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            self._lock, self._lock_loop = asyncio.Lock(), loop
+        return self._lock
+
+    async def _save_now(self) -> None:
+        async with self._save_lock():
+            # Another save may have taken the edits while this one waited
+            if self._dirty:
+                await self._save_dirty()
+
+    async def _save_dirty(self) -> None:
+        sections = frozenset(self._dirty)
+        self._dirty.clear()
+        start = self._clock()
+        try:
+            written = await self._save(sections)
+        except Exception as e:
+            # Autosave failures must not break the user's workflow; the next
+            # edit schedules another attempt
+            self.failures += 1
+            self.last_error = str(e)
+            return
+        if written is None:
+            self.saves_skipped += 1
+            return
+        self.saves += 1
+        self.bytes_written += written
+        self.last_bytes = written
+        self.last_save_time = time.time()
+        self.last_duration = self._clock() - start
+        self.last_sections = sections
+        self.last_error = None
+
+    async def flush(self) -> None:
+        """Save pending edits immediately (e.g. on shutdown), after any save in flight."""
+        await self._save_now()
+
+    def metrics(self) -> Dict:
+        """
+        Get scheduler state and counters.
+
+        Returns:
+            Dictionary of pending state, save counters, and last-save details
+        """
+        return {
+            "pending": bool(self._dirty),
+            "pending_sections": sorted(self._dirty),
+            "debounce_s": self.debounce,
+            "max_wait_s": self.max_wait,
+            "saves": self.saves,
+            "saves_skipped": self.saves_skipped,
+            "coalesced": self.coalesced,
+            "failures": self.failures,
+            "bytes_written": self.bytes_written,
+            "last_bytes": self.last_bytes,
+            "last_save_time": self.last_save_time,
+            "last_duration_ms": round(self.last_duration * 1000, 3),
+            "last_sections": sorted(self.last_sections),
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,89 @@
+"""
+Benchmark per-attachment memory and repeated autosave snapshot cost.
+
+Builds N attachments (file names and content are allocated up front and
+shared, so only the per-item overhead is measured) and compares:
+
+- legacy: the attachment layout before slots (a __dict__ per instance and
+          "att_<uuid4 hex>" IDs)
+- slots:  core.Attachment (slotted, counter IDs)
+
+then snapshots a session of N small files into a temporary blob store
+twice, the way autosave compaction does: the first snapshot stores every
+content, the second reuses the references cached on the items.
+
+Usage:
+    python bench_attachment_memory.py            # 50k attachments
+    python bench_attachment_memory.py 10000      # custom count
+"""
+
+from __future__ import annotations
+
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from dataclasses import dataclass, field
+from typing import Callable, List
+
+from blob_store import BlobStore
+from core import Attachment, ScriptboardCore
+
+DEFAULT_COUNT = 50_000
+
+_SAMPLE = "def handler(event):\n    return {'ok': True}\n"
+
+
+@dataclass
+class LegacyAttachment:
+    """The attachment layout before slots: a __dict__ per instance and uuid4 hex IDs."""
+    id: str = field(default_factory=lambda: f"att_{uuid.uuid4().hex}")
+    filename: str = ""
+    content: str = ""
+    binary: bool = False
+
+
+def measure(factory: Callable[[str, str], object], names: List[str], content: str) -> float:
+    """Return the bytes allocated per item when building one item per name."""
+    tracemalloc.start()
+    items = [factory(name, content) for name in names]
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(items) == len(names)
+    return allocated / len(names)
+
+
+def time_snapshots(count: int) -> List[float]:
+    """Time two consecutive blob-backed snapshots of a session with count files."""
+    core = ScriptboardCore()
+    for i in range(count):
+        core.add_attachment_from_text(f"# file {i}\n{_SAMPLE}", suggested_name=f"src/file_{i}.py")
+    timings = []
+    with tempfile.TemporaryDirectory() as tmp:
+        saver = BlobStore(tmp).write_ref
+        for _ in range(2):
+            start = time.perf_counter()
+            core.snapshot_builder(keep_refs=True, content_saver=saver)()
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run(count: int) -> None:
+    """Print per-attachment overhead for each layout and snapshot timings."""
+    names = [f"src/module_{i}.py" for i in range(count)]
+    content = _SAMPLE * 4
+    legacy = measure(lambda name, text: LegacyAttachment(filename=name, content=text), names, content)
+    slotted = measure(lambda name, text: Attachment(filename=name, content=text), names, content)
+    print(f"{'layout':<8} {'bytes/item':>10} {'MB total':>9}")
+    for label, per_item in (("legacy", legacy), ("slots", slotted)):
+        print(f"{label:<8} {per_item:>10.0f} {per_item * count / (1024 * 1024):>9.1f}")
+    print(f"saved    {legacy - slotted:>10.0f} ({(1 - slotted / legacy) * 100:.0f}%)")
+
+    first, second = time_snapshots(count)
+    print(f"snapshot (store content)   {first * 1000:>8.0f} ms")
+    print(f"snapshot (cached refs)     {second * 1000:>8.0f} ms")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_COUNT)
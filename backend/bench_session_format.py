@@ -0,0 +1,122 @@
+"""
+Benchmark session save/load throughput for each on-disk encoding.
+
+Builds synthetic sessions of the requested sizes and compares, for each
+codec, file size, save and load throughput, and the peak memory allocated
+while loading (traced with tracemalloc, so it excludes the session being
+compared against):
+
+- json-indent: stdlib json with indent=2 (the original session format)
+- json-fast:   session_format.json_dumps/json_loads (orjson when installed)
+- binary:      session_format length-prefixed binary format
+
+The 500 MB case needs roughly 4 GB of RAM; --quick skips it.
+
+Usage:
+    python bench_session_format.py            # 10, 100 and 500 MB
+    python bench_session_format.py --quick    # 10 and 100 MB
+    python bench_session_format.py 1 10       # custom sizes in MB
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+from core import ScriptboardCore
+from session_format import FORMAT_BINARY, FORMAT_JSON, dump_session, loads_session
+
+DEFAULT_SIZES_MB = (10, 100, 500)
+QUICK_SIZES_MB = (10, 100)
+
+# Size of each synthetic attachment
+ATTACHMENT_CHARS = 256 * 1024
+
+_SAMPLE = 'def handler(event):\n    """Handle "event" — ünïcode too."""\n    return {"ok": True}\n'
+
+
+def build_session(size_mb: int) -> Dict:
+    """Build a session dictionary with roughly size_mb MB of attachment content."""
+    core = ScriptboardCore()
+    core.set_prompt("Review these files.")
+    text = (_SAMPLE * (ATTACHMENT_CHARS // len(_SAMPLE) + 1))[:ATTACHMENT_CHARS]
+    for i in range(max(1, size_mb * 1024 * 1024 // ATTACHMENT_CHARS)):
+        core.add_attachment_from_text(f"# file {i}\n" + text, suggested_name=f"file_{i}.py")
+    core.add_response("Looks good.", source="bench")
+    return core.to_dict()
+
+
+def _save_json_indent(session_data: Dict, path: Path) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(session_data, f, indent=2, ensure_ascii=False)
+
+
+def _load_json_indent(path: Path) -> Dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _saver(fmt: str) -> Callable[[Dict, Path], None]:
+    def save(session_data: Dict, path: Path) -> None:
+        with open(path, "wb") as f:
+            dump_session(session_data, f, fmt)
+    return save
+
+
+def _load(path: Path) -> Dict:
+    return loads_session(path.read_bytes())
+
+
+CODECS: List[Tuple[str, Callable[[Dict, Path], None], Callable[[Path], Dict]]] = [
+    ("json-indent", _save_json_indent, _load_json_indent),
+    ("json-fast", _saver(FORMAT_JSON), _load),
+    ("binary", _saver(FORMAT_BINARY), _load),
+]
+
+
+def run(sizes_mb) -> None:
+    """Print save/load throughput and load memory for each codec and session size."""
+    print(f"{'size':>8} {'codec':<12} {'file MB':>8} {'save MB/s':>10} {'load MB/s':>10} {'load peak MB':>13}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size_mb in sizes_mb:
+            session_data = build_session(size_mb)
+            for name, save, load in CODECS:
+                path = Path(tmp) / f"session_{name}"
+                start = time.perf_counter()
+                save(session_data, path)
+                save_time = time.perf_counter() - start
+
+                start = time.perf_counter()
+                loaded = load(path)
+                load_time = time.perf_counter() - start
+                assert loaded == session_data
+                del loaded
+
+                # Traced separately: tracing slows allocation-heavy decoders
+                tracemalloc.start()
+                loaded = load(path)
+                _, load_peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                del loaded
+
+                file_mb = path.stat().st_size / (1024 * 1024)
+                print(
+                    f"{size_mb:>6}MB {name:<12} {file_mb:>8.1f} "
+                    f"{file_mb / save_time:>10.0f} {file_mb / load_time:>10.0f} "
+                    f"{load_peak / (1024 * 1024):>13.0f}"
+                )
+                path.unlink()
+            del session_data
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args == ["--quick"]:
+        run(QUICK_SIZES_MB)
+    else:
+        run([int(arg) for arg in args] or DEFAULT_SIZES_MB)
@@ -0,0 +1,399 @@
+"""
+Content-addressed blob store for saved session content.
+
+Attachment and response content is stored once under ~/.scriptboard/blobs,
+keyed by the SHA-256 of its UTF-8 bytes, and saved sessions reference it by
+hash. Saving a session therefore writes only blobs that are not stored yet
+plus a small manifest, and sessions that share imported files share blobs.
+
+Blobs are compressed with zstd when the optional `zstandard` package is
+installed, otherwise with gzip. The codec is recorded in the file suffix, so
+stores written with either codec stay readable.
+
+Blobs are shared, so saving never deletes any. collect_garbage() deletes
+the ones nothing references any more (mark and sweep): the caller collects
+the references held by saved sessions and the autosave state (iter_refs;
+see api.iter_saved_refs, run at startup), and blobs written or
+re-referenced within the grace period are kept, since a save running
+meanwhile may not have written the manifest that references them yet.
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import os
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from atomic_io import atomic_write_bytes
+
+# Optional: zstandard compresses faster and smaller than gzip
+try:
+    import zstandard as _zstd
+except ImportError:  # pragma: no cover - depends on environment
+    _zstd = None
+
+# Prefix of content references in session manifests
+BLOB_REF_PREFIX = "sha256:"
+
+# Precomputed content statistics stored next to a content_ref, so lazily
+# loaded sessions can report sizes without reading the blob
+REF_STAT_KEYS = ("chars", "lines")
+
+# Content smaller than this is stored uncompressed
+COMPRESS_MIN_BYTES = 1024
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# Blobs modified more recently than this are never garbage collected
+GC_GRACE_SECONDS = 24 * 60 * 60
+
+# Suffixes tried when reading, in order
+_SUFFIXES = (".zst", ".gz", "")
+
+# A blob name: lowercase hex SHA-256
+_DIGEST = re.compile(r"[0-9a-f]{64}")
+
+
+def compress_bytes(data: bytes) -> Tuple[bytes, str]:
+    """
+    Compress data with zstd if available, otherwise gzip.
+
+    Args:
+        data: Raw bytes
+
+    Returns:
+        (compressed bytes, file suffix recording the codec: ".zst" or ".gz")
+    """
+    if _zstd is not None:
+        return _zstd.ZstdCompressor(level=ZSTD_LEVEL).compress(data), ".zst"
+    return gzip.compress(data, compresslevel=GZIP_LEVEL), ".gz"
+
+
+def decompress_bytes(data: bytes, suffix: str) -> bytes:
+    """
+    Reverse compress_bytes() given the codec suffix ("" for uncompressed data).
+
+    Raises:
+        RuntimeError: If the data is zstd-compressed and zstandard is not installed
+    """
+    if suffix == ".zst":
+        if _zstd is None:
+            raise RuntimeError("zstandard is required to read this file (pip install zstandard)")
+        return _zstd.ZstdDecompressor().decompress(data)
+    if suffix == ".gz":
+        return gzip.decompress(data)
+    return data
+
+
+class BlobNotFoundError(FileNotFoundError):
+    """Raised when a referenced blob is missing from the store."""
+
+
+def ref_digest(ref: str) -> str:
+    """Get the hex digest from a content reference ("sha256:<hex>" or bare hex)."""
+    return ref[len(BLOB_REF_PREFIX):] if ref.startswith(BLOB_REF_PREFIX) else ref
+
+
+def is_digest(digest: str) -> bool:
+    """
+    Check that a digest is a lowercase hex SHA-256.
+
+    References come from session files, so a digest is validated before it
+    becomes part of a path; anything else could name a file outside the store.
+    """
+    return isinstance(digest, str) and _DIGEST.fullmatch(digest) is not None
+
+
+def iter_refs(data: Any) -> Iterator[str]:
+    """
+    Yield every content_ref in a session, manifest, or journal operation.
+
+    Args:
+        data: Decoded JSON-like value, searched at any depth
+    """
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            ref = value.get("content_ref")
+            if isinstance(ref, str):
+                yield ref
+            stack.extend(value.values())
+        elif isinstance(value, list):
+            stack.extend(value)
+
+
+def content_hash(text: str) -> str:
+    """
+    Hash text content for addressing.
+
+    Args:
+        text: Content to hash
+
+    Returns:
+        Hex SHA-256 digest of the UTF-8 encoded text
+    """
+    return hashlib.sha256(text.encode("utf-8", errors="surrogatepass")).hexdigest()
+
+
+class BlobStore:
+    """
+    Directory of immutable, content-addressed text blobs.
+
+    Blobs live at <root>/<first two hex digits>/<hash><suffix>. Writes go to
+    a temporary file that is renamed into place, so a blob is either complete
+    or absent and concurrent writers of the same content are harmless.
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = Path(root)
+
+    def _base_path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest
+
+    def find(self, digest: str) -> Optional[Path]:
+        """
+        Locate a stored blob.
+
+        Args:
+            digest: Hex SHA-256 digest
+
+        Returns:
+            Path to the blob file, or None if not stored (or not a valid digest)
+        """
+        if not is_digest(digest):
+            return None
+        base = self._base_path(digest)
+        for suffix in _SUFFIXES:
+            path = base.with_name(base.name + suffix)
+            if path.exists():
+                return path
+        return None
+
+    def has(self, digest: str) -> bool:
+        """Check whether a blob is stored."""
+        return self.find(digest) is not None
+
+    def put(self, text: str) -> str:
+        """
+        Store text content unless an identical blob already exists.
+
+        Args:
+            text: Content to store
+
+        Returns:
+            Hex SHA-256 digest addressing the content
+        """
+        data = text.encode("utf-8", errors="surrogatepass")
+        digest = hashlib.sha256(data).hexdigest()
+        existing = self.find(digest)
+        if existing is not None:
+            # Referenced again: restart its garbage collection grace period
+            try:
+                os.utime(existing)
+            except OSError:
+                pass
+            return digest
+
+        if len(data) < COMPRESS_MIN_BYTES:
+            suffix = ""
+        else:
+            data, suffix = compress_bytes(data)
+
+        base = self._base_path(digest)
+        base.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write_bytes(base.with_name(base.name + suffix), data)
+        return digest
+
+    def get(self, digest: str) -> str:
+        """
+        Read stored content.
+
+        Args:
+            digest: Hex SHA-256 digest
+
+        Returns:
+            The stored text
+
+        Raises:
+            BlobNotFoundError: If the blob is not stored
+            RuntimeError: If the blob is zstd-compressed and zstandard is not installed
+        """
+        path = self.find(digest)
+        if path is None:
+            raise BlobNotFoundError(f"Blob not found: {digest}")
+        suffix = path.suffix if path.suffix in (".zst", ".gz") else ""
+        data = decompress_bytes(path.read_bytes(), suffix)
+        return data.decode("utf-8", errors="surrogatepass")
+
+    def read_ref(self, ref: str) -> str:
+        """
+        Read content by manifest reference (usable as a ScriptboardCore content loader).
+
+        Args:
+            ref: Content reference from a manifest ("sha256:<hex>")
+
+        Returns:
+            The stored text
+        """
+        return self.get(ref_digest(ref))
+
+    def write_ref(self, content: str) -> str:
+        """
+        Store content and return its manifest reference (usable as a ScriptboardCore content saver).
+
+        Args:
+            content: Text to store
+
+        Returns:
+            Content reference ("sha256:<hex>")
+        """
+        return BLOB_REF_PREFIX + self.put(content)
+
+    def collect_garbage(self, refs: Iterable[str], grace_seconds: float = GC_GRACE_SECONDS) -> Tuple[int, int]:
+        """
+        Delete blobs that are not referenced.
+
+        Args:
+            refs: Every live content reference (see iter_refs)
+            grace_seconds: Keep blobs modified this recently, referenced or not
+
+        Returns:
+            (blobs deleted, bytes freed)
+        """
+        live = {ref_digest(ref) for ref in refs}
+        cutoff = time.time() - grace_seconds
+        deleted = freed = 0
+        for path in self.root.glob("*/*"):
+            # Only blobs are collected: temporary files of in-progress writes
+            # (".<name>.tmp") and anything else in the directory are left alone
+            digest = path.name.split(".", 1)[0]
+            if not is_digest(digest) or path.parent.name != digest[:2] or digest in live:
+                continue
+            try:
+                st = path.stat()
+                if st.st_mtime > cutoff:
+                    continue
+                path.unlink()
+            except OSError:
+                continue
+            deleted += 1
+            freed += st.st_size
+        return deleted, freed
+
+
+def externalize_item(item: Dict, store: BlobStore) -> Dict:
+    """
+    Replace an attachment or response dictionary's content with a blob reference.
+
+    Args:
+        item: Attachment or response dictionary from to_dict()
+        store: Blob store receiving the content
+
+    Returns:
+        Copy of item with "content" replaced by "content_ref" plus its
+        REF_STAT_KEYS counts (items without content, such as binary
+        attachments or items already holding a reference, are returned unchanged)
+    """
+    content = item.get("content")
+    if not content:
+        return item
+    externalized = {key: value for key, value in item.items() if key != "content"}
+    externalized["content_ref"] = BLOB_REF_PREFIX + store.put(content)
+    externalized["chars"] = len(content)
+    externalized["lines"] = content.count("\n") + 1
+    return externalized
+
+
+def hydrate_item(item: Dict, store: BlobStore, fetched: Optional[Dict[str, str]] = None) -> Dict:
+    """
+    Resolve an item's blob reference back into inline content.
+
+    Args:
+        item: Attachment or response dictionary, with "content" or "content_ref"
+        store: Blob store holding the content
+        fetched: Optional memo of digest -> content, so repeated blobs are read once
+
+    Returns:
+        Item with "content" inline (items without a reference are returned unchanged)
+    """
+    ref = item.get("content_ref")
+    if not ref:
+        return item
+    digest = ref_digest(ref)
+    if fetched is not None and digest in fetched:
+        content = fetched[digest]
+    else:
+        content = store.get(digest)
+        if fetched is not None:
+            fetched[digest] = content
+    hydrated = {
+        key: value for key, value in item.items()
+        if key != "content_ref" and key not in REF_STAT_KEYS
+    }
+    hydrated["content"] = content
+    return hydrated
+
+
+def externalize_session(session_data: Dict, store: BlobStore) -> Dict:
+    """
+    Build a session manifest whose attachment and response content lives in the store.
+
+    Args:
+        session_data: Session dictionary from ScriptboardCore.to_dict()
+        store: Blob store receiving the content
+
+    Returns:
+        Manifest dictionary (same shape, content replaced by references)
+    """
+    manifest = dict(session_data)
+    manifest["attachments"] = [externalize_item(att, store) for att in session_data.get("attachments", [])]
+    manifest["responses"] = [externalize_item(resp, store) for resp in session_data.get("responses", [])]
+    return manifest
+
+
+def hydrate_session(manifest: Dict, store: BlobStore) -> Dict:
+    """
+    Resolve every blob reference in a session manifest.
+
+    Sessions saved before the blob store (inline content) pass through unchanged.
+
+    Args:
+        manifest: Session manifest or plain session dictionary
+        store: Blob store holding the content
+
+    Returns:
+        Session dictionary in ScriptboardCore.to_dict() format
+    """
+    fetched: Dict[str, str] = {}
+    session_data = dict(manifest)
+    session_data["attachments"] = [hydrate_item(att, store, fetched) for att in manifest.get("attachments", [])]
+    session_data["responses"] = [hydrate_item(resp, store, fetched) for resp in manifest.get("responses", [])]
+    return session_data
+
+
+def missing_refs(manifest: Dict, store: BlobStore) -> List[str]:
+    """
+    List content references in a session manifest that the store cannot serve.
+
+    Lets a lazy load fail up front instead of on first access.
+
+    Args:
+        manifest: Session manifest
+        store: Blob store holding the content
+
+    Returns:
+        Missing references, in manifest order
+    """
+    refs = [
+        item["content_ref"]
+        for section in ("attachments", "responses")
+        for item in manifest.get(section, [])
+        if isinstance(item, dict) and item.get("content_ref")
+    ]
+    return [ref for ref in refs if not store.has(ref_digest(ref))]
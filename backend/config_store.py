@@ -0,0 +1,130 @@
+"""
+Cached access to ~/.scriptboard/config.json.
+
+Reading the config used to mean opening, parsing, validating, and sometimes
+migrating and rewriting the file on every request. ConfigStore keeps the
+parsed config in memory and re-reads it only when the file's mtime or size
+changes (one stat call per load), so edits made by hand or by another
+process are still picked up.
+
+All writes go through ConfigStore.update(), which holds a lock across
+read-modify-write and replaces the file atomically, so concurrent updates
+cannot lose each other's changes or leave a half-written file behind.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from atomic_io import atomic_write_json
+
+# (path, mtime_ns, size) of the file a cached config was read from; mtime and
+# size are None when the file does not exist
+_Signature = Tuple[str, Optional[int], Optional[int]]
+
+
+def _signature(path: Path) -> _Signature:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return str(path), None, None
+    return str(path), st.st_mtime_ns, st.st_size
+
+
+def write_config_file(path: Path, config: Dict) -> None:
+    """
+    Write a config file atomically (see atomic_io).
+
+    Args:
+        path: Config file path
+        config: Config dictionary
+
+    Raises:
+        OSError: If the file cannot be written
+    """
+    atomic_write_json(path, config)
+
+
+class ConfigStore:
+    """
+    In-memory config validated against the file's stat signature.
+
+    The reader turns a config path into (config, dirty): the validated
+    config with defaults applied, and whether it differs from the file
+    (e.g. migrated prompt keys) and should be written back.
+    """
+
+    def __init__(self, reader: Callable[[Path], Tuple[Dict, bool]]) -> None:
+        self._reader = reader
+        self._lock = threading.Lock()
+        self._config: Optional[Dict] = None
+        self._signature: Optional[_Signature] = None
+
+    def _refresh(self, path: Path) -> Dict:
+        """Re-read the file if it changed since it was cached (caller holds the lock)."""
+        signature = _signature(path)
+        if self._config is not None and signature == self._signature:
+            return self._config
+
+        config, dirty = self._reader(path)
+        if dirty:
+            try:
+                write_config_file(path, config)
+                signature = _signature(path)
+            except OSError:
+                pass  # If save fails, continue with in-memory config
+        self._config = config
+        self._signature = signature
+        return config
+
+    def load(self, path: Path) -> Dict:
+        """
+        Get the current config.
+
+        The returned dictionary is shared between callers and must be treated
+        as read-only; change the config with update().
+
+        Args:
+            path: Config file path
+
+        Returns:
+            Config dictionary
+        """
+        with self._lock:
+            return self._refresh(path)
+
+    def update(self, path: Path, mutate: Callable[[Dict], Any]) -> Any:
+        """
+        Apply a change to the config and write it to disk.
+
+        The mutation runs on a copy of the current config, so if it raises
+        (e.g. HTTPException for a duplicate entry) or the write fails,
+        neither the file nor the cache changes.
+
+        Args:
+            path: Config file path
+            mutate: Function modifying the config dictionary in place
+
+        Returns:
+            Whatever mutate returns
+
+        Raises:
+            OSError: If the file cannot be written
+        """
+        with self._lock:
+            config = json.loads(json.dumps(self._refresh(path)))
+            result = mutate(config)
+            write_config_file(path, config)
+            self._config = config
+            self._signature = _signature(path)
+            return result
+
+    def invalidate(self) -> None:
+        """Drop the cached config so the next load re-reads the file."""
+        with self._lock:
+            self._config = None
+            self._signature = None
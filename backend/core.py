@@ -7,87 +7,447 @@ separated from UI, API, and file I/O concerns.
 
 from __future__ import annotations
 
-import uuid
-from dataclasses import dataclass, field
-from typing import Dict, List, Optional
+import functools
+import heapq
+import itertools
+import re
+import sys
+import threading
+import time
+from dataclasses import InitVar, dataclass, field, replace
+from typing import Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
-from schemas import BatchJobStatus
+from mapped_file import MappedText
+from schemas import BatchJobStatus, SearchMode
+from search_index import (
+    SearchTimeoutError,
+    TrigramIndex,
+    bm25_score,
+    check_deadline,
+    compile_pattern,
+    default_max_edits,
+    extract_trigrams,
+    find_in_chunks,
+    fuzzy_find,
+    regex_find,
+    split_pieces,
+)
+from token_counter import (
+    DEFAULT_MODEL,
+    TOKEN_CACHE_SIZE,
+    LRUCache,
+    cached_token_counts,
+    count_tokens_batch,
+    token_cache_key,
+    token_count_matrix,
+    truncate_to_tokens,
+)
 
+# Saved session schema: 1.1.0 adds blob content references (content_ref,
+# chars, lines) and the binary session format; 1.2.0 adds folder_sources and
+# memory-mapped attachments stored by path (mapped_path)
+SESSION_SCHEMA_VERSION = "1.2.0"
 
-@dataclass
-class Attachment:
+# Sections with running token totals
+TOKEN_SECTIONS = ("prompt", "attachments", "responses")
+
+# Search index key for the prompt (attachment/response keys are their IDs)
+PROMPT_INDEX_KEY = "prompt"
+
+# Upper bound on match offsets returned per document by ranked search
+MAX_MATCH_OFFSETS = 10000
+
+# Characters of context on each side of a match in search snippets
+SNIPPET_CONTEXT_CHARS = 50
+
+# Default seconds a regex/fuzzy search may run before returning partial results
+DEFAULT_SEARCH_TIME_BUDGET = 0.5
+
+# Maximum characters per chunk yielded by the streaming export generators
+EXPORT_CHUNK_CHARS = 64 * 1024
+
+# Header line of the LLM-friendly export
+EXPORT_HEADER = "--- Scriptboard Session Export ---\n\n"
+
+# Token-budgeted exports: smallest leftover budget worth filling with a truncated attachment
+MIN_TRUNCATED_ATTACHMENT_TOKENS = 32
+TRUNCATION_MARKER = "\n... (truncated to fit token budget)"
+
+# Precomputed content counts kept next to a content reference (blob_store.REF_STAT_KEYS)
+CONTENT_STAT_KEYS = ("chars", "lines")
+
+
+class _ItemIds:
+    """
+    Process-wide counter behind compact item IDs ("att_42", "resp_43", "batch_44").
+    
+    IDs stay strings, since they key the search index, token caches, journal
+    ops, folder manifests, and API responses, but a short counter suffix is a
+    fraction of the size of a uuid4 hex. One counter serves every prefix, so
+    an ID is unique across item kinds. Items loaded from a session keep their
+    IDs (uuid-style IDs from older sessions included); observe() moves the
+    counter past numeric ones so new items never reuse them.
+    
+    The counter starts at the clock in microseconds rather than 0, so IDs
+    issued before a restart and still held outside the loaded session
+    (frontend state, folder manifests, journal entries) are not issued again.
+    """
+
+    # Longest numeric suffix treated as a counter value (longer ones are hex digests)
+    MAX_DIGITS = 18
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._last = time.time_ns() // 1000
+
+    def new(self, prefix: str) -> str:
+        """Allocate the next ID with the given prefix."""
+        with self._lock:
+            self._last += 1
+            return f"{prefix}_{self._last}"
+
+    def observe(self, item_id: str) -> str:
+        """Advance the counter past a loaded ID and return the ID."""
+        suffix = item_id.rpartition("_")[2]
+        if suffix.isdigit() and len(suffix) <= self.MAX_DIGITS:
+            with self._lock:
+                self._last = max(self._last, int(suffix))
+        return item_id
+
+
+_item_ids = _ItemIds()
+
+
+def _intern(value: str) -> str:
+    """Intern short, frequently repeated labels (response sources, model names)."""
+    return sys.intern(value) if type(value) is str else value
+
+
+class LazyContentMixin:
+    """
+    Slotted content storage shared by Attachment and ResponseItem.
+    
+    Content is in one of three states:
+    
+    - loaded: _content holds the text
+    - deferred (defer_content()): _source is a loader; the first access of
+      `content` reads the text once and keeps it
+    - mapped (map_content()): _source is a MappedText; the text is decoded
+      on every access and never kept
+    
+    _ref and _meta hold the content's blob reference and (chars, lines)
+    counts. Deferred items start with them; loaded items gain them the first
+    time to_dict() runs with a content_saver, so later autosave snapshots
+    reuse the reference instead of hashing and storing the content again.
+    Content is replaced, never mutated, and assigning it drops the cache.
+    """
+
+    __slots__ = ("_content", "_source", "_ref", "_meta", "_line_count")
+
+    def _init_content(self, content: str) -> None:
+        self._content = content
+        self._source = None
+        self._ref = None
+        self._meta = None
+        self._line_count = None
+
+    def _get_content(self) -> str:
+        content = self._content
+        if content is not None:
+            return content
+        content = self.read_content()
+        if not isinstance(self._source, MappedText):
+            self._content = content
+            self._source = None
+        return content
+
+    def _set_content(self, content: str) -> None:
+        self._init_content(content)
+
+    def defer_content(self, ref: str, loader: Callable[[str], str], meta: Dict) -> None:
+        """
+        Replace the content with a reference that is only read when accessed.
+        
+        Args:
+            ref: Content reference (e.g. a blob_store "sha256:..." reference)
+            loader: Reads the content for a reference
+            meta: Precomputed "chars"/"lines" counts from the session manifest
+        """
+        self._init_content(None)
+        self._source = functools.partial(loader, ref)
+        self._ref = ref
+        self._meta = tuple(meta.get(key) for key in CONTENT_STAT_KEYS)
+
+    def map_content(self, mapped: MappedText) -> None:
+        """
+        Back the content by a memory-mapped file, decoded only when read.
+        
+        Args:
+            mapped: Mapped source file
+        """
+        self._init_content(None)
+        self._source = mapped
+
+    @property
+    def content_loaded(self) -> bool:
+        """Whether the content is in memory (False until a deferred item is accessed)."""
+        return self._content is not None
+
+    @property
+    def content_mapped(self) -> Optional[MappedText]:
+        """The mapped file backing the content, or None."""
+        source = self._source
+        return source if isinstance(source, MappedText) else None
+
+    def iter_content(self) -> Iterator[str]:
+        """Yield the content, in decoded chunks for a mapped item (without caching it)."""
+        mapped = self.content_mapped
+        if mapped is not None:
+            yield from mapped.iter_text()
+        else:
+            yield self.read_content()
+
+    def read_preview(self, max_lines: int) -> str:
+        """
+        Get at least enough leading text for truncate_lines(text, max_lines).
+        
+        Mapped items only decode the start of the file; the result ends with
+        a "\n..." line if the prefix stops mid-file before max_lines lines.
+        """
+        mapped = self.content_mapped
+        if mapped is None:
+            return self.read_content()
+        text, complete = mapped.read_prefix(max_lines)
+        if not complete and text.count("\n") < max_lines:
+            text += "\n..."
+        return text
+
+    def read_content(self) -> str:
+        """Get the content without caching it on the item if it is still deferred."""
+        content = self._content
+        if content is not None:
+            return content
+        source = self._source
+        if source is None:
+            return ""
+        return source.read_text() if isinstance(source, MappedText) else source()
+
+    def _content_stat(self, key: str) -> Optional[int]:
+        """Get a precomputed content count for a deferred, mapped, or saved item, if known."""
+        mapped = self.content_mapped
+        if mapped is not None:
+            return mapped.chars if key == "chars" else mapped.lines
+        if self._meta is None:
+            return None
+        return self._meta[CONTENT_STAT_KEYS.index(key)]
+
+    def _content_ref_dict(self, content_saver: Optional[Callable[[str], str]] = None) -> Optional[Dict]:
+        """
+        Get the content reference fields, or None if the content has no reference.
+        
+        Args:
+            content_saver: Stores loaded content and returns its reference; the
+                           reference is kept, so each content is saved once
+        """
+        ref, meta = self._ref, self._meta
+        if ref is None:
+            content = self._content
+            mapped = self.content_mapped
+            if mapped is not None and content_saver is not None:
+                content = mapped.read_text()
+            if content_saver is None or not content:
+                return None
+            ref = content_saver(content)
+            meta = (len(content), content.count("\n") + 1)
+            # Snapshots serialize in a worker thread; skip caching if the
+            # content was replaced meanwhile, or if it is a mapped file that
+            # can change on disk
+            if mapped is None and self._content is content:
+                self._ref, self._meta = ref, meta
+        counts = {key: value for key, value in zip(CONTENT_STAT_KEYS, meta) if value is not None}
+        return {"content_ref": ref, **counts}
+
+
+@dataclass(slots=True)
+class Attachment(LazyContentMixin):
     """Represents an attached file or text snippet."""
-    id: str = field(default_factory=lambda: f"att_{uuid.uuid4().hex}")
+    id: str = field(default_factory=lambda: _item_ids.new("att"))
     filename: str = ""
-    content: str = ""
+    content: InitVar[str] = ""
     binary: bool = False  # True if this is a binary file (metadata only)
 
+    def __post_init__(self, content: str) -> None:
+        self._init_content(content)
+
     @property
     def lines(self) -> int:
         """Count lines in content (for text files only)."""
-        if not self.content or self.binary:
+        if self.binary:
             return 0
-        return self.content.count("\n") + 1
+        stat = self._content_stat("lines")
+        if stat is not None:
+            return stat
+        content = self.content
+        if not content:
+            return 0
+        # Memoized until the content is replaced, so listings do not rescan unchanged text
+        if self._line_count is None:
+            self._line_count = content.count("\n") + 1
+        return self._line_count
 
-    def to_dict(self) -> Dict:
-        """Serialize to dictionary for session storage."""
+    @property
+    def char_count(self) -> int:
+        """Character count of content (0 for binary files)."""
+        if self.binary:
+            return 0
+        stat = self._content_stat("chars")
+        return stat if stat is not None else len(self.content)
+
+    def to_dict(
+        self,
+        keep_refs: bool = False,
+        content_saver: Optional[Callable[[str], str]] = None,
+        keep_mapped: bool = True,
+    ) -> Dict:
+        """
+        Serialize to dictionary for session storage.
+        
+        Content emitted inline is read with read_content(), so deferred
+        content is not kept loaded by serializing it.
+        
+        Args:
+            keep_refs: Emit content_ref for content that has a reference (deferred,
+                       or saved before), and mapped_path for memory-mapped
+                       content, instead of the content itself
+            content_saver: With keep_refs, stores loaded content that has no
+                           reference yet and returns one (e.g. BlobStore.write_ref)
+            keep_mapped: With keep_refs, emit mapped_path for memory-mapped
+                         content (autosave); False stores the file's current
+                         text like loaded content, so the saved session does
+                         not depend on the file (explicit saves)
+        """
+        mapped = self.content_mapped
+        if keep_refs and keep_mapped and mapped is not None:
+            return {
+                "id": self.id,
+                "filename": self.filename,
+                "mapped_path": mapped.path,
+                "chars": mapped.chars,
+                "lines": mapped.lines,
+                "binary": self.binary,
+            }
+        ref = self._content_ref_dict(content_saver) if keep_refs and not self.binary else None
+        if ref is not None:
+            return {"id": self.id, "filename": self.filename, **ref, "binary": self.binary}
         return {
             "id": self.id,
             "filename": self.filename,
-            "content": self.content if not self.binary else "",
+            "content": self.read_content() if not self.binary else "",
             "binary": self.binary,
         }
 
     @classmethod
-    def from_dict(cls, data: Dict) -> Attachment:
-        """Deserialize from dictionary."""
-        return cls(
-            id=data.get("id", f"att_{uuid.uuid4().hex}"),
+    def from_dict(cls, data: Dict, content_loader: Optional[Callable[[str], str]] = None) -> Attachment:
+        """
+        Deserialize from dictionary.
+        
+        Args:
+            data: Attachment dictionary
+            content_loader: Reads a content_ref; if given, referenced content
+                            is deferred until first accessed
+        
+        A mapped_path is mapped again; if the file can no longer be read the
+        attachment is kept with empty content.
+        """
+        attachment = cls(
+            id=_item_ids.observe(data["id"]) if data.get("id") else _item_ids.new("att"),
             filename=data.get("filename", ""),
             content=data.get("content", ""),
             binary=data.get("binary", False),
         )
+        if "content" not in data and data.get("mapped_path"):
+            try:
+                attachment.map_content(MappedText(data["mapped_path"]))
+            except (OSError, ValueError):
+                pass
+            return attachment
+        if content_loader is not None and "content" not in data and data.get("content_ref"):
+            attachment.defer_content(data["content_ref"], content_loader, data)
+        return attachment
 
 
-@dataclass
-class ResponseItem:
+@dataclass(slots=True)
+class ResponseItem(LazyContentMixin):
     """Represents a single LLM response."""
-    id: str = field(default_factory=lambda: f"resp_{uuid.uuid4().hex}")
+    id: str = field(default_factory=lambda: _item_ids.new("resp"))
     source: str = ""  # e.g., "GPT", "Claude", or custom label
-    content: str = ""
+    content: InitVar[str] = ""
+
+    def __post_init__(self, content: str) -> None:
+        self.source = _intern(self.source)
+        self._init_content(content)
 
     @property
     def char_count(self) -> int:
         """Character count of response content."""
-        return len(self.content)
+        stat = self._content_stat("chars")
+        return stat if stat is not None else len(self.content)
 
-    def to_dict(self) -> Dict:
-        """Serialize to dictionary for session storage."""
+    def to_dict(self, keep_refs: bool = False, content_saver: Optional[Callable[[str], str]] = None) -> Dict:
+        """
+        Serialize to dictionary for session storage.
+        
+        Args:
+            keep_refs: Emit content_ref for content that has a reference instead of the content
+            content_saver: See Attachment.to_dict()
+        """
+        ref = self._content_ref_dict(content_saver) if keep_refs else None
+        if ref is not None:
+            return {"id": self.id, "source": self.source, **ref}
         return {
             "id": self.id,
             "source": self.source,
-            "content": self.content,
+            "content": self.read_content(),
         }
 
     @classmethod
-    def from_dict(cls, data: Dict) -> ResponseItem:
-        """Deserialize from dictionary."""
-        return cls(
-            id=data.get("id", f"resp_{uuid.uuid4().hex}"),
+    def from_dict(cls, data: Dict, content_loader: Optional[Callable[[str], str]] = None) -> ResponseItem:
+        """
+        Deserialize from dictionary.
+        
+        Args:
+            data: Response dictionary
+            content_loader: Reads a content_ref; if given, referenced content
+                            is deferred until first accessed
+        """
+        response = cls(
+            id=_item_ids.observe(data["id"]) if data.get("id") else _item_ids.new("resp"),
             source=data.get("source", ""),
             content=data.get("content", ""),
         )
+        if content_loader is not None and "content" not in data and data.get("content_ref"):
+            response.defer_content(data["content_ref"], content_loader, data)
+        return response
+
 
+# Installed after the dataclass decorator so the generated __init__ takes content
+# (an InitVar with "" as the default) while instances store it in slots
+Attachment.content = property(LazyContentMixin._get_content, LazyContentMixin._set_content)
+ResponseItem.content = property(LazyContentMixin._get_content, LazyContentMixin._set_content)
 
-@dataclass
+
+@dataclass(slots=True)
 class BatchJob:
     """Represents a batch processing job (Phase-2 feature)."""
-    id: str = field(default_factory=lambda: f"batch_{uuid.uuid4().hex}")
+    id: str = field(default_factory=lambda: _item_ids.new("batch"))
     prompt: str = ""
     model: str = ""
     status: BatchJobStatus = BatchJobStatus.PENDING
     error: Optional[str] = None
 
+    def __post_init__(self) -> None:
+        self.model = _intern(self.model)
+
     def to_dict(self) -> Dict:
         """Serialize to dictionary."""
         return {
@@ -102,7 +462,7 @@ class BatchJob:
     def from_dict(cls, data: Dict) -> BatchJob:
         """Deserialize from dictionary."""
         return cls(
-            id=data.get("id", f"batch_{uuid.uuid4().hex}"),
+            id=_item_ids.observe(data["id"]) if data.get("id") else _item_ids.new("batch"),
             prompt=data.get("prompt", ""),
             model=data.get("model", ""),
             status=BatchJobStatus(data.get("status", BatchJobStatus.PENDING.value)),
@@ -110,6 +470,67 @@ class BatchJob:
         )
 
 
+# Filename fragments that mark an attachment as code in LLM exports (fenced in ```)
+LLM_CODE_EXTENSIONS = (
+    ".py", ".js", ".ts", ".json", ".md", ".txt", ".html", ".css", ".sql", ".sh", ".yaml", ".yml",
+)
+
+# Line boundaries recognized by str.splitlines()
+_LINE_BREAK = re.compile(r"\r\n|[\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]")
+
+
+def is_likely_code(filename: str) -> bool:
+    """Detect if an attachment looks like code (simple filename heuristic)."""
+    name = filename.lower()
+    return any(ext in name for ext in LLM_CODE_EXTENSIONS)
+
+
+def chunk_text(pieces: Iterable[str], size: int = EXPORT_CHUNK_CHARS) -> Iterator[str]:
+    """
+    Re-yield text pieces, splitting any piece longer than size characters.
+    
+    Args:
+        pieces: Text fragments in output order
+        size: Maximum characters per yielded chunk
+        
+    Yields:
+        Non-empty text chunks of at most size characters
+    """
+    for piece in pieces:
+        if len(piece) <= size:
+            if piece:
+                yield piece
+            continue
+        for start in range(0, len(piece), size):
+            yield piece[start:start + size]
+
+
+def truncate_lines(text: str, max_lines: int) -> str:
+    """
+    Keep the first max_lines lines of text, followed by a "..." line if cut.
+    
+    Same output as joining the first max_lines entries of text.splitlines(),
+    but only scans up to the first max_lines line breaks.
+    
+    Args:
+        text: Text to truncate
+        max_lines: Maximum number of lines to keep
+        
+    Returns:
+        Truncated text, or text unchanged if it has at most max_lines lines
+    """
+    if max_lines <= 0:
+        return "\n..." if text else text
+    breaks = 0
+    for match in _LINE_BREAK.finditer(text):
+        breaks += 1
+        if breaks == max_lines:
+            if match.end() < len(text):
+                return _LINE_BREAK.sub("\n", text[:match.start()]) + "\n..."
+            return text
+    return text
+
+
 class ScriptboardCore:
     """
     Core business logic engine for Scriptboard.
@@ -149,8 +570,33 @@ class ScriptboardCore:
         # Phase-2 features
         self.batch_jobs: List[BatchJob] = []
 
+        # Folders imported as attachments: root -> {"options", "files"} (see update_folder_source)
+        self.folder_sources: Dict[str, Dict] = {}
+
         # Internal state
-        self._token_cache: Dict[str, int] = {}  # Cache token counts by content hash
+        self._token_cache = LRUCache(TOKEN_CACHE_SIZE)  # Token counts by (tokenizer, content hash)
+        self._search_index = TrigramIndex()  # Trigram index over prompt/attachments/responses
+        # Non-exact searches query the index from the thread pool; the lock guards
+        # it and _unindexed against the event loop's writers
+        self._index_lock = threading.Lock()
+        # Running token totals per section, maintained on every mutation
+        self._token_totals: Dict[str, int] = {section: 0 for section in TOKEN_SECTIONS}
+        self._item_tokens: Dict[str, Tuple[str, int]] = {}  # key -> (section, counted tokens)
+        # key -> (section, text or deferred item) awaiting count
+        self._pending_tokens: Dict[str, Tuple[str, Union[str, LazyContentMixin]]] = {}
+        self._unindexed: Dict[str, LazyContentMixin] = {}  # Deferred items not yet in the search index
+        # Mapped items -> (item, MappedText.version their derived state was queued for)
+        self._mapped_items: Dict[str, Tuple[LazyContentMixin, int]] = {}
+        # Memoized renders, invalidated on mutation
+        self._preview_fragments: Dict[str, Tuple[int, str]] = {}  # key -> (max_lines, truncated text)
+        self._render_cache: Dict[Tuple[str, str], str] = {}  # (format, section) -> rendered section
+        # Renders also run in the thread pool (token-budgeted exports); the lock
+        # guards the cache and the per-section generation bumped on invalidation
+        self._render_lock = threading.Lock()
+        self._render_generations: Dict[str, int] = {section: 0 for section in TOKEN_SECTIONS}
+        # Autosave journal: operations since the last autosave (see autosave_journal.py)
+        self._journal: List[Dict] = []
+        self._journal_reset = True  # Next autosave must write a full snapshot
 
     # --------------------------------------------------------------------------- #
     # Prompt Operations
@@ -166,14 +612,17 @@ class ScriptboardCore:
         """
         self.prompt = text
         self.prompt_source = source or "manual"
-        # Clear token cache for prompt when it changes
-        self._token_cache.pop("prompt", None)
+        self._track_content(PROMPT_INDEX_KEY, "prompt", text)
+        self._invalidate_renders("prompt")
+        self._record({"op": "set_prompt", "text": text, "source": self.prompt_source})
 
     def clear_prompt(self) -> None:
         """Clear the current prompt."""
         self.prompt = ""
         self.prompt_source = None
-        self._token_cache.pop("prompt", None)
+        self._untrack_content(PROMPT_INDEX_KEY)
+        self._invalidate_renders("prompt")
+        self._record({"op": "clear_prompt"})
 
     def use_preloaded_prompt(self, key: str) -> bool:
         """
@@ -231,8 +680,36 @@ class ScriptboardCore:
             binary=False,
         )
         self.attachments.append(attachment)
-        # Clear token cache for attachments when they change
-        self._token_cache.pop("attachments", None)
+        self._track_content(attachment.id, "attachments", attachment.content)
+        self._invalidate_renders("attachments")
+        self._record({"op": "add_attachment", "attachment": attachment.to_dict()})
+        return attachment
+
+    def add_attachment_from_mapped_file(
+        self, mapped: MappedText, suggested_name: Optional[str] = None
+    ) -> Attachment:
+        """
+        Add an attachment backed by a memory-mapped file.
+        
+        The content is never held in memory: listings use the mapped file's
+        precomputed counts, previews and exports decode slices, and search
+        and token counting decode it transiently. Sessions saved as JSON and
+        autosaves refer to the file by path instead of copying it.
+        
+        Args:
+            mapped: Mapped text file (opened by the API layer)
+            suggested_name: Optional filename (default: the file's basename)
+            
+        Returns:
+            The created Attachment object
+        """
+        import os
+        attachment = Attachment(filename=suggested_name or os.path.basename(mapped.path), binary=False)
+        attachment.map_content(mapped)
+        self.attachments.append(attachment)
+        self._track_deferred(attachment.id, "attachments", attachment)
+        self._invalidate_renders("attachments")
+        self._record({"op": "add_attachment", "attachment": attachment.to_dict(keep_refs=True)})
         return attachment
 
     def add_attachment_from_path(
@@ -260,13 +737,106 @@ class ScriptboardCore:
             binary=binary,
         )
         self.attachments.append(attachment)
-        self._token_cache.pop("attachments", None)
+        if not attachment.binary:
+            self._track_content(attachment.id, "attachments", attachment.content)
+        self._invalidate_renders("attachments")
+        self._record({"op": "add_attachment", "attachment": attachment.to_dict()})
         return attachment
 
+    def update_attachment(self, attachment_id: str, content: Union[str, MappedText]) -> Optional[Attachment]:
+        """
+        Replace an attachment's content, keeping its ID and position.
+        
+        The attachment object is replaced rather than modified, so a
+        snapshot captured by snapshot_builder() keeps the old content.
+        
+        Args:
+            attachment_id: ID of the attachment to update
+            content: New text content, or a mapped file to back it
+            
+        Returns:
+            The updated Attachment, or None if no attachment has this ID
+        """
+        for i, att in enumerate(self.attachments):
+            if att.id == attachment_id:
+                if isinstance(content, MappedText):
+                    updated = Attachment(id=att.id, filename=att.filename, binary=False)
+                    updated.map_content(content)
+                    self._untrack_content(updated.id)
+                    self._track_deferred(updated.id, "attachments", updated)
+                else:
+                    updated = Attachment(id=att.id, filename=att.filename, content=content, binary=False)
+                    self._track_content(updated.id, "attachments", updated.content)
+                self.attachments[i] = updated
+                self._invalidate_renders("attachments")
+                self._record({"op": "update_attachment", "attachment": updated.to_dict(keep_refs=True)})
+                return updated
+        return None
+
+    def remove_attachments(self, attachment_ids: Iterable[str]) -> int:
+        """
+        Remove attachments by ID.
+        
+        Args:
+            attachment_ids: IDs to remove (unknown IDs are ignored)
+            
+        Returns:
+            Number of attachments removed
+        """
+        ids = set(attachment_ids)
+        removed = [att.id for att in self.attachments if att.id in ids]
+        if not removed:
+            return 0
+        for att_id in removed:
+            self._untrack_content(att_id)
+        self.attachments = [att for att in self.attachments if att.id not in ids]
+        self._invalidate_renders("attachments")
+        self._record({"op": "remove_attachments", "ids": removed})
+        return len(removed)
+
     def clear_attachments(self) -> None:
-        """Clear all attachments."""
+        """Clear all attachments (and the folder sources they came from)."""
+        for att in self.attachments:
+            self._untrack_content(att.id)
         self.attachments.clear()
-        self._token_cache.pop("attachments", None)
+        self.folder_sources = {}
+        self._invalidate_renders("attachments")
+        self._record({"op": "clear_attachments"})
+
+    def update_folder_source(
+        self,
+        root: str,
+        options: Dict,
+        files: Dict[str, Dict],
+        removed: Iterable[str] = (),
+    ) -> None:
+        """
+        Record files imported from a folder, for a later sync.
+        
+        The manifest is replaced rather than modified, so a snapshot captured
+        by snapshot_builder() is unaffected. The journal records only the
+        changed entries.
+        
+        Args:
+            root: Imported folder (absolute path)
+            options: Import filters (folder_import.ImportOptions.to_dict())
+            files: Manifest entries to add or replace, by relative path:
+                   {"id": attachment ID or None, "mtime_ns", "size", "hash"}
+            removed: Relative paths to drop from the manifest
+        """
+        previous = self.folder_sources.get(root, {})
+        manifest = dict(previous.get("files", {}))
+        for rel_path in removed:
+            manifest.pop(rel_path, None)
+        manifest.update(files)
+        self.folder_sources = {**self.folder_sources, root: {"options": options, "files": manifest}}
+        self._record({
+            "op": "update_folder_source",
+            "root": root,
+            "options": options,
+            "files": files,
+            "removed": list(removed),
+        })
 
     def list_attachments(self) -> List[Attachment]:
         """
@@ -297,14 +867,18 @@ class ScriptboardCore:
             source=source or "unknown",
         )
         self.responses.append(response)
-        # Clear token cache for responses when they change
-        self._token_cache.pop("responses", None)
+        self._track_content(response.id, "responses", response.content)
+        self._invalidate_renders("responses")
+        self._record({"op": "add_response", "response": response.to_dict()})
         return response
 
     def clear_responses(self) -> None:
         """Clear all responses."""
+        for resp in self.responses:
+            self._untrack_content(resp.id)
         self.responses.clear()
-        self._token_cache.pop("responses", None)
+        self._invalidate_renders("responses")
+        self._record({"op": "clear_responses"})
 
     def responses_summary(self) -> Dict:
         """
@@ -336,6 +910,9 @@ class ScriptboardCore:
         """
         Build a truncated preview of the combined content.
         
+        Truncated item text is memoized per item and only the first
+        max_lines line breaks of each item are ever scanned.
+        
         Args:
             max_lines: Maximum number of lines per section (default: 3)
             
@@ -346,11 +923,7 @@ class ScriptboardCore:
         
         # Prompt section
         if self.prompt:
-            prompt_lines = self.prompt.splitlines()
-            if len(prompt_lines) > max_lines:
-                prompt_text = "\n".join(prompt_lines[:max_lines]) + "\n..."
-            else:
-                prompt_text = self.prompt
+            prompt_text = self._preview_fragment(PROMPT_INDEX_KEY, self.prompt, max_lines)
             sections.append(f"=== PROMPT ===\n{prompt_text}")
         
         # Attachments section
@@ -360,11 +933,7 @@ class ScriptboardCore:
                 if att.binary:
                     sections.append(f"  [{att.filename}] (binary file)")
                 else:
-                    att_lines = att.content.splitlines()
-                    if len(att_lines) > max_lines:
-                        att_text = "\n".join(att_lines[:max_lines]) + "\n..."
-                    else:
-                        att_text = att.content
+                    att_text = self._preview_fragment(att.id, att, max_lines)
                     sections.append(f"  [{att.filename}]\n{att_text}")
             if len(self.attachments) > 5:
                 sections.append(f"  ... and {len(self.attachments) - 5} more")
@@ -373,11 +942,7 @@ class ScriptboardCore:
         if self.responses:
             sections.append(f"=== RESPONSES ({len(self.responses)}) ===")
             for resp in self.responses[:5]:  # Show first 5 responses
-                resp_lines = resp.content.splitlines()
-                if len(resp_lines) > max_lines:
-                    resp_text = "\n".join(resp_lines[:max_lines]) + "\n..."
-                else:
-                    resp_text = resp.content
+                resp_text = self._preview_fragment(resp.id, resp, max_lines)
                 sections.append(f"  [{resp.source}]\n{resp_text}")
             if len(self.responses) > 5:
                 sections.append(f"  ... and {len(self.responses) - 5} more")
@@ -387,10 +952,60 @@ class ScriptboardCore:
         
         return "\n\n".join(sections)
 
+    def _preview_fragment(self, key: str, source: Union[str, LazyContentMixin], max_lines: int) -> str:
+        """
+        Get the memoized truncated preview text for an item.
+        
+        Args:
+            key: Item key (PROMPT_INDEX_KEY, attachment ID, or response ID)
+            source: Item content, or the item itself (deferred content is
+                    only read on a memo miss and is not kept loaded)
+            max_lines: Maximum number of lines to keep
+            
+        Returns:
+            Text truncated to max_lines lines with a trailing "..." line,
+            or the text unchanged if it is short enough
+        """
+        cached = self._preview_fragments.get(key)
+        if cached is not None and cached[0] == max_lines:
+            return cached[1]
+        text = source if isinstance(source, str) else source.read_preview(max_lines)
+        fragment = truncate_lines(text, max_lines)
+        self._preview_fragments[key] = (max_lines, fragment)
+        return fragment
+
+    def _cached_render(self, fmt: str, section: str, render: Callable[[], str]) -> str:
+        """
+        Get a memoized full render of a section, rendering it on first use.
+        
+        Args:
+            fmt: Render format (e.g. "combined", "llm")
+            section: "prompt", "attachments", or "responses"
+            render: Builds the section text on a cache miss
+            
+        Returns:
+            Rendered section text
+        
+        May run in a worker thread: a render is only stored if the section
+        was not invalidated while it was being built.
+        """
+        key = (fmt, section)
+        with self._render_lock:
+            text = self._render_cache.get(key)
+            generation = self._render_generations[section]
+        if text is None:
+            text = render()
+            with self._render_lock:
+                if self._render_generations[section] == generation:
+                    self._render_cache[key] = text
+        return text
+
     def build_combined_preview(self) -> str:
         """
         Build a full combined preview without truncation.
         
+        Each section is rendered once and reused until it changes.
+        
         Returns:
             Complete multi-section preview text
         """
@@ -398,159 +1013,477 @@ class ScriptboardCore:
         
         # Prompt section
         if self.prompt:
-            sections.append(f"=== PROMPT ===\n{self.prompt}")
+            sections.append(self._cached_render("combined", "prompt", self._render_combined_prompt))
         
         # Attachments section
         if self.attachments:
-            sections.append(f"=== ATTACHMENTS ({len(self.attachments)}) ===")
-            for att in self.attachments:
-                if att.binary:
-                    sections.append(f"\n[{att.filename}] (binary file - content not available)")
-                else:
-                    sections.append(f"\n[{att.filename}]\n{att.content}")
+            sections.append(self._cached_render("combined", "attachments", self._render_combined_attachments))
         
         # Responses section
         if self.responses:
-            sections.append(f"=== RESPONSES ({len(self.responses)}) ===")
-            for resp in self.responses:
-                sections.append(f"\n[{resp.source}]\n{resp.content}")
+            sections.append(self._cached_render("combined", "responses", self._render_combined_responses))
         
         if not sections:
             return "No content to preview."
         
         return "\n\n".join(sections)
 
-    def build_llm_friendly_export(self) -> str:
+    def iter_combined_preview(self) -> Iterator[str]:
+        """
+        Stream the full combined preview in bounded chunks.
+        
+        Produces the same text as build_combined_preview() without ever
+        holding more than one item's content plus a chunk in memory.
+        
+        Yields:
+            Text chunks of at most EXPORT_CHUNK_CHARS characters
+        """
+        sections = []
+        if self.prompt:
+            sections.append(self._iter_combined_prompt)
+        if self.attachments:
+            sections.append(self._iter_combined_attachments)
+        if self.responses:
+            sections.append(self._iter_combined_responses)
+        
+        if not sections:
+            yield "No content to preview."
+            return
+        
+        for n, section in enumerate(sections):
+            if n:
+                yield "\n\n"
+            yield from chunk_text(section())
+
+    def _iter_combined_prompt(self) -> Iterator[str]:
+        """Yield the prompt section of the combined preview."""
+        yield "=== PROMPT ===\n"
+        yield self.prompt
+
+    def _iter_combined_attachments(self) -> Iterator[str]:
+        """Yield the attachments section of the combined preview."""
+        attachments = list(self.attachments)
+        yield f"=== ATTACHMENTS ({len(attachments)}) ==="
+        for att in attachments:
+            if att.binary:
+                yield f"\n\n\n[{att.filename}] (binary file - content not available)"
+            else:
+                yield f"\n\n\n[{att.filename}]\n"
+                yield from att.iter_content()
+
+    def _iter_combined_responses(self) -> Iterator[str]:
+        """Yield the responses section of the combined preview."""
+        responses = list(self.responses)
+        yield f"=== RESPONSES ({len(responses)}) ==="
+        for resp in responses:
+            yield f"\n\n\n[{resp.source}]\n"
+            yield resp.read_content()
+
+    def _render_combined_prompt(self) -> str:
+        """Render the prompt section of the combined preview."""
+        return "".join(self._iter_combined_prompt())
+
+    def _render_combined_attachments(self) -> str:
+        """Render the attachments section of the combined preview."""
+        return "".join(self._iter_combined_attachments())
+
+    def _render_combined_responses(self) -> str:
+        """Render the responses section of the combined preview."""
+        return "".join(self._iter_combined_responses())
+
+    def build_llm_friendly_export(
+        self,
+        token_budget: Optional[int] = None,
+        model: str = DEFAULT_MODEL,
+    ) -> str:
         """
         Build LLM-optimized export format for pasting into chat interfaces.
         
+        Reuses the memoized sections of the build_llm_friendly_* helpers.
+        
+        Args:
+            token_budget: Target token count; attachments are selected and
+                          truncated to fit (see pack_attachments). None exports everything.
+            model: Model whose tokenizer measures the budget
+        
         Returns:
             Formatted text optimized for LLM consumption
         """
+        if token_budget is not None:
+            return "".join(self.iter_llm_friendly_export(token_budget, model))
+        
         sections = []
         
         # Prompt section with source info
         if self.prompt:
-            source_info = f" (Source: {self.prompt_source})" if self.prompt_source else ""
-            sections.append(f"# PROMPT{source_info}\n\n{self.prompt}")
+            sections.append(self.build_llm_friendly_prompt())
         
-        # Attachments section with better formatting
+        # Attachments and responses sections, separated by a blank line
         if self.attachments:
-            sections.append(f"\n# ATTACHMENTS ({len(self.attachments)} file{'s' if len(self.attachments) != 1 else ''})\n")
-            for i, att in enumerate(self.attachments, 1):
-                if att.binary:
-                    sections.append(f"## File {i}: {att.filename}\n\n(binary file - content not available)\n")
-                else:
-                    # Detect if content looks like code (simple heuristic)
-                    is_likely_code = any(ext in att.filename.lower() for ext in ['.py', '.js', '.ts', '.json', '.md', '.txt', '.html', '.css', '.sql', '.sh', '.yaml', '.yml'])
-                    if is_likely_code:
-                        sections.append(f"## File {i}: {att.filename}\n\n```\n{att.content}\n```\n")
-                    else:
-                        sections.append(f"## File {i}: {att.filename}\n\n{att.content}\n")
-        
-        # Responses section with clear separation
+            sections.append("\n" + self.build_llm_friendly_attachments())
         if self.responses:
-            sections.append(f"\n# RESPONSES ({len(self.responses)} response{'s' if len(self.responses) != 1 else ''})\n")
-            for i, resp in enumerate(self.responses, 1):
-                sections.append(f"## Response {i}: {resp.source}\n\n{resp.content}\n")
+            sections.append("\n" + self.build_llm_friendly_responses())
         
         if not sections:
             return "No content available."
         
         # Add a brief header if there's content
-        header = "--- Scriptboard Session Export ---\n\n"
-        return header + "\n".join(sections)
+        return EXPORT_HEADER + "\n".join(sections)
 
     def build_llm_friendly_prompt(self) -> str:
         """Build LLM-friendly format for prompt only."""
         if not self.prompt:
             return "No prompt available."
-        source_info = f" (Source: {self.prompt_source})" if self.prompt_source else ""
-        return f"# PROMPT{source_info}\n\n{self.prompt}"
+        return self._cached_render("llm", "prompt", self._render_llm_prompt)
 
     def build_llm_friendly_attachments(self) -> str:
         """Build LLM-friendly format for attachments only."""
         if not self.attachments:
             return "No attachments available."
-        
-        sections = [f"# ATTACHMENTS ({len(self.attachments)} file{'s' if len(self.attachments) != 1 else ''})\n"]
-        for i, att in enumerate(self.attachments, 1):
-            if att.binary:
-                sections.append(f"## File {i}: {att.filename}\n\n(binary file - content not available)\n")
-            else:
-                # Detect if content looks like code
-                is_likely_code = any(ext in att.filename.lower() for ext in ['.py', '.js', '.ts', '.json', '.md', '.txt', '.html', '.css', '.sql', '.sh', '.yaml', '.yml'])
-                if is_likely_code:
-                    sections.append(f"## File {i}: {att.filename}\n\n```\n{att.content}\n```\n")
-                else:
-                    sections.append(f"## File {i}: {att.filename}\n\n{att.content}\n")
-        
-        return "\n".join(sections)
+        return self._cached_render("llm", "attachments", self._render_llm_attachments)
 
     def build_llm_friendly_responses(self) -> str:
         """Build LLM-friendly format for responses only."""
         if not self.responses:
             return "No responses available."
+        return self._cached_render("llm", "responses", self._render_llm_responses)
+
+    def iter_llm_friendly_export(
+        self,
+        token_budget: Optional[int] = None,
+        model: str = DEFAULT_MODEL,
+    ) -> Iterator[str]:
+        """
+        Stream the LLM-friendly export in bounded chunks.
         
-        sections = [f"# RESPONSES ({len(self.responses)} response{'s' if len(self.responses) != 1 else ''})\n"]
-        for i, resp in enumerate(self.responses, 1):
-            sections.append(f"## Response {i}: {resp.source}\n\n{resp.content}\n")
+        Produces the same text as build_llm_friendly_export() without ever
+        holding more than one item's content plus a chunk in memory.
         
-        return "\n".join(sections)
-
-    # --------------------------------------------------------------------------- #
-    # Session Serialization
-    # --------------------------------------------------------------------------- #
+        Args:
+            token_budget: Target token count (see pack_attachments), or None
+            model: Model whose tokenizer measures the budget
+        
+        Yields:
+            Text chunks of at most EXPORT_CHUNK_CHARS characters
+        """
+        if not (self.prompt or self.attachments or self.responses):
+            yield "No content available."
+            return
+        
+        if token_budget is None:
+            attachments, omitted = list(self.attachments), 0
+        else:
+            attachments, omitted = self.pack_attachments(token_budget, model)
+        yield from self._iter_llm_export(attachments, omitted)
 
-    def to_dict(self) -> Dict:
+    def _iter_llm_export(self, attachments: List[Attachment], omitted: int) -> Iterator[str]:
         """
-        Serialize the entire session state to a dictionary.
+        Yield the LLM-friendly export of the given attachments in bounded chunks.
         
-        Returns:
-            Dictionary containing all session data with schema_version for compatibility
+        Args:
+            attachments: Attachments to include
+            omitted: Number of attachments left out to fit a token budget
         """
-        return {
-            "schema_version": "1.0.0",  # For future compatibility
-            "prompt": self.prompt,
-            "prompt_source": self.prompt_source,
-            "attachments": [att.to_dict() for att in self.attachments],
-            "responses": [resp.to_dict() for resp in self.responses],
-            "favorites": [{"label": label, "path": path} for label, path in self.favorites],
-            "llm_urls": [{"label": label, "url": url} for label, url in self.llm_urls],
-            "current_profile": self.current_profile,
-            "batch_jobs": [job.to_dict() for job in self.batch_jobs],
-        }
+        yield EXPORT_HEADER
+        started = False
+        if self.prompt:
+            yield from chunk_text(self._iter_llm_prompt())
+            started = True
+        if attachments or omitted:
+            yield "\n\n" if started else "\n"
+            yield from chunk_text(self._iter_llm_attachments(attachments, omitted))
+            started = True
+        if self.responses:
+            yield "\n\n" if started else "\n"
+            yield from chunk_text(self._iter_llm_responses())
 
-    def load_from_dict(self, data: Dict) -> None:
+    def pack_attachments(
+        self,
+        token_budget: int,
+        model: str = DEFAULT_MODEL,
+    ) -> Tuple[List[Attachment], int]:
         """
-        Deserialize session state from a dictionary.
+        Choose the attachments that fit a token budget for the LLM export.
+        
+        The prompt and responses are always kept; attachments share what is
+        left. Attachments are taken greedily newest-first when they fit whole,
+        then the newest one that did not fit is truncated into the leftover
+        budget. Token counts come from the session token cache, so packing the
+        same session again only encodes new content.
+        
+        Per-item costs are only an estimate of the assembled export (numbering
+        and merges across item boundaries change the count), so the packed
+        export is counted once more; if it is over budget, the attachments
+        packed last (the truncated one first) are dropped until their cached
+        costs cover the overshoot, and the export is counted again.
         
         Args:
-            data: Dictionary containing session data
+            token_budget: Target token count for the whole export
+            model: Model whose tokenizer measures the budget
             
-        Note:
-            Missing fields will use defaults. Invalid data is handled gracefully.
+        Returns:
+            Tuple of (selected attachments in session order, with a truncated
+            copy in place of a cut attachment; number of attachments omitted)
         """
-        schema_version = data.get("schema_version", "1.0.0")
+        attachments = list(self.attachments)
+        if not attachments:
+            return [], 0
         
-        # Load prompt
-        self.prompt = data.get("prompt", "")
-        self.prompt_source = data.get("prompt_source")
+        # Fixed cost: export header, prompt and responses sections with their
+        # separators, attachments heading and note
+        fixed_texts = [
+            EXPORT_HEADER,
+            self._llm_attachments_heading(len(attachments)),
+            self._llm_omitted_note(len(attachments)),
+            "\n\n" if self.prompt else "\n",
+        ]
+        if self.prompt:
+            fixed_texts.append(self.build_llm_friendly_prompt())
+        if self.responses:
+            fixed_texts.append("\n\n" + self.build_llm_friendly_responses())
+        remaining = token_budget - sum(cached_token_counts(self._token_cache, fixed_texts, model))
         
-        # Load attachments
+        # Per-attachment cost: content (shared with /tokens) plus its heading and fences
+        wrappers = [self._llm_attachment_wrapper(i, att) for i, att in enumerate(attachments, 1)]
+        content_tokens = cached_token_counts(
+            self._token_cache, ["" if att.binary else att.read_content() for att in attachments], model
+        )
+        wrapper_tokens = cached_token_counts(
+            self._token_cache, [prefix + suffix for prefix, suffix in wrappers], model
+        )
+        
+        # Attachment index -> (attachment or truncated copy, estimated cost), in packing order
+        selected: Dict[int, Tuple[Attachment, int]] = {}
+        skipped: List[int] = []
+        for i in reversed(range(len(attachments))):
+            cost = content_tokens[i] + wrapper_tokens[i]
+            if cost <= remaining:
+                selected[i] = (attachments[i], cost)
+                remaining -= cost
+            else:
+                skipped.append(i)
+        
+        # Fill the leftover with the newest text attachment that did not fit
+        marker_tokens = cached_token_counts(self._token_cache, [TRUNCATION_MARKER], model)[0]
+        for i in skipped:
+            att = attachments[i]
+            room = remaining - wrapper_tokens[i] - marker_tokens
+            if att.binary or room < MIN_TRUNCATED_ATTACHMENT_TOKENS:
+                continue
+            content = truncate_to_tokens(att.read_content(), room, model, total_tokens=content_tokens[i])
+            if content:
+                selected[i] = (replace(att, content=content + TRUNCATION_MARKER), remaining)
+            break
+        
+        # Count the assembled export once; if it is over, shed the last packed
+        # attachments until their estimated costs cover the overshoot, and check again
+        while selected:
+            packed = [selected[i][0] for i in sorted(selected)]
+            export = "".join(self._iter_llm_export(packed, len(attachments) - len(packed)))
+            overshoot = count_tokens_batch([export], model)[0] - token_budget
+            del export
+            if overshoot <= 0:
+                break
+            while selected and overshoot > 0:
+                _, cost = selected.pop(next(reversed(selected)))
+                overshoot -= max(cost, 1)
+        
+        return [selected[i][0] for i in sorted(selected)], len(attachments) - len(selected)
+
+    def _iter_llm_prompt(self) -> Iterator[str]:
+        """Yield the LLM-friendly prompt section."""
+        source_info = f" (Source: {self.prompt_source})" if self.prompt_source else ""
+        yield f"# PROMPT{source_info}\n\n"
+        yield self.prompt
+
+    def _iter_llm_attachments(
+        self,
+        attachments: Optional[List[Attachment]] = None,
+        omitted: int = 0,
+    ) -> Iterator[str]:
+        """
+        Yield the LLM-friendly attachments section.
+        
+        Args:
+            attachments: Attachments to include (default: all of them)
+            omitted: Number of attachments left out to fit a token budget
+        """
+        attachments = list(self.attachments) if attachments is None else attachments
+        yield self._llm_attachments_heading(len(attachments))
+        for i, att in enumerate(attachments, 1):
+            prefix, suffix = self._llm_attachment_wrapper(i, att)
+            yield prefix
+            if not att.binary:
+                yield from att.iter_content()
+            yield suffix
+        if omitted:
+            yield self._llm_omitted_note(omitted)
+
+    @staticmethod
+    def _llm_attachments_heading(count: int) -> str:
+        """Get the heading line of the LLM-friendly attachments section."""
+        return f"# ATTACHMENTS ({count} file{'s' if count != 1 else ''})\n"
+
+    @staticmethod
+    def _llm_omitted_note(omitted: int) -> str:
+        """Get the note listing attachments left out of a token-budgeted export."""
+        return f"\n({omitted} more file{'s' if omitted != 1 else ''} omitted to fit the token budget)\n"
+
+    @staticmethod
+    def _llm_attachment_wrapper(i: int, att: Attachment) -> Tuple[str, str]:
+        """
+        Get the text written before and after an attachment in the LLM export.
+        
+        Args:
+            i: 1-based position of the attachment in the export
+            att: Attachment being rendered
+            
+        Returns:
+            Tuple of (prefix, suffix); binary attachments have no content between them
+        """
+        if att.binary:
+            return f"\n## File {i}: {att.filename}\n\n(binary file - content not available)\n", ""
+        if is_likely_code(att.filename):
+            return f"\n## File {i}: {att.filename}\n\n```\n", "\n```\n"
+        return f"\n## File {i}: {att.filename}\n\n", "\n"
+
+    def _iter_llm_responses(self) -> Iterator[str]:
+        """Yield the LLM-friendly responses section."""
+        responses = list(self.responses)
+        yield f"# RESPONSES ({len(responses)} response{'s' if len(responses) != 1 else ''})\n"
+        for i, resp in enumerate(responses, 1):
+            yield f"\n## Response {i}: {resp.source}\n\n"
+            yield resp.read_content()
+            yield "\n"
+
+    def _render_llm_prompt(self) -> str:
+        """Render the LLM-friendly prompt section."""
+        return "".join(self._iter_llm_prompt())
+
+    def _render_llm_attachments(self) -> str:
+        """Render the LLM-friendly attachments section."""
+        return "".join(self._iter_llm_attachments())
+
+    def _render_llm_responses(self) -> str:
+        """Render the LLM-friendly responses section."""
+        return "".join(self._iter_llm_responses())
+
+    # --------------------------------------------------------------------------- #
+    # Session Serialization
+    # --------------------------------------------------------------------------- #
+
+    def to_dict(self, keep_refs: bool = False, keep_mapped: bool = True) -> Dict:
+        """
+        Serialize the entire session state to a dictionary.
+        
+        Args:
+            keep_refs: Emit content_ref for content that already has a blob
+                       reference (loaded lazily, or saved by an earlier
+                       snapshot), instead of the content (for re-saving to
+                       the blob store)
+            keep_mapped: See Attachment.to_dict()
+        
+        Returns:
+            Dictionary containing all session data with schema_version for compatibility
+        """
+        return self.snapshot_builder(keep_refs, keep_mapped=keep_mapped)()
+
+    def snapshot_builder(
+        self,
+        keep_refs: bool = False,
+        content_saver: Optional[Callable[[str], str]] = None,
+        keep_mapped: bool = True,
+    ) -> Callable[[], Dict]:
+        """
+        Capture the session and return a function that serializes the capture.
+        
+        Capturing copies the item lists and metadata but not the content, so
+        it is cheap to do on the event loop; the returned function can then
+        run in a worker thread while the live session keeps changing.
+        
+        Args:
+            keep_refs: See to_dict()
+            content_saver: With keep_refs, stores loaded content that has no
+                           reference yet and returns one; each item keeps its
+                           reference, so unchanged content is saved only once
+            keep_mapped: See Attachment.to_dict()
+        
+        Returns:
+            Zero-argument function returning the to_dict() dictionary as of
+            the capture
+        """
+        prompt = self.prompt
+        prompt_source = self.prompt_source
+        attachments = list(self.attachments)
+        responses = list(self.responses)
+        folder_sources = self.folder_sources
+        metadata = self.session_metadata()
+        
+        def build() -> Dict:
+            return {
+                "schema_version": SESSION_SCHEMA_VERSION,  # For future compatibility
+                "prompt": prompt,
+                "prompt_source": prompt_source,
+                "attachments": [att.to_dict(keep_refs, content_saver, keep_mapped) for att in attachments],
+                "responses": [resp.to_dict(keep_refs, content_saver) for resp in responses],
+                "folder_sources": folder_sources,
+                **metadata,
+            }
+        
+        return build
+
+    def session_metadata(self) -> Dict:
+        """
+        Serialize the session state that is not prompt, attachment, or response content.
+        
+        Returns:
+            Dictionary with favorites, llm_urls, current_profile, and batch_jobs
+            in to_dict() format
+        """
+        return {
+            "favorites": [{"label": label, "path": path} for label, path in self.favorites],
+            "llm_urls": [{"label": label, "url": url} for label, url in self.llm_urls],
+            "current_profile": self.current_profile,
+            "batch_jobs": [job.to_dict() for job in self.batch_jobs],
+        }
+
+    def load_from_dict(self, data: Dict, content_loader: Optional[Callable[[str], str]] = None) -> None:
+        """
+        Deserialize session state from a dictionary.
+        
+        Args:
+            data: Dictionary containing session data
+            content_loader: Reads a content_ref (e.g. BlobStore.read_ref). If
+                            given, attachments and responses stored by reference
+                            are loaded lazily: their content is only read when
+                            preview, search, export, or token counting needs it.
+            
+        Note:
+            Missing fields will use defaults. Invalid data is handled gracefully.
+        """
+        schema_version = data.get("schema_version", "1.0.0")
+        
+        # Load prompt
+        self.prompt = data.get("prompt", "")
+        self.prompt_source = data.get("prompt_source")
+        
+        # Load attachments
         self.attachments = []
         for att_data in data.get("attachments", []):
             try:
-                self.attachments.append(Attachment.from_dict(att_data))
+                self.attachments.append(Attachment.from_dict(att_data, content_loader))
             except Exception:
                 # Skip invalid attachments
                 continue
         
+        folder_sources = data.get("folder_sources")
+        self.folder_sources = folder_sources if isinstance(folder_sources, dict) else {}
+        
         # Load responses
         self.responses = []
         for resp_data in data.get("responses", []):
             try:
-                self.responses.append(ResponseItem.from_dict(resp_data))
+                self.responses.append(ResponseItem.from_dict(resp_data, content_loader))
             except Exception:
                 # Skip invalid responses
                 continue
@@ -583,8 +1516,272 @@ class ScriptboardCore:
                 # Skip invalid batch jobs
                 continue
         
-        # Clear token cache when loading new session
-        self._token_cache.clear()
+        # Token cache is keyed by content hash, so it stays valid across sessions
+        self._rebuild_derived_state()
+        self.reset_journal()
+
+    # --------------------------------------------------------------------------- #
+    # Autosave Journal
+    # --------------------------------------------------------------------------- #
+
+    def _record(self, op: Dict) -> None:
+        """
+        Record a content operation for the next incremental autosave.
+        
+        Args:
+            op: Operation dictionary understood by autosave_journal.apply_op()
+        """
+        if not self._journal_reset:
+            self._journal.append(op)
+
+    def drain_journal(self) -> Tuple[List[Dict], bool]:
+        """
+        Take the operations recorded since the last call.
+        
+        Returns:
+            Tuple of (operations in order, needs_snapshot). needs_snapshot is
+            True when the operations alone cannot reproduce the session (e.g.
+            after load_from_dict) and a full snapshot must be written.
+        """
+        ops, needs_snapshot = self._journal, self._journal_reset
+        self._journal = []
+        self._journal_reset = False
+        return ops, needs_snapshot
+
+    def reset_journal(self) -> None:
+        """Drop recorded operations and require a full snapshot on the next autosave."""
+        self._journal = []
+        self._journal_reset = True
+
+    def _rebuild_derived_state(self) -> None:
+        """Rebuild the search index and token totals from the current content."""
+        with self._index_lock:
+            self._search_index.clear()
+            self._unindexed.clear()
+        self._token_totals = {section: 0 for section in TOKEN_SECTIONS}
+        self._item_tokens.clear()
+        self._pending_tokens.clear()
+        self._mapped_items.clear()
+        self._preview_fragments.clear()
+        with self._render_lock:
+            self._render_cache.clear()
+            for section in self._render_generations:
+                self._render_generations[section] += 1
+        if self.prompt:
+            self._track_content(PROMPT_INDEX_KEY, "prompt", self.prompt)
+        for att in self.attachments:
+            if att.binary:
+                continue
+            if att.content_loaded:
+                self._track_content(att.id, "attachments", att.content)
+            else:
+                self._track_deferred(att.id, "attachments", att)
+        for resp in self.responses:
+            if resp.content_loaded:
+                self._track_content(resp.id, "responses", resp.content)
+            else:
+                self._track_deferred(resp.id, "responses", resp)
+
+    def _track_deferred(self, key: str, section: str, item: LazyContentMixin) -> None:
+        """
+        Queue derived state for content that has not been loaded yet.
+        
+        The item is indexed and token-counted in the background, from one
+        read_content() per item (derive_deferred), so its content is not
+        pinned in memory; until then searches read it transiently.
+        
+        Args:
+            key: Item key (attachment ID or response ID)
+            section: Token section ("attachments" or "responses")
+            item: Attachment or ResponseItem with deferred content
+        """
+        with self._index_lock:
+            self._unindexed[key] = item
+        self._pending_tokens[key] = (section, item)
+        mapped = item.content_mapped
+        if mapped is not None:
+            self._mapped_items[key] = (item, mapped.version)
+
+    @property
+    def has_unindexed_content(self) -> bool:
+        """Whether deferred content is still waiting to be indexed (see derive_deferred)."""
+        return bool(self._unindexed)
+
+    def pending_deferred_items(self, limit: int) -> Dict[str, LazyContentMixin]:
+        """
+        Snapshot up to limit deferred items not yet in the search index.
+        
+        Args:
+            limit: Largest snapshot (bounds the content read at once)
+            
+        Returns:
+            Dictionary mapping item key to item
+        """
+        with self._index_lock:
+            return dict(itertools.islice(self._unindexed.items(), limit))
+
+    def derive_deferred(
+        self, items: Dict[str, LazyContentMixin]
+    ) -> Dict[str, Tuple[FrozenSet[str], Optional[int]]]:
+        """
+        Read a snapshot from pending_deferred_items() once, for both search and tokens.
+        
+        Content is read without caching it on the items, so a lazily loaded
+        session stays lazy; safe to run in a worker thread.
+        
+        Args:
+            items: Dictionary mapping item key to deferred item
+            
+        Returns:
+            Dictionary mapping item key to (trigrams, token count or None if
+            the item's tokens are no longer pending)
+        """
+        keys = list(items)
+        texts = [items[key].read_content() for key in keys]
+        counted = [
+            i for i, key in enumerate(keys)
+            if self._pending_tokens.get(key, (None, None))[1] is items[key]
+        ]
+        tokens: List[Optional[int]] = [None] * len(keys)
+        counts = cached_token_counts(self._token_cache, [texts[i] for i in counted], DEFAULT_MODEL)
+        for i, count in zip(counted, counts):
+            tokens[i] = count
+        return {
+            key: (extract_trigrams(text.lower()), count)
+            for key, text, count in zip(keys, texts, tokens)
+        }
+
+    def apply_derived(
+        self,
+        items: Dict[str, LazyContentMixin],
+        derived: Dict[str, Tuple[FrozenSet[str], Optional[int]]],
+    ) -> None:
+        """
+        Fold derive_deferred() results into the search index and token totals.
+        
+        Items removed or replaced since the snapshot was taken are ignored.
+        
+        Args:
+            items: The snapshot passed to derive_deferred()
+            derived: Its result
+        """
+        with self._index_lock:
+            for key, (grams, _) in derived.items():
+                if self._unindexed.get(key) is items[key]:
+                    del self._unindexed[key]
+                    self._search_index.add_grams(key, grams)
+        counts = {key: tokens for key, (_, tokens) in derived.items() if tokens is not None}
+        self.apply_token_counts(items, counts)
+
+    def _index_candidates(self, query: str) -> Optional[Set[str]]:
+        """
+        Get the documents that may contain a query (see TrigramIndex.candidates).
+        
+        Deferred items not indexed yet are always candidates; searches read
+        them transiently to verify a match.
+        """
+        with self._index_lock:
+            candidates = self._search_index.candidates(query)
+            if candidates is not None and self._unindexed:
+                candidates |= self._unindexed.keys()
+            return candidates
+
+    @property
+    def has_mapped_attachments(self) -> bool:
+        """Whether any attachment is backed by a memory-mapped file."""
+        return bool(self._mapped_items)
+
+    def mapped_files(self) -> List[MappedText]:
+        """
+        List the mapped files of memory-mapped attachments.
+        
+        Nothing is read or stat'ed. Checking a file costs a stat and
+        re-mapping it decodes the whole file, so call MappedText.refresh() on
+        the result in a worker thread, then refresh_mapped_attachments() on
+        the event loop.
+        """
+        return [item.content_mapped for item, _ in self._mapped_items.values()]
+
+    def refresh_mapped_attachments(self) -> bool:
+        """
+        Refresh derived state of mapped attachments whose file was re-mapped.
+        
+        Attachments re-mapped since they were queued for indexing and token
+        counting (see mapped_files) are queued again, and their
+        previews and renders are dropped. Nothing is read. Call on the event
+        loop.
+        
+        Returns:
+            True if any attachment changed (token counts are pending again)
+        """
+        changed = False
+        for key, (item, version) in list(self._mapped_items.items()):
+            if item.content_mapped.version != version:
+                self._untrack_content(key)
+                self._track_deferred(key, "attachments", item)
+                changed = True
+        if changed:
+            self._invalidate_renders("attachments")
+        return changed
+
+    def _track_content(self, key: str, section: str, text: str) -> None:
+        """
+        Update derived state for new or replaced content.
+        
+        Args:
+            key: Item key (PROMPT_INDEX_KEY, attachment ID, or response ID)
+            section: Token section ("prompt", "attachments", or "responses")
+            text: Item content
+        """
+        with self._index_lock:
+            self._search_index.add(key, text)
+            self._unindexed.pop(key, None)
+        self._mapped_items.pop(key, None)
+        self._preview_fragments.pop(key, None)
+        self._untrack_tokens(key)
+        if not text:
+            self._item_tokens[key] = (section, 0)
+            return
+        cached = self._token_cache.get(token_cache_key(DEFAULT_MODEL, text))
+        if cached is None:
+            self._pending_tokens[key] = (section, text)
+        else:
+            self._item_tokens[key] = (section, cached)
+            self._token_totals[section] += cached
+
+    def _untrack_content(self, key: str) -> None:
+        """
+        Drop derived state for removed content.
+        
+        Args:
+            key: Item key (PROMPT_INDEX_KEY, attachment ID, or response ID)
+        """
+        with self._index_lock:
+            self._search_index.remove(key)
+            self._unindexed.pop(key, None)
+        self._mapped_items.pop(key, None)
+        self._preview_fragments.pop(key, None)
+        self._untrack_tokens(key)
+
+    def _invalidate_renders(self, section: str) -> None:
+        """
+        Drop memoized full renders of a section after it changes.
+        
+        Args:
+            section: "prompt", "attachments", or "responses"
+        """
+        with self._render_lock:
+            self._render_generations[section] += 1
+            for key in [key for key in self._render_cache if key[1] == section]:
+                del self._render_cache[key]
+
+    def _untrack_tokens(self, key: str) -> None:
+        """Remove an item's tokens from the running totals (or the pending queue)."""
+        self._pending_tokens.pop(key, None)
+        counted = self._item_tokens.pop(key, None)
+        if counted is not None:
+            section, tokens = counted
+            self._token_totals[section] -= tokens
 
     def get_session_summary(self) -> Dict:
         """
@@ -595,7 +1792,7 @@ class ScriptboardCore:
         """
         total_chars = (
             len(self.prompt) +
-            sum(len(att.content) for att in self.attachments if not att.binary) +
+            sum(att.char_count for att in self.attachments) +
             sum(r.char_count for r in self.responses)
         )
         
@@ -612,146 +1809,178 @@ class ScriptboardCore:
     # Token Counting
     # --------------------------------------------------------------------------- #
 
-    def estimate_tokens(self, text: str, model: str = "gpt-4") -> int:
+    def estimate_tokens(self, text: str, model: str = DEFAULT_MODEL) -> int:
         """
         Estimate token count for text using tiktoken.
         
+        The encoding is loaded once per model and reused across calls.
+        
         Args:
             text: Text to count tokens for
             model: Model identifier (default: "gpt-4")
             
         Returns:
-            Estimated token count
+            Estimated token count (len // 4 if tiktoken is unavailable)
         """
-        try:
-            import tiktoken
-            encoding = tiktoken.encoding_for_model(model)
-            return len(encoding.encode(text))
-        except Exception:
-            # Fallback: rough estimate (1 token ≈ 4 characters)
-            return len(text) // 4
+        return count_tokens_batch([text], model)[0]
 
     def get_token_counts(self) -> Dict:
         """
         Get token counts for prompt, attachments, and responses.
-        Uses caching to avoid recalculating unchanged content.
+        
+        Totals are maintained on every mutation, so this is O(1). Content
+        whose tokens have not been counted yet is excluded from the totals
+        and reported in `pending` (see count_pending_tokens).
         
         Returns:
-            Dictionary with tokenizer name and token counts
+            Dictionary with tokenizer name, token counts, and pending item count
         """
-        # Calculate prompt tokens
-        prompt_key = f"prompt_{hash(self.prompt)}"
-        if prompt_key not in self._token_cache:
-            self._token_cache[prompt_key] = self.estimate_tokens(self.prompt)
-        prompt_tokens = self._token_cache[prompt_key]
-        
-        # Calculate attachment tokens
-        attachment_tokens = 0
-        for att in self.attachments:
-            if not att.binary:
-                att_key = f"att_{att.id}_{hash(att.content)}"
-                if att_key not in self._token_cache:
-                    self._token_cache[att_key] = self.estimate_tokens(att.content)
-                attachment_tokens += self._token_cache[att_key]
-        
-        # Calculate response tokens
-        response_tokens = 0
-        for resp in self.responses:
-            resp_key = f"resp_{resp.id}_{hash(resp.content)}"
-            if resp_key not in self._token_cache:
-                self._token_cache[resp_key] = self.estimate_tokens(resp.content)
-            response_tokens += self._token_cache[resp_key]
-        
-        total_tokens = prompt_tokens + attachment_tokens + response_tokens
+        prompt_tokens = self._token_totals["prompt"]
+        attachment_tokens = self._token_totals["attachments"]
+        response_tokens = self._token_totals["responses"]
         
         return {
             "tokenizer": "tiktoken",
             "prompt_tokens": prompt_tokens,
             "attachment_tokens": attachment_tokens,
             "response_tokens": response_tokens,
-            "total_tokens": total_tokens,
+            "total_tokens": prompt_tokens + attachment_tokens + response_tokens,
+            "pending": len(self._pending_tokens),
         }
 
+    def get_token_matrix(self, models: List[str], approximate: bool = False) -> List[Dict]:
+        """
+        Get per-section token counts for several models at once.
+        
+        Models are counted in parallel and share the token cache, so only
+        content a model's tokenizer has not seen yet is encoded. Safe to call
+        from a worker thread.
+        
+        Args:
+            models: Model identifiers (e.g. ["gpt-4", "gpt-4o", "claude-3"]);
+                    models without a tiktoken encoding use the len // 4 estimate
+            approximate: Estimate very large documents from sampled slices
+            
+        Returns:
+            One dictionary per model with model, tokenizer, approximate,
+            prompt_tokens, attachment_tokens, response_tokens, and total_tokens
+        """
+        sections = {
+            "prompt_tokens": [self.prompt] if self.prompt else [],
+            "attachment_tokens": [att.read_content() for att in list(self.attachments) if not att.binary],
+            "response_tokens": [resp.read_content() for resp in list(self.responses)],
+        }
+        return token_count_matrix(self._token_cache, sections, models, approximate)
+
+    def pending_token_items(self) -> Dict[str, Union[str, LazyContentMixin]]:
+        """
+        Snapshot the content still waiting to be token-counted.
+        
+        Returns:
+            Dictionary mapping item key to content, or to the item itself if
+            its content is deferred (read by count_tokens_for)
+        """
+        return {key: text for key, (_, text) in self._pending_tokens.items()}
+
+    def count_tokens_for(self, items: Dict[str, Union[str, LazyContentMixin]]) -> Dict[str, int]:
+        """
+        Count tokens for a snapshot from pending_token_items().
+        
+        Touches only the token cache (and reads deferred content without
+        caching it), so it is safe to run in a worker thread.
+        
+        Args:
+            items: Dictionary mapping item key to content or deferred item
+            
+        Returns:
+            Dictionary mapping item key to token count
+        """
+        keys = list(items)
+        texts = [
+            items[key] if isinstance(items[key], str) else items[key].read_content()
+            for key in keys
+        ]
+        counts = cached_token_counts(self._token_cache, texts, DEFAULT_MODEL)
+        return dict(zip(keys, counts))
+
+    def apply_token_counts(self, items: Dict[str, str], counts: Dict[str, int]) -> None:
+        """
+        Fold counted tokens into the running totals.
+        
+        Items that were removed or replaced since the snapshot was taken are
+        ignored; their new content is still pending.
+        
+        Args:
+            items: The snapshot passed to count_tokens_for()
+            counts: Its result
+        """
+        for key, tokens in counts.items():
+            pending = self._pending_tokens.get(key)
+            if pending is None or pending[1] is not items.get(key):
+                continue
+            section = pending[0]
+            del self._pending_tokens[key]
+            self._item_tokens[key] = (section, tokens)
+            self._token_totals[section] += tokens
+
+    def count_pending_tokens(self) -> None:
+        """Synchronously count all pending content and update the totals."""
+        items = self.pending_token_items()
+        if items:
+            self.apply_token_counts(items, self.count_tokens_for(items))
+
     # --------------------------------------------------------------------------- #
     # Search Functionality
     # --------------------------------------------------------------------------- #
 
-    def search(self, query: str, limit: int = 20, offset: int = 0) -> Dict:
+    def search(
+        self,
+        query: str,
+        limit: int = 20,
+        offset: int = 0,
+        ranked: bool = False,
+        mode: SearchMode = SearchMode.EXACT,
+        time_budget: Optional[float] = None,
+        max_edits: Optional[int] = None,
+    ) -> Dict:
         """
-        Search across prompt, attachments, and responses with case-insensitive substring matching.
+        Search across prompt, attachments, and responses (case-insensitive).
         
         Args:
-            query: Search query string
+            query: Search query string (a regular expression in regex mode)
             limit: Maximum number of results to return
             offset: Number of results to skip (for pagination)
+            ranked: If True, order results by BM25 relevance and include every
+                    match offset per document (exact mode only, see _ranked_search)
+            mode: EXACT substring, REGEX pattern, or FUZZY approximate matching
+            time_budget: Seconds before a regex/fuzzy search stops and returns
+                         partial results (default: DEFAULT_SEARCH_TIME_BUDGET)
+            max_edits: Fuzzy mode edit distance (default: by query length)
             
         Returns:
-            Dictionary with query, total count, limit, offset, and list of SearchResultItem-like results
-        """
-        from schemas import SearchItemType
-        
-        query_lower = query.lower()
-        results = []
-        
-        # Search in prompt
-        if self.prompt and query_lower in self.prompt.lower():
-            # Find snippet around match
-            prompt_lower = self.prompt.lower()
-            idx = prompt_lower.find(query_lower)
-            start = max(0, idx - 50)
-            end = min(len(self.prompt), idx + len(query) + 50)
-            snippet = self.prompt[start:end]
-            if start > 0:
-                snippet = "..." + snippet
-            if end < len(self.prompt):
-                snippet = snippet + "..."
+            Dictionary with query, total count, limit, offset, timed_out flag,
+            and list of SearchResultItem-like results
             
-            results.append({
-                "id": None,
-                "type": SearchItemType.PROMPT,
-                "name": "Prompt",
-                "snippet": snippet,
-            })
+        Raises:
+            ValueError: If the regex is invalid or ranked is used with a non-exact mode
+        """
+        mode = SearchMode(mode)
+        if ranked:
+            if mode != SearchMode.EXACT:
+                raise ValueError("Ranked search is only supported in exact mode")
+            return self._ranked_search(query, limit=limit, offset=offset)
         
-        # Search in attachments
-        for att in self.attachments:
-            if not att.binary and query_lower in att.content.lower():
-                content_lower = att.content.lower()
-                idx = content_lower.find(query_lower)
-                start = max(0, idx - 50)
-                end = min(len(att.content), idx + len(query) + 50)
-                snippet = att.content[start:end]
-                if start > 0:
-                    snippet = "..." + snippet
-                if end < len(att.content):
-                    snippet = snippet + "..."
-                
-                results.append({
-                    "id": att.id,
-                    "type": SearchItemType.ATTACHMENT,
-                    "name": att.filename,
-                    "snippet": snippet,
-                })
+        deadline = None
+        if mode != SearchMode.EXACT:
+            deadline = time.monotonic() + (time_budget if time_budget is not None else DEFAULT_SEARCH_TIME_BUDGET)
         
-        # Search in responses
-        for resp in self.responses:
-            if query_lower in resp.content.lower():
-                content_lower = resp.content.lower()
-                idx = content_lower.find(query_lower)
-                start = max(0, idx - 50)
-                end = min(len(resp.content), idx + len(query) + 50)
-                snippet = resp.content[start:end]
-                if start > 0:
-                    snippet = "..." + snippet
-                if end < len(resp.content):
-                    snippet = snippet + "..."
-                
-                results.append({
-                    "id": resp.id,
-                    "type": SearchItemType.RESPONSE,
-                    "name": f"Response from {resp.source}",
-                    "snippet": snippet,
-                })
+        results = []
+        timed_out = False
+        try:
+            for result in self.iter_search(query, mode=mode, deadline=deadline, max_edits=max_edits):
+                results.append(result)
+        except SearchTimeoutError:
+            timed_out = True
         
         # Apply pagination
         total = len(results)
@@ -763,8 +1992,299 @@ class ScriptboardCore:
             "limit": limit,
             "offset": offset,
             "results": paginated_results,
+            "timed_out": timed_out,
         }
 
+    def iter_search(
+        self,
+        query: str,
+        mode: SearchMode = SearchMode.EXACT,
+        deadline: Optional[float] = None,
+        max_edits: Optional[int] = None,
+        heartbeat: Optional[int] = None,
+    ) -> Iterator[Optional[Dict]]:
+        """
+        Lazily yield first-hit search results as documents are scanned.
+        
+        Documents are scanned one at a time in display order, so callers can
+        stop consuming (e.g. once a page is full) without scanning the rest.
+        
+        Args:
+            query: Search query string (a regular expression in regex mode)
+            mode: EXACT substring, REGEX pattern, or FUZZY approximate matching
+            deadline: time.monotonic() deadline, or None for no limit
+            max_edits: Fuzzy mode edit distance (default: by query length)
+            heartbeat: If set, also yield None after every `heartbeat`
+                       documents scanned without a match, so a consumer gets
+                       control back (e.g. to notice a dropped client) even
+                       while nothing matches
+            
+        Yields:
+            SearchResultItem-like dictionaries (and None heartbeats)
+            
+        Raises:
+            ValueError: If the regex is invalid
+            SearchTimeoutError: If the deadline passes mid-scan
+        """
+        mode = SearchMode(mode)
+        candidates, find = self._build_matcher(query, mode, deadline, max_edits)
+        query_lower = query.lower()
+        unmatched = 0
+        # Exact matches are found in mapped files chunk by chunk, without decoding them whole
+        documents = self._iter_search_documents(candidates, mapped=(mode == SearchMode.EXACT))
+        for doc_id, item_type, name, content in documents:
+            check_deadline(deadline)
+            if isinstance(content, MappedText):
+                count, _, snippet = find_in_chunks(
+                    content.iter_text(), query_lower, SNIPPET_CONTEXT_CHARS, max_matches=1
+                )
+                span = (0, 0) if count else None
+            else:
+                span = find(content)
+                if span is not None:
+                    snippet = self._snippet_at(content, span[0], span[1] - span[0])
+            if span is not None:
+                unmatched = 0
+                yield {
+                    "id": doc_id,
+                    "type": item_type,
+                    "name": name,
+                    "snippet": snippet,
+                }
+            elif heartbeat:
+                unmatched += 1
+                if unmatched >= heartbeat:
+                    unmatched = 0
+                    yield None
+
+    def _build_matcher(
+        self,
+        query: str,
+        mode: SearchMode,
+        deadline: Optional[float],
+        max_edits: Optional[int],
+    ) -> Tuple[Optional[Set[str]], Callable[[str], Optional[Tuple[int, int]]]]:
+        """
+        Pick the candidate documents and the per-document match function for a mode.
+        
+        Args:
+            query: Search query string
+            mode: Search mode
+            deadline: time.monotonic() deadline, or None for no limit
+            max_edits: Fuzzy mode edit distance (default: by query length)
+            
+        Returns:
+            (candidate index keys or None for all documents, find function
+            returning the (start, end) span of the first match or None)
+        """
+        query_lower = query.lower()
+        
+        if mode == SearchMode.REGEX:
+            pattern = compile_pattern(query)
+            return None, lambda content: regex_find(pattern, content, deadline)
+        
+        if mode == SearchMode.FUZZY:
+            if not query_lower:
+                return set(), lambda content: None
+            edits = default_max_edits(len(query_lower)) if max_edits is None else max(0, max_edits)
+            # A fuzzy match contains at least one piece verbatim, so a document
+            # must contain one of them; pieces under a trigram can't use the index
+            candidates: Optional[Set[str]] = set()
+            for _, piece in split_pieces(query_lower, edits):
+                piece_candidates = self._index_candidates(piece)
+                if piece_candidates is None:
+                    candidates = None
+                    break
+                candidates |= piece_candidates
+            return candidates, lambda content: fuzzy_find(content.lower(), query_lower, edits, deadline)
+        
+        def find_exact(content: str) -> Optional[Tuple[int, int]]:
+            idx = content.lower().find(query_lower)
+            return (idx, idx + len(query_lower)) if idx != -1 else None
+        
+        return self._index_candidates(query), find_exact
+
+    def _ranked_search(self, query: str, limit: int = 20, offset: int = 0) -> Dict:
+        """
+        Search with BM25 ranking and per-document match offsets.
+        
+        The whole query is scored as a single phrase term. Documents are first
+        scored from their match counts alone, reading one document at a time;
+        only the keys and counts of the top offset+limit are kept (heap
+        selection), and match offsets are collected for the requested page
+        only, reading those documents again.
+        
+        Args:
+            query: Search query string
+            limit: Maximum number of results to return
+            offset: Number of results to skip (for pagination)
+            
+        Returns:
+            Same shape as search() (timed_out is always False), with score,
+            match_count and matches (character offsets, capped at
+            MAX_MATCH_OFFSETS) on each result
+        """
+        query_lower = query.lower()
+        if not query_lower:
+            return {"query": query, "total": 0, "limit": limit, "offset": offset, "results": [], "timed_out": False}
+        
+        doc_count, avg_doc_len = self._search_document_stats()
+        
+        # Pass 1: term frequency per matching document (non-overlapping, like the
+        # offsets). The matching document count is only known at the end, but
+        # IDF is the same positive factor for every document, so ranking with a
+        # placeholder count gives the final order
+        total = 0
+        
+        def scored() -> Iterator[Tuple[float, Tuple, int, int]]:
+            nonlocal total
+            candidates = self._index_candidates(query)
+            for doc_id, item_type, name, content in self._iter_search_documents(candidates, mapped=True):
+                if isinstance(content, MappedText):
+                    tf = find_in_chunks(content.iter_text(), query_lower, 0, max_offsets=0)[0]
+                    doc_len = content.chars
+                else:
+                    tf = content.lower().count(query_lower)
+                    doc_len = len(content)
+                if tf:
+                    total += 1
+                    provisional = bm25_score(tf, doc_len, avg_doc_len, doc_count, 1)
+                    yield provisional, (doc_id, item_type, name), tf, doc_len
+        
+        # nlargest is stable, so equal scores keep prompt/attachment/response order
+        page = heapq.nlargest(offset + limit, scored(), key=lambda item: item[0])[offset:]
+        
+        # Pass 2: match offsets and snippets for the requested page only
+        keys = {PROMPT_INDEX_KEY if doc_id is None else doc_id for _, (doc_id, _, _), _, _ in page}
+        found = {}
+        for doc_id, _, _, content in self._iter_search_documents(keys, mapped=True):
+            if isinstance(content, MappedText):
+                _, matches, snippet = find_in_chunks(
+                    content.iter_text(), query_lower, SNIPPET_CONTEXT_CHARS,
+                    max_matches=MAX_MATCH_OFFSETS,
+                )
+            else:
+                matches = self._match_offsets(content, query_lower)
+                snippet = self._snippet_at(content, matches[0], len(query_lower)) if matches else ""
+            if matches:
+                found[doc_id] = (matches, snippet)
+        
+        results = []
+        for _, (doc_id, item_type, name), tf, doc_len in page:
+            if doc_id not in found:
+                continue  # Content replaced between the passes (worker-thread search)
+            matches, snippet = found[doc_id]
+            results.append({
+                "id": doc_id,
+                "type": item_type,
+                "name": name,
+                "snippet": snippet,
+                "score": round(bm25_score(tf, doc_len, avg_doc_len, doc_count, total), 6),
+                "match_count": tf,
+                "matches": matches,
+            })
+        
+        return {
+            "query": query,
+            "total": total,
+            "limit": limit,
+            "offset": offset,
+            "results": results,
+            "timed_out": False,  # Exact matching has no time budget
+        }
+
+    def _iter_search_documents(
+        self, candidates: Optional[Set[str]], mapped: bool = False
+    ) -> Iterator[Tuple[Optional[str], str, str, Union[str, MappedText]]]:
+        """
+        Yield searchable documents, in display order.
+        
+        Deferred content is read without caching it on the item, so searching
+        a lazily loaded session does not keep its content in memory.
+        
+        Args:
+            candidates: Search index keys of documents that may match, or None
+                        to yield every document
+            mapped: Yield the MappedText of memory-mapped attachments instead
+                    of decoding it (for find_in_chunks)
+            
+        Yields:
+            (id, SearchItemType, display name, content) tuples
+        """
+        from schemas import SearchItemType
+        
+        def is_candidate(key: str) -> bool:
+            return candidates is None or key in candidates
+        
+        if self.prompt and is_candidate(PROMPT_INDEX_KEY):
+            yield None, SearchItemType.PROMPT, "Prompt", self.prompt
+        
+        for att in self.attachments:
+            if not att.binary and is_candidate(att.id):
+                source = att.content_mapped if mapped else None
+                yield att.id, SearchItemType.ATTACHMENT, att.filename, source if source is not None else att.read_content()
+        
+        for resp in self.responses:
+            if is_candidate(resp.id):
+                yield resp.id, SearchItemType.RESPONSE, f"Response from {resp.source}", resp.read_content()
+
+    def _search_document_stats(self) -> Tuple[int, float]:
+        """
+        Get the number of searchable documents and their average length in characters.
+        
+        Returns:
+            (document count, average document length) tuple
+        """
+        lengths = [len(self.prompt)] if self.prompt else []
+        lengths.extend(att.char_count for att in self.attachments if not att.binary)
+        lengths.extend(resp.char_count for resp in self.responses)
+        if not lengths:
+            return 0, 0.0
+        return len(lengths), sum(lengths) / len(lengths)
+
+    @staticmethod
+    def _match_offsets(content: str, query_lower: str) -> List[int]:
+        """
+        Find non-overlapping case-insensitive match offsets.
+        
+        Args:
+            content: Document text to search
+            query_lower: Lowercased, non-empty query string
+            
+        Returns:
+            Character offsets of matches, at most MAX_MATCH_OFFSETS of them
+        """
+        content_lower = content.lower()
+        offsets = []
+        idx = content_lower.find(query_lower)
+        while idx != -1 and len(offsets) < MAX_MATCH_OFFSETS:
+            offsets.append(idx)
+            idx = content_lower.find(query_lower, idx + len(query_lower))
+        return offsets
+
+    @staticmethod
+    def _snippet_at(content: str, idx: int, match_len: int, context: int = SNIPPET_CONTEXT_CHARS) -> str:
+        """
+        Build a snippet around a match.
+        
+        Args:
+            content: Document text
+            idx: Offset of the match
+            match_len: Length of the match
+            context: Characters of context to keep on each side of the match
+            
+        Returns:
+            Snippet with "..." markers where truncated
+        """
+        start = max(0, idx - context)
+        end = min(len(content), idx + match_len + context)
+        snippet = content[start:end]
+        if start > 0:
+            snippet = "..." + snippet
+        if end < len(content):
+            snippet = snippet + "..."
+        return snippet
+
     # --------------------------------------------------------------------------- #
     # Batch Queue Operations (Phase-2)
     # --------------------------------------------------------------------------- #
@@ -0,0 +1,558 @@
+"""
+Threaded folder import for /attachments/folder.
+
+The folder is walked with os.scandir (one stat per entry, reused for size
+and mtime) and files are read on a thread pool with a bounded number of
+reads in flight, so a large tree neither blocks the event loop nor queues
+tens of thousands of reads at once. Text files are sniffed for NUL bytes in
+their first SNIFF_BYTES only; files with other extensions are imported as
+binary metadata without being read.
+
+Results are produced in walk order (entries sorted by name within each
+directory), so repeated imports of the same tree give the same attachment
+order. Setting the cancel event stops the walk and drops pending reads.
+
+What gets imported is controlled by ImportOptions:
+
+- Directories named in SKIP_DIRS (node_modules, .git, build outputs, ...)
+  and directories matched by .gitignore/.ignore files or exclude globs are
+  pruned: they are never listed, so their contents cost no I/O at all.
+- .gitignore and .ignore files are read as the walk reaches them and apply
+  to their own directory and below, with git's pattern syntax (negation,
+  anchoring, trailing "/" for directories, "**"). Rules from deeper files,
+  and from .ignore over .gitignore, take precedence.
+- Include globs (same syntax) restrict which files are imported.
+- Text files of map_threshold bytes or more are memory-mapped (see
+  mapped_file) rather than read into memory, up to max_mapped_bytes.
+- Other text files over max_file_bytes, and mapped files over
+  max_mapped_bytes, are skipped without being read, and the import stops
+  once the text imported would exceed max_total_bytes or max_tokens.
+
+Given the manifest of a previous import, files whose mtime and size are
+unchanged are reported as unchanged without being read, which is what makes
+re-syncing an imported folder cheap.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, FrozenSet, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from mapped_file import MAP_THRESHOLD_BYTES, MappedText
+
+TEXT_EXTENSIONS = frozenset({
+    ".txt", ".py", ".js", ".ts", ".tsx", ".jsx", ".json", ".md", ".yml", ".yaml",
+    ".xml", ".html", ".css", ".scss", ".sql", ".sh", ".bat", ".ps1",
+})
+
+# Directory names never descended into (also used by /git/scan)
+SKIP_DIRS = frozenset({
+    "node_modules", ".git", "__pycache__", "venv", ".venv",
+    "env", ".env", "dist", "build", ".next", "target",
+    ".cargo", ".rustup",
+})
+
+# Ignore files read in every directory, lowest precedence first
+IGNORE_FILES = (".gitignore", ".ignore")
+
+# Bytes checked for NUL before a text file is read in full
+SNIFF_BYTES = 8192
+
+# Default per-file cap: larger text files are skipped without being read
+MAX_FILE_BYTES = 1024 * 1024
+
+# Default cap for memory-mapped files: mapping avoids holding the text, but
+# it is still decoded to count lines and to search, so huge dumps are skipped
+MAX_MAPPED_BYTES = 64 * 1024 * 1024
+
+# Reader threads per import
+IMPORT_WORKERS = 8
+
+# Reads submitted ahead of the consumer, per worker
+IMPORT_READ_AHEAD = 4
+
+# Imported files are marked by status: "text", "binary" (metadata only),
+# "skipped" (binary content in a text file, too large, over budget, or
+# unreadable), or "unchanged" (same mtime and size as in the manifest; not read)
+STATUS_TEXT = "text"
+STATUS_BINARY = "binary"
+STATUS_SKIPPED = "skipped"
+STATUS_UNCHANGED = "unchanged"
+
+# Error of the record that would have exceeded a total byte or token budget;
+# it is the last record an import yields
+BUDGET_EXHAUSTED = "budget exhausted"
+
+
+@dataclass
+class ImportedFile:
+    """One file found by a folder import."""
+
+    path: str
+    rel_path: str
+    size: int
+    mtime_ns: int
+    status: str
+    content: Optional[str] = None
+    error: Optional[str] = None
+    tokens: Optional[int] = None
+    hash: Optional[str] = None  # content_hash() of the raw bytes, for text files that were read
+    mapped: Optional[MappedText] = None  # Set instead of content for mapped text files
+    text: bool = False  # STATUS_UNCHANGED only: recorded as a text file (counts against budgets)
+
+
+@dataclass
+class ImportOptions:
+    """
+    Filters and limits for a folder import.
+
+    Args:
+        include: Globs a file must match one of (empty imports everything)
+        exclude: Globs of files and directories to leave out
+        use_ignore_files: Honour .gitignore and .ignore files
+        skip_dirs: Directory names never descended into
+        max_file_bytes: Skip larger text files that are not mapped (None for no cap)
+        max_mapped_bytes: Skip larger text files that would be mapped (None for no cap)
+        max_total_bytes: Stop once imported text would exceed this many bytes
+        max_tokens: Stop once imported text would exceed this many tokens
+        map_threshold: Memory-map text files at least this large (None never maps)
+    """
+
+    include: Sequence[str] = ()
+    exclude: Sequence[str] = ()
+    use_ignore_files: bool = True
+    skip_dirs: FrozenSet[str] = SKIP_DIRS
+    max_file_bytes: Optional[int] = MAX_FILE_BYTES
+    max_mapped_bytes: Optional[int] = MAX_MAPPED_BYTES
+    max_total_bytes: Optional[int] = None
+    max_tokens: Optional[int] = None
+    map_threshold: Optional[int] = MAP_THRESHOLD_BYTES
+
+    def to_dict(self) -> Dict:
+        """Serialize to a JSON-compatible dictionary (stored with folder manifests)."""
+        return {
+            "include": list(self.include),
+            "exclude": list(self.exclude),
+            "use_ignore_files": self.use_ignore_files,
+            "skip_dirs": sorted(self.skip_dirs),
+            "max_file_bytes": self.max_file_bytes,
+            "max_mapped_bytes": self.max_mapped_bytes,
+            "max_total_bytes": self.max_total_bytes,
+            "max_tokens": self.max_tokens,
+            "map_threshold": self.map_threshold,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ImportOptions":
+        """Deserialize from dictionary (missing fields use defaults)."""
+        options = cls()
+        options.include = list(data.get("include", ()))
+        options.exclude = list(data.get("exclude", ()))
+        options.use_ignore_files = data.get("use_ignore_files", True)
+        if "skip_dirs" in data:
+            options.skip_dirs = frozenset(data["skip_dirs"])
+        options.max_file_bytes = data.get("max_file_bytes", MAX_FILE_BYTES)
+        options.max_mapped_bytes = data.get("max_mapped_bytes", MAX_MAPPED_BYTES)
+        options.max_total_bytes = data.get("max_total_bytes")
+        options.max_tokens = data.get("max_tokens")
+        options.map_threshold = data.get("map_threshold", MAP_THRESHOLD_BYTES)
+        return options
+
+
+def content_hash(data: bytes) -> str:
+    """Hash file content for change detection (BLAKE2b, 128 bits, hex)."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def glob_to_regex(pattern: str) -> str:
+    """
+    Translate a gitignore-style glob (without "!" or a trailing "/") to a regex.
+
+    Patterns without a "/" match at any depth; others are anchored at the
+    base directory. "**" matches any number of directories.
+
+    Args:
+        pattern: Glob pattern
+
+    Returns:
+        Regular expression matching whole relative paths
+    """
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+    out = []
+    i = 0
+    n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith("**/", i) and (i == 0 or pattern[i - 1] == "/"):
+            out.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif c == "*":
+            out.append("[^/]*")
+            i += 1
+        elif c == "?":
+            out.append("[^/]")
+            i += 1
+        elif c == "[":
+            end = pattern.find("]", i + 2)
+            if end == -1:
+                out.append(re.escape(c))
+                i += 1
+                continue
+            body = pattern[i + 1:end]
+            if body[0] in "!^":
+                body = "^" + body[1:]
+            out.append(f"[{body.replace(chr(92), chr(92) * 2)}]")
+            i = end + 1
+        elif c == "\\" and i + 1 < n:
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(c))
+            i += 1
+    prefix = "" if anchored else "(?:.*/)?"
+    return f"{prefix}{''.join(out)}"
+
+
+class IgnoreRules:
+    """
+    Compiled gitignore-style patterns relative to a base directory.
+
+    Each rule is compiled once; a combined regex of every rule answers the
+    common "nothing matches" case with a single search.
+    """
+
+    def __init__(self, patterns: Iterable[str], base: str = "") -> None:
+        self.base = base
+        self._rules: List[Tuple["re.Pattern", bool, bool]] = []  # (regex, negated, directories only)
+        sources = []
+        for line in patterns:
+            line = line.rstrip("\n\r")
+            if line.endswith(" ") and not line.endswith("\\ "):
+                line = line.rstrip(" ")
+            if not line or line.startswith("#"):
+                continue
+            negated = line.startswith("!")
+            if negated or line.startswith("\\!") or line.startswith("\\#"):
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            if not line:
+                continue
+            source = glob_to_regex(line)
+            sources.append(source)
+            self._rules.append((re.compile(f"{source}$", re.DOTALL), negated, dir_only))
+        self._any = re.compile(f"(?:{'|'.join(sources)})$", re.DOTALL) if sources else None
+
+    @classmethod
+    def from_file(cls, path: str, base: str = "") -> "IgnoreRules":
+        """Read rules from an ignore file (unreadable files give no rules)."""
+        try:
+            with open(path, encoding="utf-8", errors="ignore") as f:
+                return cls(f.read().splitlines(), base)
+        except OSError:
+            return cls((), base)
+
+    def __bool__(self) -> bool:
+        return self._any is not None
+
+    def match(self, rel_path: str, is_dir: bool) -> Optional[bool]:
+        """
+        Match a path against the rules; the last matching rule wins.
+
+        Args:
+            rel_path: Path relative to the import root, "/"-separated
+            is_dir: Whether the path is a directory
+
+        Returns:
+            True if ignored, False if re-included by a "!" rule, None if no
+            rule matches
+        """
+        if self._any is None or not rel_path.startswith(self.base):
+            return None
+        rel_path = rel_path[len(self.base):]
+        if not self._any.match(rel_path):
+            return None
+        for regex, negated, dir_only in reversed(self._rules):
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel_path):
+                return not negated
+        return None
+
+
+def _ignored(rules: Sequence[IgnoreRules], rel_path: str, is_dir: bool) -> bool:
+    for ruleset in reversed(rules):
+        matched = ruleset.match(rel_path, is_dir)
+        if matched is not None:
+            return matched
+    return False
+
+
+def walk_files(
+    root: str,
+    cancel: Optional[threading.Event] = None,
+    options: Optional[ImportOptions] = None,
+) -> Iterator[Tuple[str, str, os.stat_result]]:
+    """
+    Walk a folder depth-first with os.scandir, pruning filtered directories.
+
+    Symlinked directories are not followed. Directories that cannot be
+    listed are skipped.
+
+    Args:
+        root: Folder to walk
+        cancel: Stops the walk when set
+        options: Filters (default: ImportOptions())
+
+    Yields:
+        (absolute path, path relative to root using "/", stat result) per file
+    """
+    options = options or ImportOptions()
+    exclude = IgnoreRules(options.exclude)
+    include = IgnoreRules(options.include)
+    stack: List[Tuple[str, str, Tuple[IgnoreRules, ...]]] = [(root, "", ())]
+    while stack:
+        if cancel is not None and cancel.is_set():
+            return
+        directory, rel_dir, rules = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+
+        if options.use_ignore_files:
+            names = {entry.name: entry.path for entry in entries}
+            loaded = [IgnoreRules.from_file(names[name], rel_dir) for name in IGNORE_FILES if name in names]
+            rules = rules + tuple(ruleset for ruleset in loaded if ruleset)
+        if exclude:
+            rules = rules + (exclude,)  # Exclude globs take precedence over ignore files
+
+        subdirs = []
+        for entry in entries:
+            rel_path = f"{rel_dir}{entry.name}"
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name in options.skip_dirs or _ignored(rules, rel_path, True):
+                        continue
+                    subdirs.append((entry.path, f"{rel_path}/", rules))
+                elif entry.is_file():
+                    if _ignored(rules, rel_path, False):
+                        continue
+                    if include and not include.match(rel_path, False):
+                        continue
+                    yield entry.path, rel_path, entry.stat()
+            except OSError:
+                continue
+        # Reversed so the stack pops subdirectories in name order
+        stack.extend(reversed(subdirs))
+
+
+def read_text_file(path: str, sniff_bytes: int = SNIFF_BYTES) -> Optional[str]:
+    """
+    Read a file as UTF-8 text unless it looks binary.
+
+    Args:
+        path: File path
+        sniff_bytes: Leading bytes checked for NUL
+
+    Returns:
+        The decoded text (undecodable bytes dropped), or None if a NUL byte
+        appears in the first sniff_bytes
+    """
+    data = _read_unless_binary(path, sniff_bytes)
+    return None if data is None else data.decode("utf-8", errors="ignore")
+
+
+def _read_unless_binary(path: str, sniff_bytes: int = SNIFF_BYTES) -> Optional[bytes]:
+    with open(path, "rb") as f:
+        head = f.read(sniff_bytes)
+        if b"\x00" in head:
+            return None
+        return head + f.read()
+
+
+def _load(
+    path: str,
+    rel_path: str,
+    st: os.stat_result,
+    options: ImportOptions,
+    count_tokens: Optional[Callable[[str], int]],
+) -> ImportedFile:
+    ext = os.path.splitext(rel_path)[1]
+    record = ImportedFile(path=path, rel_path=rel_path, size=st.st_size, mtime_ns=st.st_mtime_ns, status=STATUS_SKIPPED)
+    if ext.lower() not in TEXT_EXTENSIONS and ext != "":
+        record.status = STATUS_BINARY
+        return record
+    mapped = options.map_threshold is not None and st.st_size >= options.map_threshold
+    # Mapped files have their own, larger cap
+    limit = options.max_mapped_bytes if mapped else options.max_file_bytes
+    if limit is not None and st.st_size > limit:
+        record.error = f"larger than {limit} bytes"
+        return record
+    try:
+        if mapped:
+            with open(path, "rb") as f:
+                if b"\x00" in f.read(SNIFF_BYTES):
+                    return record
+            record.mapped = MappedText(path)
+            record.status = STATUS_TEXT
+            if count_tokens is not None:
+                record.tokens = count_tokens(record.mapped.read_text())
+            return record
+        data = _read_unless_binary(path)
+    except (OSError, ValueError) as e:
+        record.error = str(e)
+        return record
+    if data is not None:
+        content = data.decode("utf-8", errors="ignore")
+        record.status = STATUS_TEXT
+        record.content = content
+        record.hash = content_hash(data)
+        if count_tokens is not None:
+            record.tokens = count_tokens(content)
+    return record
+
+
+def iter_import(
+    root: str,
+    workers: int = IMPORT_WORKERS,
+    cancel: Optional[threading.Event] = None,
+    options: Optional[ImportOptions] = None,
+    count_tokens: Optional[Callable[[str], int]] = None,
+    manifest: Optional[Dict[str, Dict]] = None,
+) -> Iterator[ImportedFile]:
+    """
+    Walk a folder and read its files on a thread pool.
+
+    At most workers * IMPORT_READ_AHEAD reads are in flight; results are
+    yielded in walk order. Closing the iterator (or setting cancel) stops
+    the walk and cancels reads that have not started.
+
+    Budgets are applied in walk order: the first text file that would
+    exceed one is yielded as skipped with error BUDGET_EXHAUSTED, and the
+    import ends there. Unchanged text files count with the size and tokens
+    recorded in the manifest, so a sync stops where the import did.
+
+    Args:
+        root: Folder to import
+        workers: Reader threads
+        cancel: Stops the import when set
+        options: Filters and limits (default: ImportOptions())
+        count_tokens: Token counter, called on the reader threads; required
+                      for options.max_tokens
+        manifest: Entries ({"mtime_ns", "size", "text", "tokens", ...}) by
+                  relative path from a previous import; matching files are
+                  yielded as STATUS_UNCHANGED without being read (except the
+                  file a budget stopped at, marked "budget_exhausted")
+
+    Yields:
+        ImportedFile per file
+    """
+    options = options or ImportOptions()
+    if options.max_tokens is None:
+        count_tokens = None
+    elif count_tokens is None:
+        raise ValueError("max_tokens requires a token counter")
+    total_bytes = 0
+    total_tokens = 0
+
+    def within_budget(record: ImportedFile) -> bool:
+        nonlocal total_bytes, total_tokens
+        if record.status != STATUS_TEXT and not (record.status == STATUS_UNCHANGED and record.text):
+            return True
+        if options.max_total_bytes is not None and total_bytes + record.size > options.max_total_bytes:
+            return False
+        if options.max_tokens is not None and total_tokens + record.tokens > options.max_tokens:
+            return False
+        total_bytes += record.size
+        total_tokens += record.tokens or 0
+        return True
+
+    def exhausted(record: ImportedFile) -> ImportedFile:
+        record.status = STATUS_SKIPPED
+        record.content = None
+        record.mapped = None
+        record.error = BUDGET_EXHAUSTED
+        return record
+
+    window = max(1, workers) * IMPORT_READ_AHEAD
+    pending: Deque[Future] = deque()
+    pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="folder-import")
+    try:
+        for path, rel_path, st in walk_files(root, cancel, options):
+            entry = manifest.get(rel_path) if manifest is not None else None
+            if (
+                entry is not None
+                and not entry.get("budget_exhausted")
+                and entry.get("mtime_ns") == st.st_mtime_ns
+                and entry.get("size") == st.st_size
+            ):
+                unchanged: Future = Future()
+                unchanged.set_result(ImportedFile(
+                    path=path,
+                    rel_path=rel_path,
+                    size=st.st_size,
+                    mtime_ns=st.st_mtime_ns,
+                    status=STATUS_UNCHANGED,
+                    tokens=entry.get("tokens"),
+                    text=bool(entry.get("text")),
+                ))
+                pending.append(unchanged)
+            else:
+                pending.append(pool.submit(_load, path, rel_path, st, options, count_tokens))
+            if len(pending) >= window:
+                record = pending.popleft().result()
+                if not within_budget(record):
+                    yield exhausted(record)
+                    return
+                yield record
+            if cancel is not None and cancel.is_set():
+                return
+        while pending:
+            if cancel is not None and cancel.is_set():
+                return
+            record = pending.popleft().result()
+            if not within_budget(record):
+                yield exhausted(record)
+                return
+            yield record
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def next_batch(files: Iterator[ImportedFile], max_files: int, max_wait: float) -> List[ImportedFile]:
+    """
+    Take the next batch of results from iter_import().
+
+    Meant to run in a worker thread: the event loop applies one batch while
+    the next one is read, and gets a progress update at least every
+    max_wait seconds (unless a single file takes longer).
+
+    Args:
+        files: Iterator from iter_import()
+        max_files: Largest batch
+        max_wait: Seconds after which a partial batch is returned
+
+    Returns:
+        Up to max_files results; empty once the import is finished
+    """
+    batch: List[ImportedFile] = []
+    deadline = time.monotonic() + max_wait
+    for record in files:
+        batch.append(record)
+        if len(batch) >= max_files or time.monotonic() >= deadline:
+            break
+    return batch
@@ -0,0 +1,206 @@
+"""
+Memory-mapped text files for large attachments.
+
+A MappedText keeps a read-only mmap of a file instead of its decoded text.
+Line and character counts are computed once, in a single chunked pass, so
+listing attachments never touches the content. Text is decoded only when
+read: all of it (read_text), in chunks (iter_text, for streaming exports),
+or just the first few lines (read_prefix, for previews). Decoded text is
+never kept, so resident memory stays close to the pages the OS chooses to
+cache rather than growing with every large file attached.
+
+The mapping follows the file: when it changes (a log being appended to,
+rotated, or replaced), refresh() maps it again, recomputes the counts, and
+bumps `version` so owners can refresh what they derived from the text
+(ScriptboardCore.refresh_mapped_attachments). Re-mapping decodes the whole
+file, so owners on an event loop check is_stale() (one stat) there and call
+refresh() in a worker thread. Reads never re-map: until refresh() they
+serve the current mapping, stopping at the file's new end if it was
+truncated in place (pages past it would fault). A file that disappears
+keeps serving the mapping taken earlier.
+
+Mapping is meant for POSIX systems: on Windows an open mapping keeps the
+file from being replaced or rotated, so files are only mapped there when a
+caller asks for it explicitly (MAP_THRESHOLD_BYTES is None).
+"""
+
+from __future__ import annotations
+
+import codecs
+import mmap
+import os
+import threading
+from typing import Iterator, Optional, Tuple
+
+# Text files at least this large are attached as memory-mapped files (None:
+# only on request, on Windows, where a mapped file cannot be replaced)
+MAP_THRESHOLD_BYTES: Optional[int] = 1024 * 1024 if os.name != "nt" else None
+
+# Bytes decoded per step when counting or streaming
+MAP_CHUNK_BYTES = 1024 * 1024
+
+# Longest prefix read_prefix() decodes, however long the lines are
+PREFIX_MAX_BYTES = 64 * 1024
+
+
+def _count(view: Optional[mmap.mmap]) -> Tuple[int, int]:
+    """Count lines (as content.count("\\n") + 1) and characters of a mapping."""
+    if view is None:
+        return 0, 0
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    newlines = 0
+    chars = 0
+    for start in range(0, len(view), MAP_CHUNK_BYTES):
+        chunk = view[start:start + MAP_CHUNK_BYTES]
+        newlines += chunk.count(b"\n")
+        chars += len(decoder.decode(chunk))
+    chars += len(decoder.decode(b"", final=True))
+    return newlines + 1, chars
+
+
+class MappedText:
+    """
+    Read-only, lazily decoded view of a UTF-8 text file.
+
+    Undecodable bytes are dropped, as when a file is read with
+    errors="ignore".
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Map a file and count its lines and characters.
+
+        Args:
+            path: Text file to map
+
+        Raises:
+            OSError: If the file cannot be opened or mapped
+        """
+        self.path = os.path.abspath(path)
+        self._lock = threading.Lock()  # Guards the mapping and its counts, held only to swap them
+        self._refresh_lock = threading.Lock()  # Serializes re-mapping
+        self._map: Optional[mmap.mmap] = None
+        self._signature: Optional[Tuple[int, int, int]] = None  # (size, mtime_ns, inode)
+        self.size = 0
+        self.lines = 0
+        self.chars = 0
+        self.version = 0  # Incremented on every (re-)mapping, so owners can tell the content changed
+        self._remap()
+
+    def _remap(self) -> None:
+        """Map and count the file, then swap the new state in (readers only wait for the swap)."""
+        with open(self.path, "rb") as f:
+            st = os.fstat(f.fileno())
+            # Empty files cannot be mapped
+            view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if st.st_size else None
+        lines, chars = _count(view)
+        # The old mapping is not closed here: a reader on another thread may
+        # still be using it, and it is released once no longer referenced
+        with self._lock:
+            self._map, self.size, self.lines, self.chars = view, st.st_size, lines, chars
+            self._signature = (st.st_size, st.st_mtime_ns, st.st_ino)
+            self.version += 1
+
+    def _view(self) -> Tuple[Optional[mmap.mmap], int]:
+        """
+        Get the current mapping and how many of its bytes are safe to read.
+
+        A file truncated in place since it was mapped would fault on pages
+        past its new end, so reads stop there until refresh() maps it again.
+        A replaced file keeps its old inode (and mapping) alive.
+        """
+        with self._lock:
+            view, signature = self._map, self._signature
+        if view is None:
+            return None, 0
+        limit = len(view)
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return view, limit  # Keep serving the existing mapping
+        if st.st_ino == signature[2] and st.st_size < limit:
+            limit = st.st_size
+        return view, limit
+
+    def is_stale(self) -> bool:
+        """Whether the file changed since it was mapped (one stat; False if it is gone)."""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return False
+        return (st.st_size, st.st_mtime_ns, st.st_ino) != self._signature
+
+    def refresh(self) -> None:
+        """
+        Re-map the file if it changed, updating size, lines, and chars.
+
+        Decodes the whole file to count it; readers keep using the current
+        mapping meanwhile.
+        """
+        with self._refresh_lock:
+            if self.is_stale():
+                self._remap()
+
+    def read_text(self) -> str:
+        """Decode the whole file."""
+        view, limit = self._view()
+        return view[:limit].decode("utf-8", errors="ignore") if view is not None else ""
+
+    def iter_text(self, chunk_bytes: int = MAP_CHUNK_BYTES) -> Iterator[str]:
+        """
+        Decode the file in chunks.
+
+        Args:
+            chunk_bytes: Bytes decoded per chunk
+
+        Yields:
+            Non-empty text chunks, together equal to read_text()
+        """
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        start = 0
+        while True:
+            # Re-checked per chunk: a reader never keeps slicing a mapping of a
+            # file that was truncated (which would fault) while it was paused
+            view, limit = self._view()
+            if view is None or start >= limit:
+                break
+            text = decoder.decode(view[start:min(start + chunk_bytes, limit)])
+            start += chunk_bytes
+            if text:
+                yield text
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+
+    def read_prefix(self, max_lines: int, max_bytes: int = PREFIX_MAX_BYTES) -> Tuple[str, bool]:
+        """
+        Decode just enough of the start of the file to show max_lines lines.
+
+        Args:
+            max_lines: Lines wanted; one more is included when present so
+                       callers can tell the text continues
+            max_bytes: Upper bound on the bytes decoded
+
+        Returns:
+            Tuple of (text, complete); complete is False when the prefix
+            stops before the end of the file
+        """
+        view, size = self._view()
+        if view is None:
+            return "", True
+        limit = min(size, max_bytes)
+        end = 0
+        for _ in range(max_lines + 1):
+            idx = view.find(b"\n", end, limit)
+            if idx == -1:
+                end = limit
+                break
+            end = idx + 1
+        return view[:end].decode("utf-8", errors="ignore"), end >= size
+
+    def close(self) -> None:
+        """Release the mapping."""
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
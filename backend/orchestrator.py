@@ -19,6 +19,7 @@ load_dotenv(Path(__file__).parent / ".env")
 
 # Import WebSocket manager
 from websocket_manager import manager
+from atomic_io import atomic_write_json as _atomic_write_json
 
 router = APIRouter(prefix="/orchestrator", tags=["orchestrator"])
 # Gist configuration
@@ -49,10 +50,7 @@ def save_projects(projects: list[dict]):
     try:
         data = {'projects': projects}
         # Atomic write
-        temp_path = PROJECTS_CONFIG_PATH.with_suffix('.tmp')
-        with open(temp_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-        temp_path.replace(PROJECTS_CONFIG_PATH)
+        _atomic_write_json(PROJECTS_CONFIG_PATH, data)
         return True
     except (IOError, OSError):
         return False
@@ -132,23 +130,13 @@ def atomic_write_json(file_path: str, data: dict) -> bool:
     Atomically write JSON data to file using temp file + rename pattern.
     Prevents corruption from concurrent access or crashes mid-write.
     SCAN-009 - WO-FILE-DISCOVERY-ENHANCEMENT-001
-    """
-    import tempfile
-    import shutil
 
+    Returns False instead of raising; see atomic_io.atomic_write_json.
+    """
     try:
-        # Write to temp file first
-        temp_fd, temp_path = tempfile.mkstemp(suffix=".json", dir=os.path.dirname(file_path))
-        with os.fdopen(temp_fd, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2)
-
-        # Atomic rename (overwrites target on Windows/Unix)
-        shutil.move(temp_path, file_path)
+        _atomic_write_json(file_path, data)
         return True
-    except Exception as e:
-        # Clean up temp file if it still exists
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+    except Exception:
         return False
 
 
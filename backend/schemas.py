@@ -18,6 +18,12 @@ class SearchItemType(str, Enum):
     FAVORITE = "favorite"
 
 
+class SearchMode(str, Enum):
+    EXACT = "exact"
+    REGEX = "regex"
+    FUZZY = "fuzzy"
+
+
 class BatchJobStatus(str, Enum):
     PENDING = "pending"
     RUNNING = "running"
@@ -81,6 +87,18 @@ class AttachmentTextPayload(BaseModel):
     )
 
 
+class AttachmentFilePayload(BaseModel):
+    path: str = Field(..., description="Path of the file to attach")
+    suggested_name: Optional[str] = Field(
+        default=None,
+        description="Optional filename (default: the file's name)"
+    )
+    mmap: Optional[bool] = Field(
+        default=None,
+        description="Memory-map the file instead of loading it (default: only files of 1 MiB or more)",
+    )
+
+
 class SaveSessionPayload(BaseModel):
     path: Optional[str] = Field(
         default=None,
@@ -130,6 +148,17 @@ class SearchQueryParams(BaseModel):
     q: str = Field(..., description="Search query string")
     limit: int = Field(20, ge=1, le=200)
     offset: int = Field(0, ge=0)
+    ranked: bool = Field(
+        False,
+        description="Order by relevance and include every match offset per document",
+    )
+    mode: SearchMode = Field(SearchMode.EXACT, description="Exact substring, regex, or fuzzy matching")
+    budget_ms: int = Field(
+        500,
+        ge=1,
+        le=10000,
+        description="Time budget for regex/fuzzy searches before partial results are returned",
+    )
 
 
 # ---------------------------------------------------------------------------
@@ -183,6 +212,10 @@ class AttachmentSummary(BaseModel):
         default=False,
         description="True if this is a non-text attachment represented only by metadata",
     )
+    mapped: bool = Field(
+        default=False,
+        description="True if the content is read from a memory-mapped file on demand",
+    )
 
 
 class ResponseSummaryItem(BaseModel):
@@ -219,12 +252,33 @@ class PreviewResponse(BaseModel):
 # Tokens & search
 # ---------------------------------------------------------------------------
 
+class ModelTokenCounts(BaseModel):
+    model: str = Field(..., description="Model identifier as requested")
+    tokenizer: str = Field(..., description="Encoding used, or 'chars/4' if none is available")
+    approximate: bool = Field(
+        default=False,
+        description="True if very large documents were estimated from samples",
+    )
+    prompt_tokens: int
+    attachment_tokens: int
+    response_tokens: int
+    total_tokens: int
+
+
 class TokensResponse(BaseModel):
     tokenizer: str = Field(..., description="Name of tokenizer used")
     prompt_tokens: int
     attachment_tokens: int
     response_tokens: int
     total_tokens: int
+    pending: int = Field(
+        default=0,
+        description="Items still being counted in the background; totals exclude them",
+    )
+    models: Optional[List[ModelTokenCounts]] = Field(
+        default=None,
+        description="Per-model counts when /tokens is called with ?models=",
+    )
 
 
 class SearchResultItem(BaseModel):
@@ -241,6 +295,18 @@ class SearchResultItem(BaseModel):
         ...,
         description="Short excerpt around the match, sanitized for display",
     )
+    score: Optional[float] = Field(
+        default=None,
+        description="BM25 relevance score (ranked search only)",
+    )
+    match_count: Optional[int] = Field(
+        default=None,
+        description="Total number of matches in the document (ranked search only)",
+    )
+    matches: Optional[List[int]] = Field(
+        default=None,
+        description="Character offsets of every match, capped at 10000 (ranked search only)",
+    )
 
 
 class SearchResponse(BaseModel):
@@ -249,6 +315,58 @@ class SearchResponse(BaseModel):
     limit: int
     offset: int
     results: List[SearchResultItem]
+    timed_out: bool = Field(
+        default=False,
+        description="True if a regex/fuzzy search hit its time budget and results are partial",
+    )
+
+
+# ---------------------------------------------------------------------------
+# Saved sessions
+# ---------------------------------------------------------------------------
+
+class SessionListEntry(BaseModel):
+    name: str = Field(..., description="Session filename")
+    path: str = Field(..., description="Absolute path, usable with /sessions/load")
+    format: str = Field(..., description="Session file format: json or binary")
+    saved_at: float = Field(..., description="Last modification time (Unix seconds)")
+    size_bytes: int
+    attachment_count: int
+    response_count: int
+    total_chars: int
+    total_tokens: Optional[int] = Field(
+        default=None,
+        description="Token total when the session was saved (unknown for files indexed by rescan)",
+    )
+
+
+class SessionListResponse(BaseModel):
+    total: int
+    limit: int
+    offset: int
+    sessions: List[SessionListEntry]
+
+
+class SessionSearchResult(BaseModel):
+    session: str = Field(..., description="Session filename")
+    path: str = Field(..., description="Absolute path, usable with /sessions/load")
+    saved_at: float = Field(..., description="Session file modification time (Unix seconds)")
+    type: SearchItemType
+    id: Optional[str] = Field(
+        default=None,
+        description="ID of the matched attachment/response within the session",
+    )
+    name: str = Field(..., description="Display name (filename, response source, or 'Prompt')")
+    snippet: str = Field(..., description="Excerpt around the match")
+    score: float = Field(..., description="BM25 relevance score (higher is more relevant)")
+
+
+class SessionSearchResponse(BaseModel):
+    query: str
+    total: int
+    limit: int
+    offset: int
+    results: List[SessionSearchResult]
 
 
 # ---------------------------------------------------------------------------
@@ -0,0 +1,465 @@
+"""
+Search primitives for ScriptboardCore session search.
+
+The trigram index maps every lowercase 3-character substring to the set of document
+keys containing it. ScriptboardCore keeps it in sync on every mutation so a
+query only has to verify the documents that contain all of its trigrams,
+instead of lowercasing and scanning the whole session. Regex and fuzzy
+matching helpers for the non-exact search modes live here as well, and
+find_in_chunks() matches text streamed in chunks (memory-mapped files)
+without decoding it all at once.
+"""
+
+from __future__ import annotations
+
+import heapq
+import math
+import re
+import time
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+GRAM_SIZE = 3
+
+
+def extract_trigrams(text: str) -> FrozenSet[str]:
+    """
+    Get the distinct trigrams of already-lowercased text.
+
+    Args:
+        text: Lowercased text
+
+    Returns:
+        Frozen set of all GRAM_SIZE-character substrings
+    """
+    if len(text) < GRAM_SIZE:
+        return frozenset()
+    return frozenset(text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1))
+
+
+class TrigramIndex:
+    """
+    Incrementally maintained inverted trigram index.
+
+    Documents are identified by string keys (e.g. "prompt", attachment IDs,
+    response IDs). Adding a key that is already indexed replaces it.
+    """
+
+    def __init__(self) -> None:
+        self._postings: Dict[str, Set[str]] = {}
+        self._doc_grams: Dict[str, FrozenSet[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._doc_grams)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._doc_grams
+
+    def add(self, key: str, text: str) -> None:
+        """
+        Index a document, replacing any previous version with the same key.
+
+        Args:
+            key: Document key
+            text: Raw document text (lowercased internally)
+        """
+        self.add_grams(key, extract_trigrams(text.lower()))
+
+    def add_grams(self, key: str, grams: FrozenSet[str]) -> None:
+        """
+        Index a document from its precomputed extract_trigrams() set.
+
+        Lets callers extract trigrams off the thread that owns the index.
+
+        Args:
+            key: Document key
+            grams: Trigrams of the lowercased document text
+        """
+        if key in self._doc_grams:
+            self.remove(key)
+        self._doc_grams[key] = grams
+        for gram in grams:
+            posting = self._postings.get(gram)
+            if posting is None:
+                self._postings[gram] = {key}
+            else:
+                posting.add(key)
+
+    def remove(self, key: str) -> None:
+        """
+        Drop a document from the index. Unknown keys are ignored.
+
+        Args:
+            key: Document key
+        """
+        grams = self._doc_grams.pop(key, None)
+        if not grams:
+            return
+        for gram in grams:
+            posting = self._postings.get(gram)
+            if posting is None:
+                continue
+            posting.discard(key)
+            if not posting:
+                del self._postings[gram]
+
+    def clear(self) -> None:
+        """Drop every document from the index."""
+        self._postings.clear()
+        self._doc_grams.clear()
+
+    def candidates(self, query: str) -> Optional[Set[str]]:
+        """
+        Get keys of documents that may contain the query.
+
+        Every returned document contains all trigrams of the query, so callers
+        still verify the actual substring match. Documents not returned are
+        guaranteed not to match.
+
+        Args:
+            query: Search query (lowercased internally)
+
+        Returns:
+            Set of candidate keys, or None if the query is shorter than a
+            trigram and the index cannot narrow the search
+        """
+        grams = extract_trigrams(query.lower())
+        if not grams:
+            return None
+
+        postings = []
+        for gram in grams:
+            posting = self._postings.get(gram)
+            if not posting:
+                return set()
+            postings.append(posting)
+
+        # Intersect smallest-first so the working set shrinks as fast as possible
+        postings.sort(key=len)
+        result = set(postings[0])
+        for posting in postings[1:]:
+            result &= posting
+            if not result:
+                break
+        return result
+
+
+# BM25 free parameters (standard defaults)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def bm25_score(
+    tf: int,
+    doc_len: int,
+    avg_doc_len: float,
+    doc_count: int,
+    matching_docs: int,
+) -> float:
+    """
+    Score one document for a single query term with Okapi BM25.
+
+    Args:
+        tf: Number of query matches in the document
+        doc_len: Document length in characters
+        avg_doc_len: Average document length across the session
+        doc_count: Number of searchable documents in the session
+        matching_docs: Number of documents containing the query
+
+    Returns:
+        BM25 relevance score (higher is more relevant)
+    """
+    if tf <= 0:
+        return 0.0
+    idf = math.log((doc_count - matching_docs + 0.5) / (matching_docs + 0.5) + 1.0)
+    length_norm = 1.0 - BM25_B + BM25_B * (doc_len / avg_doc_len if avg_doc_len else 1.0)
+    return idf * tf * (BM25_K1 + 1.0) / (tf + BM25_K1 * length_norm)
+
+
+# --------------------------------------------------------------------------- #
+# Regex and fuzzy matching
+# --------------------------------------------------------------------------- #
+
+def find_in_chunks(
+    chunks: Iterable[str],
+    query_lower: str,
+    context: int,
+    max_matches: Optional[int] = None,
+    max_offsets: Optional[int] = None,
+) -> Tuple[int, List[int], str]:
+    """
+    Find non-overlapping case-insensitive matches in text read chunk by chunk.
+
+    Only the current chunk plus enough carried-over text for matches that
+    span chunks (and for the snippet) is held at a time. Offsets and the
+    snippet are as str.lower().find() and ScriptboardCore._snippet_at()
+    would give on the joined text.
+
+    Args:
+        chunks: Text chunks (e.g. MappedText.iter_text())
+        query_lower: Lowercased query; an empty query matches at offset 0
+        context: Snippet characters on each side of the first match
+        max_matches: Stop reading after this many matches (None reads everything)
+        max_offsets: Keep at most this many offsets (None keeps all)
+
+    Returns:
+        (match count, match offsets, snippet around the first match or "")
+    """
+    if not query_lower:
+        max_matches = 1
+    qlen = len(query_lower)
+    count = 0
+    offsets: List[int] = []
+    first: Optional[int] = None
+    snippet: Optional[str] = None
+    buffer = ""
+    base = 0  # Offset of buffer[0] in the joined text
+    pos = 0  # Where the search resumes in buffer
+    it = iter(chunks)
+    done = False
+    while not done:
+        chunk = next(it, None)
+        done = chunk is None
+        if chunk:
+            buffer += chunk
+        searching = max_matches is None or count < max_matches
+        if searching:
+            lowered = buffer.lower()
+            idx = lowered.find(query_lower, pos)
+            while idx != -1:
+                count += 1
+                if first is None:
+                    first = base + idx
+                if max_offsets is None or len(offsets) < max_offsets:
+                    offsets.append(base + idx)
+                pos = idx + max(qlen, 1)
+                if max_matches is not None and count >= max_matches:
+                    searching = False
+                    break
+                idx = lowered.find(query_lower, pos)
+        if first is not None and snippet is None:
+            rel = first - base
+            end = rel + qlen + context
+            # Wait for the trailing context, and one character more to tell whether the text goes on
+            if done or len(buffer) > end:
+                start = max(0, rel - context)
+                snippet = buffer[start:end]
+                if base + start > 0:
+                    snippet = "..." + snippet
+                if len(buffer) > end:
+                    snippet += "..."
+        if not searching and snippet is not None:
+            break
+        # Drop text no later match (or the pending snippet) can need
+        resume = max(pos, len(buffer) - qlen + 1)
+        keep = resume - context
+        if first is not None and snippet is None:
+            keep = min(keep, first - base - context)
+        keep = max(keep, 0)
+        buffer = buffer[keep:]
+        base += keep
+        pos = resume - keep
+    return count, offsets, snippet or ""
+
+
+# Optional: the `regex` package (installed with tiktoken) supports per-call
+# match timeouts; the stdlib `re` fallback can only be checked between documents.
+try:
+    import regex as _regex_engine
+except ImportError:  # pragma: no cover - depends on environment
+    _regex_engine = None
+
+REGEX_CACHE_SIZE = 128
+
+_PATTERN_ERRORS: Tuple[type, ...] = (re.error,)
+if _regex_engine is not None:
+    _PATTERN_ERRORS += (_regex_engine.error,)
+
+
+class SearchTimeoutError(Exception):
+    """Raised when a search exceeds its time budget."""
+
+
+def check_deadline(deadline: Optional[float]) -> None:
+    """
+    Raise SearchTimeoutError if a time.monotonic() deadline has passed.
+
+    Args:
+        deadline: Monotonic deadline, or None for no limit
+    """
+    if deadline is not None and time.monotonic() > deadline:
+        raise SearchTimeoutError("Search time budget exceeded")
+
+
+@lru_cache(maxsize=REGEX_CACHE_SIZE)
+def compile_pattern(pattern: str):
+    """
+    Compile a case-insensitive search pattern, memoized in a bounded LRU.
+
+    Args:
+        pattern: Regular expression source
+
+    Returns:
+        Compiled pattern object
+
+    Raises:
+        ValueError: If the pattern is not a valid regular expression
+    """
+    try:
+        if _regex_engine is not None:
+            return _regex_engine.compile(pattern, _regex_engine.IGNORECASE)
+        return re.compile(pattern, re.IGNORECASE)
+    except _PATTERN_ERRORS as e:
+        raise ValueError(f"Invalid regular expression: {e}")
+
+
+def regex_find(pattern, text: str, deadline: Optional[float] = None) -> Optional[Tuple[int, int]]:
+    """
+    Find the first match of a compiled pattern within the time budget.
+
+    Args:
+        pattern: Pattern from compile_pattern()
+        text: Text to search
+        deadline: Monotonic deadline, or None for no limit
+
+    Returns:
+        (start, end) of the first match, or None
+
+    Raises:
+        SearchTimeoutError: If the deadline passes before or during the match
+    """
+    check_deadline(deadline)
+    if deadline is not None and _regex_engine is not None and isinstance(pattern, _regex_engine.Pattern):
+        try:
+            match = pattern.search(text, timeout=max(deadline - time.monotonic(), 0.001))
+        except TimeoutError:
+            raise SearchTimeoutError("Search time budget exceeded")
+    else:
+        match = pattern.search(text)
+    return match.span() if match else None
+
+
+def default_max_edits(query_len: int) -> int:
+    """
+    Get the default edit budget for a fuzzy query of the given length.
+
+    Args:
+        query_len: Length of the query in characters
+
+    Returns:
+        0 for queries under 4 characters, 1 up to 7 characters, otherwise 2
+    """
+    return min(2, query_len // 4)
+
+
+def split_pieces(query: str, max_edits: int) -> List[Tuple[int, str]]:
+    """
+    Split a query into max_edits + 1 contiguous pieces.
+
+    Any text within max_edits edits of the query contains at least one piece
+    verbatim (each edit can break at most one piece), so exact piece hits are
+    the only places a fuzzy match can start.
+
+    Args:
+        query: Query string
+        max_edits: Maximum edit distance
+
+    Returns:
+        List of (offset in query, piece) tuples
+    """
+    n = max_edits + 1
+    bounds = [i * len(query) // n for i in range(n + 1)]
+    return [(bounds[i], query[bounds[i]:bounds[i + 1]]) for i in range(n)]
+
+
+def _approx_match_end(query: str, text: str, max_edits: int) -> Optional[int]:
+    """
+    Find where the first approximate occurrence of query in text ends.
+
+    Sellers' dynamic program: edit distance between the query and the best
+    substring of text ending at each position.
+
+    Args:
+        query: Lowercased query string
+        text: Lowercased window of text
+        max_edits: Maximum edit distance
+
+    Returns:
+        End offset (exclusive) in text of the first match, or None
+    """
+    m = len(query)
+    prev = list(range(m + 1))
+    for j, ch in enumerate(text, 1):
+        cur = [0] * (m + 1)
+        for i in range(1, m + 1):
+            cost = 0 if query[i - 1] == ch else 1
+            cur[i] = min(prev[i - 1] + cost, prev[i] + 1, cur[i - 1] + 1)
+        if cur[m] <= max_edits:
+            return j
+        prev = cur
+    return None
+
+
+def fuzzy_find(
+    text_lower: str,
+    query_lower: str,
+    max_edits: int,
+    deadline: Optional[float] = None,
+) -> Optional[Tuple[int, int]]:
+    """
+    Find the first occurrence of the query within max_edits edits.
+
+    Exact hits of the query pieces (see split_pieces) are located with
+    str.find, and the edit-distance check only runs on short windows around
+    those hits, so most of the text is never touched by the Python-level DP.
+
+    Args:
+        text_lower: Lowercased text to search
+        query_lower: Lowercased, non-empty query string
+        max_edits: Maximum edit distance
+        deadline: Monotonic deadline, or None for no limit
+
+    Returns:
+        Approximate (start, end) of the first match, or None
+
+    Raises:
+        SearchTimeoutError: If the deadline passes while verifying windows
+    """
+    m = len(query_lower)
+    if max_edits <= 0:
+        idx = text_lower.find(query_lower)
+        return (idx, idx + m) if idx != -1 else None
+
+    # Merge anchors from every piece in text order: (window start, piece index, hit position)
+    pieces = [(offset, piece) for offset, piece in split_pieces(query_lower, max_edits) if piece]
+    anchors = []
+    for n, (offset, piece) in enumerate(pieces):
+        pos = text_lower.find(piece)
+        if pos != -1:
+            heapq.heappush(anchors, (max(0, pos - offset - max_edits), n, pos))
+
+    checked_until = 0
+    windows = 0
+    while anchors:
+        start, n, pos = heapq.heappop(anchors)
+        offset, piece = pieces[n]
+        end = min(len(text_lower), pos - offset + m + max_edits)
+
+        next_pos = text_lower.find(piece, pos + 1)
+        if next_pos != -1:
+            heapq.heappush(anchors, (max(0, next_pos - offset - max_edits), n, next_pos))
+
+        if end <= checked_until:
+            continue  # Window already covered by a previous check
+        start = max(start, checked_until - m - max_edits, 0)
+
+        windows += 1
+        if windows % 64 == 0:
+            check_deadline(deadline)
+
+        match_end = _approx_match_end(query_lower, text_lower[start:end], max_edits)
+        if match_end is not None:
+            match_end += start
+            return max(start, match_end - m), match_end
+        checked_until = end
+    return None
@@ -0,0 +1,194 @@
+"""
+On-disk encodings for saved sessions and autosave.
+
+Two formats are supported, and readers detect which one a file uses from its
+first bytes, so either can be loaded regardless of file extension:
+
+- "json": compact UTF-8 JSON with no indentation and no ASCII escaping. When
+  the optional `orjson` package is installed it is used as a fast path.
+- "binary": a length-prefixed layout that keeps large strings out of the
+  JSON codec entirely:
+
+      magic   b"SBS1"
+      u32     header length in bytes (big-endian)
+      header  JSON session dictionary in which the prompt and every
+              attachment/response "content" is replaced by its UTF-8 byte
+              length ("prompt_len" / "content_len")
+      body    those UTF-8 strings back to back: prompt, attachments, responses
+
+  Content is copied verbatim on save and sliced straight out of the file on
+  load, with no escaping or unescaping of multi-megabyte strings.
+
+bench_session_format.py compares both against the stdlib json module.
+"""
+
+from __future__ import annotations
+
+import json
+import struct
+from typing import BinaryIO, Dict, List, Tuple, Union
+
+# Optional: orjson encodes/decodes JSON several times faster than the stdlib
+try:
+    import orjson as _orjson
+except ImportError:  # pragma: no cover - depends on environment
+    _orjson = None
+
+FORMAT_JSON = "json"
+FORMAT_BINARY = "binary"
+SESSION_FORMATS = (FORMAT_JSON, FORMAT_BINARY)
+
+# File extension used when saving in each format
+FORMAT_EXTENSIONS = {FORMAT_JSON: ".json", FORMAT_BINARY: ".sbs"}
+
+BINARY_MAGIC = b"SBS1"
+_HEADER_LENGTH = struct.Struct(">I")
+
+_CONTENT_SECTIONS = ("attachments", "responses")
+
+
+def json_dumps(obj) -> bytes:
+    """
+    Encode an object as compact UTF-8 JSON.
+
+    Args:
+        obj: JSON-serializable object
+
+    Returns:
+        Encoded bytes (orjson when available, stdlib json otherwise)
+    """
+    if _orjson is not None:
+        try:
+            return _orjson.dumps(obj)
+        except TypeError:
+            pass  # e.g. lone surrogates, which the stdlib encoder passes through
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8", errors="surrogatepass")
+
+
+def json_loads(data: Union[bytes, str]):
+    """
+    Decode JSON produced by json_dumps() or the stdlib json module.
+
+    Args:
+        data: Encoded JSON
+
+    Returns:
+        Decoded object
+
+    Raises:
+        ValueError: If the data is not valid JSON (json.JSONDecodeError subclasses it)
+    """
+    if _orjson is not None:
+        try:
+            return _orjson.loads(data)
+        except _orjson.JSONDecodeError:
+            pass  # Retry with the stdlib for its error message and surrogate handling
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = bytes(data).decode("utf-8", errors="surrogatepass")
+    return json.loads(data)
+
+
+def detect_format(data: bytes) -> str:
+    """
+    Detect the format of serialized session data.
+
+    Args:
+        data: File contents (at least the first few bytes)
+
+    Returns:
+        FORMAT_BINARY or FORMAT_JSON
+    """
+    return FORMAT_BINARY if data[:len(BINARY_MAGIC)] == BINARY_MAGIC else FORMAT_JSON
+
+
+def _split_content(session_data: Dict) -> Tuple[Dict, List[bytes]]:
+    """Move the prompt and item content out of a session into encoded body segments."""
+    header = dict(session_data)
+    segments: List[bytes] = []
+
+    prompt = header.pop("prompt", "") or ""
+    encoded = prompt.encode("utf-8", errors="surrogatepass")
+    header["prompt_len"] = len(encoded)
+    segments.append(encoded)
+
+    for section in _CONTENT_SECTIONS:
+        items = []
+        for item in session_data.get(section, []):
+            if "content" in item:
+                encoded = (item["content"] or "").encode("utf-8", errors="surrogatepass")
+                item = {key: value for key, value in item.items() if key != "content"}
+                item["content_len"] = len(encoded)
+                segments.append(encoded)
+            items.append(item)
+        header[section] = items
+    return header, segments
+
+
+def dump_session(session_data: Dict, f: BinaryIO, fmt: str = FORMAT_JSON) -> None:
+    """
+    Write a session dictionary to a binary file object.
+
+    Binary format segments are written one at a time, so the file is never
+    assembled in memory.
+
+    Args:
+        session_data: Session dictionary from ScriptboardCore.to_dict()
+        f: File opened in binary write mode
+        fmt: FORMAT_JSON or FORMAT_BINARY
+
+    Raises:
+        ValueError: If fmt is not a supported format
+    """
+    if fmt == FORMAT_JSON:
+        f.write(json_dumps(session_data))
+        return
+    if fmt != FORMAT_BINARY:
+        raise ValueError(f"Unsupported session format: {fmt}")
+
+    header, segments = _split_content(session_data)
+    encoded_header = json_dumps(header)
+    f.write(BINARY_MAGIC)
+    f.write(_HEADER_LENGTH.pack(len(encoded_header)))
+    f.write(encoded_header)
+    for segment in segments:
+        f.write(segment)
+
+
+def loads_session(data: bytes) -> Dict:
+    """
+    Decode a session in either format.
+
+    Args:
+        data: File contents
+
+    Returns:
+        Session dictionary
+
+    Raises:
+        ValueError: If the data is corrupt or truncated
+    """
+    if detect_format(data) == FORMAT_JSON:
+        return json_loads(data)
+
+    view = memoryview(data)
+    start = len(BINARY_MAGIC) + _HEADER_LENGTH.size
+    if len(view) < start:
+        raise ValueError("Truncated binary session header")
+    (header_len,) = _HEADER_LENGTH.unpack(view[len(BINARY_MAGIC):start])
+    session_data = json_loads(view[start:start + header_len])
+    offset = start + header_len
+
+    def take(length: int) -> str:
+        nonlocal offset
+        if offset + length > len(view):
+            raise ValueError("Truncated binary session body")
+        text = str(view[offset:offset + length], "utf-8", errors="surrogatepass")
+        offset += length
+        return text
+
+    session_data["prompt"] = take(session_data.pop("prompt_len", 0))
+    for section in _CONTENT_SECTIONS:
+        for item in session_data.get(section, []):
+            if "content_len" in item:
+                item["content"] = take(item.pop("content_len"))
+    return session_data
@@ -0,0 +1,543 @@
+"""
+SQLite sidecar index of saved sessions.
+
+Listing thousands of session files by opening and parsing each one is slow,
+so save_session records a row of metadata per file (counts, sizes, token
+total) in <sessions dir>/index.sqlite3, and GET /sessions pages and sorts
+with a single query. The same database holds an FTS5 full-text index of
+every prompt, attachment, and response, which /sessions/search queries
+across all saved sessions at once. Memory-mapped attachments, saved as a
+path to the source file, are indexed from the file as it was when the
+session was saved, up to MAPPED_INDEX_MAX_BYTES.
+
+The full-text table is contentless: it holds the search index but not the
+text, which already lives in the session files and the blob store, so
+result snippets are cut from the session file. Without the text, FTS5 (as
+built before SQLite 3.43) cannot delete a document's terms, so replaced
+and removed documents stay in the index as tombstones that searches join
+away, and sync() rebuilds the table once tombstones outnumber documents.
+
+The index is a cache, never the source of truth: before each listing the
+sessions directory is scanned (one stat per file, no reads) and files that
+were added, changed, or deleted behind the index's back are reconciled.
+Only new or changed files are parsed.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import sqlite3
+import threading
+from contextlib import closing
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from session_format import FORMAT_EXTENSIONS, loads_session
+
+INDEX_FILENAME = "index.sqlite3"
+
+# Bumped when the schema changes; older index files are rebuilt from the
+# session files on the next sync
+INDEX_VERSION = 4
+
+# Bytes of a memory-mapped attachment's file that are full-text indexed
+MAPPED_INDEX_MAX_BYTES = 16 * 1024 * 1024
+
+# Columns GET /sessions can sort by
+SORT_FIELDS = (
+    "saved_at",
+    "name",
+    "size_bytes",
+    "attachment_count",
+    "response_count",
+    "total_chars",
+    "total_tokens",
+)
+
+# Seconds to wait for another writer's lock before failing
+_BUSY_TIMEOUT = 10.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    name TEXT PRIMARY KEY,
+    format TEXT NOT NULL,
+    saved_at REAL NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    attachment_count INTEGER NOT NULL,
+    response_count INTEGER NOT NULL,
+    total_chars INTEGER NOT NULL,
+    total_tokens INTEGER
+)
+"""
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS session_docs USING fts5(
+    name,
+    content,
+    content = '',
+    tokenize = 'unicode61'
+)
+"""
+
+# One row per live document of session_docs (same rowid). AUTOINCREMENT so
+# a new document never reuses the rowid of a tombstone
+_DOC_ITEMS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS session_doc_items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session TEXT NOT NULL,
+    item_type TEXT NOT NULL,
+    item_id TEXT,
+    name TEXT NOT NULL
+)
+"""
+
+_DOC_ITEMS_INDEX = "CREATE INDEX IF NOT EXISTS session_doc_items_session ON session_doc_items (session)"
+
+# Tokens in a search snippet
+SNIPPET_TOKENS = 16
+
+# Rebuild the full-text table once it holds more tombstones than this and
+# than live documents
+REBUILD_MIN_TOMBSTONES = 1000
+
+# Characters searched on each side of a match for snippet tokens
+_SNIPPET_WINDOW = 400
+
+_WORD = re.compile(r"\w+")
+
+_COLUMNS = (
+    "name",
+    "format",
+    "saved_at",
+    "mtime_ns",
+    "size_bytes",
+    "attachment_count",
+    "response_count",
+    "total_chars",
+    "total_tokens",
+)
+
+_UPSERT = (
+    f"INSERT OR REPLACE INTO sessions ({', '.join(_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in _COLUMNS)})"
+)
+
+_SESSION_SUFFIXES = frozenset(FORMAT_EXTENSIONS.values())
+
+
+def _item_chars(item: Dict) -> int:
+    """Get an item's content length, inline or from its blob reference stats."""
+    content = item.get("content")
+    if content is not None:
+        return len(content)
+    return int(item.get("chars") or 0)
+
+
+def fts_query(query: str) -> str:
+    """
+    Turn free text into an FTS5 query matching documents with every term.
+
+    Each whitespace-separated term is quoted, so FTS5 operators and
+    punctuation in user input are matched literally.
+
+    Args:
+        query: Search text
+
+    Returns:
+        FTS5 MATCH expression
+
+    Raises:
+        ValueError: If the query has no terms
+    """
+    terms = query.split()
+    if not terms:
+        raise ValueError("Search query is empty")
+    return " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def make_snippet(text: str, query: str, tokens: int = SNIPPET_TOKENS) -> str:
+    """
+    Cut a snippet of about `tokens` words around the first match of a query.
+
+    Matching is case-insensitive on the words of each query term (FTS5 also
+    folds accents, so a match may not be found; the snippet then starts at
+    the beginning of the text).
+
+    Args:
+        text: Document text
+        query: Search text as passed to fts_query()
+        tokens: Words in the snippet
+
+    Returns:
+        The snippet, with "..." where it cuts the text
+    """
+    words = [word for term in query.split() for word in _WORD.findall(term)]
+    match = None
+    if words:
+        pattern = re.compile(r"\b(?:" + "|".join(re.escape(word) for word in words) + ")", re.IGNORECASE)
+        match = pattern.search(text)
+    pos = match.start() if match else 0
+    offset = max(0, pos - _SNIPPET_WINDOW)
+    window = text[offset:pos + _SNIPPET_WINDOW]
+    spans = list(_WORD.finditer(window))
+    if not spans:
+        return ""
+    # A little leading context, as FTS5's snippet() gives
+    first = next((i for i, span in enumerate(spans) if span.end() > pos - offset), len(spans) - 1)
+    first = max(0, min(first - tokens // 4, len(spans) - tokens))
+    last = min(len(spans), first + tokens) - 1
+    start, end = offset + spans[first].start(), offset + spans[last].end()
+    return ("..." if start > 0 else "") + text[start:end] + ("..." if end < len(text) else "")
+
+
+def session_stats(session_data: Dict) -> Dict:
+    """
+    Compute the indexed statistics of a session dictionary.
+
+    Works on inline sessions and on blob manifests (whose references carry
+    precomputed "chars"), so nothing is read from the blob store.
+
+    Args:
+        session_data: Session dictionary or manifest
+
+    Returns:
+        Dictionary with attachment_count, response_count, and total_chars
+    """
+    attachments = session_data.get("attachments", [])
+    responses = session_data.get("responses", [])
+    return {
+        "attachment_count": len(attachments),
+        "response_count": len(responses),
+        "total_chars": (
+            len(session_data.get("prompt") or "")
+            + sum(_item_chars(att) for att in attachments)
+            + sum(_item_chars(resp) for resp in responses)
+        ),
+    }
+
+
+def _read_mapped(path: str) -> Optional[str]:
+    """Read the indexed prefix of a memory-mapped attachment's file, or None if it is gone."""
+    try:
+        with open(path, "rb") as f:
+            data = f.read(MAPPED_INDEX_MAX_BYTES)
+    except OSError:
+        return None
+    # Decoded as MappedText does; a character cut at the limit is dropped
+    return data.decode("utf-8", errors="ignore")
+
+
+class SessionIndex:
+    """
+    Metadata and full-text index for the session files in one directory.
+
+    Each call opens its own connection, so an instance can be shared between
+    the event loop and thread pool workers. If the SQLite build lacks FTS5,
+    the metadata index still works and search() raises RuntimeError.
+    """
+
+    def __init__(self, sessions_dir: Path, content_loader: Optional[Callable[[str], str]] = None) -> None:
+        """
+        Args:
+            sessions_dir: Directory holding the session files
+            content_loader: Reads a content_ref (e.g. BlobStore.read_ref), so
+                            manifest content can be full-text indexed
+        """
+        self.sessions_dir = Path(sessions_dir)
+        self.path = self.sessions_dir / INDEX_FILENAME
+        self.content_loader = content_loader
+        self.fts_enabled = True
+        self._lock = threading.Lock()  # Serializes sync() scans
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=_BUSY_TIMEOUT)
+        conn.row_factory = sqlite3.Row
+        if conn.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+            # The index is a cache: drop it and let sync() rebuild it
+            with conn:
+                conn.execute("DROP TABLE IF EXISTS sessions")
+                conn.execute("DROP TABLE IF EXISTS session_docs")
+                conn.execute("DROP TABLE IF EXISTS session_doc_items")
+                conn.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+        conn.execute(_SCHEMA)
+        try:
+            conn.execute(_FTS_SCHEMA)
+        except sqlite3.OperationalError:
+            self.fts_enabled = False  # SQLite built without FTS5
+        else:
+            conn.execute(_DOC_ITEMS_SCHEMA)
+            conn.execute(_DOC_ITEMS_INDEX)
+        return conn
+
+    def _documents(self, session_data: Dict) -> Iterator[Tuple[str, Optional[str], str, str]]:
+        """Yield (item type, item ID, name, text) for each searchable item of a session."""
+        if session_data.get("prompt"):
+            yield "prompt", None, "Prompt", session_data["prompt"]
+        for section, item_type, name_key in (
+            ("attachments", "attachment", "filename"),
+            ("responses", "response", "source"),
+        ):
+            for item in session_data.get(section, []):
+                if item.get("binary"):
+                    continue
+                yield item_type, item.get("id"), item.get(name_key) or "", self._item_text(item)
+
+    def _item_text(self, item: Dict) -> str:
+        """Get an attachment's or response's text: inline, from its blob, or from its mapped file."""
+        text = item.get("content")
+        if text is None and item.get("content_ref") and self.content_loader is not None:
+            try:
+                text = self.content_loader(item["content_ref"])
+            except (OSError, RuntimeError):
+                text = None  # Missing blob: keep the item findable by name
+        elif text is None and item.get("mapped_path"):
+            text = _read_mapped(item["mapped_path"])
+        return text or ""
+
+    def _document_text(self, session_data: Optional[Dict], item_type: str, item_id: Optional[str]) -> str:
+        """Get one document's text from its parsed session file ("" if it is gone)."""
+        if not isinstance(session_data, dict):
+            return ""
+        if item_type == "prompt":
+            return session_data.get("prompt") or ""
+        section = "attachments" if item_type == "attachment" else "responses"
+        for item in session_data.get(section, []):
+            if item.get("id") == item_id:
+                return self._item_text(item)
+        return ""
+
+    def _write(
+        self,
+        conn: sqlite3.Connection,
+        path: Path,
+        st: os.stat_result,
+        session_data: Dict,
+        total_tokens: Optional[int],
+    ) -> None:
+        """Replace the metadata row and full-text documents of one session file."""
+        conn.execute(_UPSERT, self._row(path, st, session_data, total_tokens))
+        if self.fts_enabled:
+            conn.execute("DELETE FROM session_doc_items WHERE session = ?", (path.name,))
+            self._write_documents(conn, path.name, session_data)
+
+    def _write_documents(self, conn: sqlite3.Connection, name: str, session_data: Dict) -> None:
+        """Add the full-text documents of one session."""
+        for item_type, item_id, doc_name, text in self._documents(session_data):
+            doc_id = conn.execute(
+                "INSERT INTO session_doc_items (session, item_type, item_id, name) VALUES (?, ?, ?, ?)",
+                (name, item_type, item_id, doc_name),
+            ).lastrowid
+            conn.execute(
+                "INSERT INTO session_docs (rowid, name, content) VALUES (?, ?, ?)",
+                (doc_id, doc_name, text),
+            )
+
+    def _delete(self, conn: sqlite3.Connection, names: List[str]) -> None:
+        params = [(name,) for name in names]
+        conn.executemany("DELETE FROM sessions WHERE name = ?", params)
+        if self.fts_enabled:
+            # The terms stay in session_docs as tombstones (see the module docstring)
+            conn.executemany("DELETE FROM session_doc_items WHERE session = ?", params)
+
+    def _rebuild_documents(self, conn: sqlite3.Connection) -> None:
+        """Re-index the full text of every indexed session, dropping tombstones."""
+        conn.execute("INSERT INTO session_docs (session_docs) VALUES ('delete-all')")
+        conn.execute("DELETE FROM session_doc_items")
+        for row in conn.execute("SELECT name FROM sessions").fetchall():
+            try:
+                session_data = loads_session((self.sessions_dir / row["name"]).read_bytes())
+            except (ValueError, OSError):
+                continue  # Dropped from the index by the next sync()
+            self._write_documents(conn, row["name"], session_data)
+
+    def _row(self, path: Path, st: os.stat_result, session_data: Dict, total_tokens: Optional[int]) -> Tuple:
+        stats = session_stats(session_data)
+        fmt = next(
+            (fmt for fmt, suffix in FORMAT_EXTENSIONS.items() if suffix == path.suffix),
+            None,
+        )
+        return (
+            path.name,
+            fmt or "json",
+            st.st_mtime,
+            st.st_mtime_ns,
+            st.st_size,
+            stats["attachment_count"],
+            stats["response_count"],
+            stats["total_chars"],
+            total_tokens,
+        )
+
+    def record(self, path: Path, session_data: Dict, total_tokens: Optional[int] = None) -> None:
+        """
+        Add or update the entry for a session file that was just written.
+
+        Args:
+            path: Saved session file (inside sessions_dir)
+            session_data: Session dictionary that was saved (inline content
+                          is indexed directly, references via content_loader)
+            total_tokens: Token total of the session, if known
+        """
+        st = path.stat()
+        with closing(self._connect()) as conn, conn:
+            self._write(conn, path, st, session_data, total_tokens)
+
+    def remove(self, name: str) -> None:
+        """
+        Drop the entry for a session file.
+
+        Args:
+            name: Session filename
+        """
+        with closing(self._connect()) as conn, conn:
+            self._delete(conn, [name])
+
+    def sync(self) -> int:
+        """
+        Reconcile the index with the files on disk.
+
+        Files whose size and mtime match their entry are not opened. Files
+        that cannot be parsed are left out of the index.
+
+        Returns:
+            Number of entries added, updated, or removed
+        """
+        with self._lock, closing(self._connect()) as conn, conn:
+            indexed = {
+                row["name"]: (row["mtime_ns"], row["size_bytes"])
+                for row in conn.execute("SELECT name, mtime_ns, size_bytes FROM sessions")
+            }
+
+            changes = 0
+            seen = set()
+            with os.scandir(self.sessions_dir) as entries:
+                for entry in entries:
+                    path = Path(entry.path)
+                    if path.suffix not in _SESSION_SUFFIXES or not entry.is_file():
+                        continue
+                    st = entry.stat()
+                    if indexed.get(entry.name) == (st.st_mtime_ns, st.st_size):
+                        seen.add(entry.name)
+                        continue
+                    try:
+                        session_data = loads_session(path.read_bytes())
+                    except (ValueError, OSError):
+                        continue
+                    if not isinstance(session_data, dict):
+                        continue
+                    seen.add(entry.name)
+                    self._write(conn, path, st, session_data, None)
+                    changes += 1
+
+            # Deleted files, and indexed files that no longer parse
+            stale = [name for name in indexed if name not in seen]
+            self._delete(conn, stale)
+
+            if self.fts_enabled:
+                documents = conn.execute("SELECT COUNT(*) FROM session_doc_items").fetchone()[0]
+                tombstones = conn.execute("SELECT COUNT(*) FROM session_docs").fetchone()[0] - documents
+                if tombstones > max(documents, REBUILD_MIN_TOMBSTONES):
+                    self._rebuild_documents(conn)
+            return changes + len(stale)
+
+    def list(
+        self,
+        offset: int = 0,
+        limit: int = 50,
+        sort: str = "saved_at",
+        descending: bool = True,
+    ) -> Tuple[int, List[Dict]]:
+        """
+        Page through indexed sessions.
+
+        Args:
+            offset: Entries to skip
+            limit: Maximum entries to return
+            sort: Column from SORT_FIELDS
+            descending: Sort order (ties are broken by name)
+
+        Returns:
+            (total entry count, page of entry dictionaries)
+
+        Raises:
+            ValueError: If sort is not in SORT_FIELDS
+        """
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"Invalid sort field: {sort}")
+        direction = "DESC" if descending else "ASC"
+        # total_tokens may be unknown; keep those entries last in either order
+        order = f"{sort} IS NULL, {sort} {direction}, name {direction}"
+        with closing(self._connect()) as conn:
+            total = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            rows = conn.execute(
+                f"SELECT * FROM sessions ORDER BY {order} LIMIT ? OFFSET ?",
+                (limit, offset),
+            ).fetchall()
+        entries = []
+        for row in rows:
+            entry = dict(row)
+            del entry["mtime_ns"]
+            entry["path"] = str(self.sessions_dir / row["name"])
+            entries.append(entry)
+        return total, entries
+
+    def search(self, query: str, limit: int = 20, offset: int = 0) -> Tuple[int, List[Dict]]:
+        """
+        Full-text search across every indexed session.
+
+        Results are ranked by FTS5's BM25, best first. Matching is on whole
+        words (case- and accent-insensitive) in item content and names.
+
+        Args:
+            query: Search text; every term must appear in a result
+            limit: Maximum results to return
+            offset: Results to skip
+
+        Returns:
+            (total match count, page of result dictionaries with session,
+            path, saved_at, type, id, name, snippet, and score)
+
+        Raises:
+            ValueError: If the query has no terms
+            RuntimeError: If SQLite was built without FTS5
+        """
+        match = fts_query(query)
+        with closing(self._connect()) as conn:
+            if not self.fts_enabled:
+                raise RuntimeError("Full-text search requires SQLite with FTS5")
+            live = (
+                " FROM session_docs JOIN session_doc_items AS items ON items.id = session_docs.rowid"
+                " JOIN sessions ON sessions.name = items.session"
+                " WHERE session_docs MATCH ?"
+            )
+            total = conn.execute("SELECT COUNT(*)" + live, (match,)).fetchone()[0]
+            rows = conn.execute(
+                "SELECT items.session, items.item_type, items.item_id, items.name, saved_at,"
+                " bm25(session_docs) AS rank" + live + " ORDER BY rank LIMIT ? OFFSET ?",
+                (match, limit, offset),
+            ).fetchall()
+        # The index holds no text: snippets are cut from the session files,
+        # each parsed once per page
+        sessions: Dict[str, Optional[Dict]] = {}
+        results = []
+        for row in rows:
+            name = row["session"]
+            if name not in sessions:
+                try:
+                    sessions[name] = loads_session((self.sessions_dir / name).read_bytes())
+                except (ValueError, OSError):
+                    sessions[name] = None
+            text = self._document_text(sessions[name], row["item_type"], row["item_id"])
+            results.append({
+                "session": name,
+                "path": str(self.sessions_dir / name),
+                "saved_at": row["saved_at"],
+                "type": row["item_type"],
+                "id": row["item_id"],
+                "name": row["name"],
+                "snippet": make_snippet(text, query),
+                "score": -row["rank"],  # bm25() is lower-is-better
+            })
+        return total, results
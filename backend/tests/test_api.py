@@ -2,6 +2,8 @@
 Integration tests for API endpoints.
 """
 
+import json
+
 import pytest
 from fastapi.testclient import TestClient
 from api import app
@@ -126,3 +128,152 @@ def test_error_handling(client):
     assert "code" in data["error"]
     assert "message" in data["error"]
 
+
+
+def test_search_stream_endpoint(client):
+    """Test streaming search stops after limit results."""
+    client.delete("/prompt")
+    client.delete("/attachments")
+    client.delete("/responses")
+    for i in range(3):
+        client.post("/attachments/text", json={"text": f"streamed match {i}", "suggested_name": f"s{i}.txt"})
+
+    response = client.get("/search/stream?q=streamed&limit=2")
+    assert response.status_code == 200
+    events = [
+        json.loads(line[len("data: "):])
+        for line in response.text.splitlines()
+        if line.startswith("data: ")
+    ]
+    results = [e for e in events if e["type"] == "result"]
+    assert [r["item"]["name"] for r in results] == ["s0.txt", "s1.txt"]
+    assert results[0]["item"]["type"] == "attachment"
+    assert events[-1] == {"type": "done", "count": 2, "has_more": True, "timed_out": False}
+
+    client.delete("/attachments")
+
+
+def test_search_stream_scans_off_the_event_loop(client, monkeypatch):
+    """Test streamed search scans documents in the thread pool, not on the event loop."""
+    import asyncio
+    import threading
+
+    import api
+
+    scanned_on = []
+    iter_search = api.core.iter_search
+
+    def recording_iter_search(*args, **kwargs):
+        for result in iter_search(*args, **kwargs):
+            try:
+                asyncio.get_running_loop()
+                scanned_on.append("loop")
+            except RuntimeError:
+                scanned_on.append(threading.current_thread().name)
+            yield result
+
+    client.delete("/attachments")
+    client.post("/attachments/text", json={"text": "threaded match", "suggested_name": "t.txt"})
+    monkeypatch.setattr(api.core, "iter_search", recording_iter_search)
+    response = client.get("/search/stream", params={"q": "threaded", "mode": "regex"})
+    assert '"count": 1' in response.text
+    assert scanned_on and "loop" not in scanned_on
+
+    client.delete("/attachments")
+
+
+def test_search_stream_heartbeats_without_matches():
+    """Test a scan with no matches still hands control back between batches."""
+    import api
+    from core import ScriptboardCore
+    from schemas import SearchMode
+
+    core = ScriptboardCore()
+    for i in range(100):
+        core.add_attachment_from_text(f"nothing here {i}", suggested_name=f"{i}.txt")
+    results = core.iter_search("absent", mode=SearchMode.REGEX, heartbeat=10)
+
+    assert api._next_search_results(results, 20, 0) == ([], False)
+    assert list(core.iter_search("absent", mode=SearchMode.REGEX)) == []
+    results.close()
+
+
+def test_search_invalid_regex(client):
+    """Test an invalid regex returns a 400 error envelope."""
+    response = client.get("/search", params={"q": "(", "mode": "regex"})
+    assert response.status_code == 400
+    assert "error" in response.json()
+
+
+def test_tokens_wait_counts_pending(client):
+    """Test /tokens?wait=true returns fully counted totals."""
+    client.delete("/attachments")
+    client.post("/attachments/text", json={"text": "token text " * 50, "suggested_name": "t.txt"})
+
+    response = client.get("/tokens?wait=true")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["pending"] == 0
+    assert data["attachment_tokens"] > 0
+
+    client.delete("/attachments")
+
+
+def test_tokens_models_matrix(client):
+    """Test /tokens?models= returns one row per requested model."""
+    client.post("/prompt", json={"text": "count me for several models"})
+
+    response = client.get("/tokens?models=gpt-4,claude-3")
+    assert response.status_code == 200
+    rows = response.json()["models"]
+    assert [row["model"] for row in rows] == ["gpt-4", "claude-3"]
+    assert all(row["prompt_tokens"] > 0 for row in rows)
+
+    client.delete("/prompt")
+
+
+def test_export_llm_stream(client):
+    """Test streamed LLM export matches the JSON export, with and without gzip."""
+    client.delete("/prompt")
+    client.delete("/attachments")
+    client.delete("/responses")
+    client.post("/prompt", json={"text": "Stream prompt"})
+    client.post("/attachments/text", json={"text": "x = 1\n" * 20000, "suggested_name": "big.py"})
+
+    expected = client.get("/export/llm").json()["text"]
+
+    response = client.get("/export/llm?stream=true")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert response.text == expected
+
+    response = client.get("/export/llm?stream=true&gzip=true")
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.text == expected
+
+    markdown = client.get("/export/markdown").json()["markdown"]
+    assert client.get("/export/markdown?stream=true").text == markdown
+
+    # gzip only applies to streamed bodies
+    assert client.get("/export/llm?gzip=true").status_code == 400
+    assert client.get("/export/markdown?gzip=true").status_code == 400
+
+    client.delete("/prompt")
+    client.delete("/attachments")
+
+
+def test_export_llm_token_budget(client):
+    """Test /export/llm?budget= trims attachments to fit the budget."""
+    client.delete("/prompt")
+    client.delete("/attachments")
+    client.delete("/responses")
+    for i in range(3):
+        client.post("/attachments/text", json={"text": f"row {i}\n" * 500, "suggested_name": f"b{i}.txt"})
+
+    full = client.get("/export/llm").json()["text"]
+    packed = client.get("/export/llm", params={"budget": 800}).json()["text"]
+    assert len(packed) < len(full)
+    assert "b2.txt" in packed
+    assert client.get("/export/llm", params={"budget": 800, "stream": "true"}).text == packed
+
+    client.delete("/attachments")
@@ -0,0 +1,60 @@
+"""
+Unit tests for crash-safe file writes.
+"""
+
+import os
+import stat
+
+import pytest
+
+import atomic_io
+from atomic_io import (
+    FSYNC_BATCHED,
+    atomic_write,
+    atomic_write_bytes,
+    set_fsync_policy,
+)
+
+
+def test_failed_write_leaves_target_intact(tmp_path):
+    """Test a writer that fails midway leaves the old file and no temp files."""
+    path = tmp_path / "data.json"
+    atomic_write_bytes(path, b"old")
+
+    def torn(f):
+        f.write(b"partial")
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        atomic_write(path, torn)
+    assert path.read_bytes() == b"old"
+    assert [p.name for p in tmp_path.iterdir()] == ["data.json"]
+
+
+@pytest.mark.skipif(os.name == "nt", reason="POSIX permission bits")
+def test_write_keeps_file_mode(tmp_path):
+    """Test replacing a file keeps its mode, and new files get 0666 minus the umask."""
+    path = tmp_path / "config.json"
+    path.write_bytes(b"{}")
+    os.chmod(path, 0o644)
+    atomic_write_bytes(path, b'{"a": 1}')
+    assert stat.S_IMODE(path.stat().st_mode) == 0o644
+
+    os.chmod(path, 0o640)
+    atomic_write_bytes(path, b'{"a": 2}')
+    assert stat.S_IMODE(path.stat().st_mode) == 0o640
+
+    atomic_write_bytes(tmp_path / "new.json", b"{}")
+    assert stat.S_IMODE((tmp_path / "new.json").stat().st_mode) == 0o666 & ~atomic_io._UMASK
+
+
+def test_fsync_policy(monkeypatch):
+    """Test policy validation and that batched mode fsyncs at most once per interval."""
+    with pytest.raises(ValueError):
+        set_fsync_policy("sometimes")
+
+    monkeypatch.setattr(atomic_io, "_last_fsync", float("-inf"))
+    monkeypatch.setattr(atomic_io, "FSYNC_BATCH_INTERVAL", 3600.0)
+    decisions = [atomic_io._should_fsync(FSYNC_BATCHED) for _ in range(3)]
+    assert decisions == [True, False, False]
+
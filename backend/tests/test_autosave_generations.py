@@ -0,0 +1,97 @@
+"""
+Unit tests for the compressed autosave generation ring.
+"""
+
+import api
+from autosave_generations import GenerationWriter, get_generations_dir, list_generations, read_generation
+from autosave_journal import AutosaveJournal
+from core import ScriptboardCore
+
+
+def test_ring_keeps_newest_compressed(tmp_path):
+    """Test generations are compressed, listed newest first, and pruned to the ring size."""
+    writer = GenerationWriter(keep=3, queue_depth=10)
+    payloads = [(b'{"prompt": "%d"}' % i) * 200 for i in range(5)]
+    for payload in payloads:
+        assert writer.submit(tmp_path, payload)
+    assert writer.flush(timeout=5)
+
+    generations = list_generations(tmp_path)
+    assert len(generations) == 3
+    assert [read_generation(tmp_path, gen["id"]) for gen in generations] == payloads[:1:-1]
+    assert all(gen["size"] < len(payloads[0]) for gen in generations)
+    assert generations[0]["created"] >= generations[-1]["created"]
+    assert writer.metrics()["written"] == 5
+    assert writer.metrics()["bytes_out"] < writer.metrics()["bytes_in"]
+
+
+def test_recover_generations(tmp_path, monkeypatch):
+    """Test recovery falls back to generations and can restore a point in time."""
+    autosave_path = tmp_path / "autosave.json"
+    monkeypatch.setattr(api, "get_autosave_path", lambda: autosave_path)
+    monkeypatch.setattr(api, "get_blobs_dir", lambda: tmp_path / "blobs")
+    monkeypatch.setattr(api, "_autosave_journal", AutosaveJournal())
+    monkeypatch.setattr(api, "_generation_writer", GenerationWriter())
+
+    core = ScriptboardCore()
+    core.drain_journal()
+    core.set_prompt("first")
+    api.flush_autosave([], core.session_metadata(), core.to_dict())
+    first = core.to_dict()
+    core.set_prompt("second")
+    api.flush_autosave([], core.session_metadata(), core.to_dict())
+    core.drain_journal()
+    core.add_response("journaled")
+    ops, _ = core.drain_journal()
+    api.flush_autosave(ops, core.session_metadata())
+    api._generation_writer.flush(timeout=5)
+
+    generations = list_generations(get_generations_dir(autosave_path))
+    assert len(generations) == 2
+    assert api.read_autosave(generations[1]["id"]) == first
+
+    # A corrupt live snapshot recovers from the newest generation plus its journal
+    autosave_path.write_bytes(b'{"prompt": "tor')
+    assert api.read_autosave() == core.to_dict()
+
+
+def test_shutdown_waits_for_generations_off_the_event_loop(monkeypatch):
+    """Test the shutdown hook waits for the generation writer in a worker thread."""
+    import asyncio
+    import threading
+
+    waited_on = []
+
+    class RecordingWriter(GenerationWriter):
+        def flush(self, timeout=None):
+            waited_on.append(threading.current_thread() is threading.main_thread())
+            return True
+
+    monkeypatch.setattr(api, "_generation_writer", RecordingWriter())
+    monkeypatch.setattr("file_watcher.stop_watching", lambda: None)
+    asyncio.run(api.shutdown_event())
+    assert waited_on == [False]
+
+
+def test_status_offers_only_older_generations(tmp_path, monkeypatch):
+    """Test has_old_autosave stays false until a generation older than the snapshot exists."""
+    from fastapi.testclient import TestClient
+
+    monkeypatch.setattr(api, "get_autosave_path", lambda: tmp_path / "autosave.json")
+    monkeypatch.setattr(api, "get_blobs_dir", lambda: tmp_path / "blobs")
+    monkeypatch.setattr(api, "_autosave_journal", AutosaveJournal())
+    monkeypatch.setattr(api, "_generation_writer", GenerationWriter())
+    client = TestClient(api.app)
+
+    core = ScriptboardCore()
+    core.set_prompt("first")
+    api.flush_autosave([], core.session_metadata(), core.to_dict())
+    api._generation_writer.flush(timeout=5)
+    status = client.get("/autosave/status").json()
+    assert len(status["generations"]) == 1 and not status["has_old_autosave"]
+
+    core.set_prompt("second")
+    api.flush_autosave([], core.session_metadata(), core.to_dict())
+    api._generation_writer.flush(timeout=5)
+    status = client.get("/autosave/status").json()
+    assert len(status["generations"]) == 2 and status["has_old_autosave"]
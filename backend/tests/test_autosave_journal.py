@@ -0,0 +1,98 @@
+"""
+Unit tests for the autosave journal.
+"""
+
+import json
+
+import api
+from autosave_journal import AutosaveJournal, apply_op, get_journal_path, read_journal, replay_journal
+from core import ScriptboardCore
+
+
+def test_apply_op_matches_core_mutations():
+    """Test replaying recorded operations reproduces the session content."""
+    core = ScriptboardCore()
+    core.set_prompt("start")
+    snapshot = core.to_dict()
+    core.drain_journal()
+
+    core.add_attachment_from_text("a = 1", suggested_name="a.py")
+    core.add_response("reply", source="gpt")
+    core.clear_prompt()
+    core.set_prompt("again", source="clipboard")
+    core.clear_responses()
+    core.add_response("second", source="claude")
+    ops, needs_snapshot = core.drain_journal()
+    assert not needs_snapshot
+
+    for op in ops:
+        apply_op(snapshot, op)
+    assert snapshot == core.to_dict()
+
+
+def test_load_requires_snapshot():
+    """Test loading a session drops recorded ops and asks for a snapshot."""
+    core = ScriptboardCore()
+    assert core.drain_journal() == ([], True)
+    core.set_prompt("x")
+    core.load_from_dict({"prompt": "loaded"})
+    assert core.drain_journal() == ([], True)
+
+
+def test_read_journal_checks_snapshot_and_torn_tail(tmp_path):
+    """Test a journal is only replayed onto its own snapshot, up to a torn line."""
+    path = tmp_path / "autosave.journal.jsonl"
+    journal = AutosaveJournal()
+    journal.start(path, "snap1")
+    journal.append(path, [{"op": "set_prompt", "text": "a", "source": "manual"}])
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"op": "clear_pro')
+
+    assert read_journal(path, "snap1") == [{"op": "set_prompt", "text": "a", "source": "manual"}]
+    assert read_journal(path, "snap2") == []
+    assert journal.ops == 1 and not journal.needs_compaction()
+
+    data = replay_journal({"prompt": "", "autosave_id": "snap1"}, path)
+    assert data == {"prompt": "a", "prompt_source": "manual"}
+
+
+def test_flush_and_recover_roundtrip(tmp_path, monkeypatch):
+    """Test autosave writes a snapshot once, then journals, and recovery replays both."""
+    autosave_path = tmp_path / "autosave.json"
+    monkeypatch.setattr(api, "get_autosave_path", lambda: autosave_path)
+    monkeypatch.setattr(api, "get_blobs_dir", lambda: tmp_path / "blobs")
+    monkeypatch.setattr(api, "_autosave_journal", AutosaveJournal(compact_after_ops=3))
+
+    core = ScriptboardCore()
+    core.set_prompt("first")
+
+    def autosave():
+        ops, needs_snapshot = core.drain_journal()
+        session_data = None
+        if needs_snapshot or api._autosave_journal.needs_compaction():
+            session_data = core.to_dict()
+        api.flush_autosave(ops, core.session_metadata(), session_data)
+
+    autosave()
+    snapshot_text = autosave_path.read_text(encoding="utf-8")
+
+    core.add_attachment_from_text("big " * 1000, suggested_name="big.txt")
+    core.current_profile = "work"
+    autosave()
+    assert autosave_path.read_text(encoding="utf-8") == snapshot_text
+    journal_lines = get_journal_path(autosave_path).read_text(encoding="utf-8").splitlines()
+    ops = [json.loads(line) for line in journal_lines[1:]]
+    assert [op["op"] for op in ops] == ["add_attachment", "set_meta"]
+    assert "content" not in ops[0]["attachment"]  # Content went to the blob store
+
+    assert api.read_autosave() == core.to_dict()
+
+    # Hitting the op limit compacts back into a fresh snapshot
+    core.add_response("one")
+    core.add_response("two")
+    autosave()
+    core.clear_prompt()
+    autosave()
+    assert autosave_path.read_text(encoding="utf-8") != snapshot_text
+    assert api._autosave_journal.ops == 0
+    assert api.read_autosave() == core.to_dict()
@@ -0,0 +1,135 @@
+"""
+Unit tests for the autosave scheduler.
+"""
+
+import asyncio
+
+import api
+from autosave_journal import AutosaveJournal
+from autosave_scheduler import AutosaveScheduler
+from core import ScriptboardCore
+
+
+def test_debounce_coalesces_edits():
+    """Test a burst of edits produces a single save with every dirty section."""
+    saved = []
+
+    async def save(sections):
+        saved.append(sections)
+        return 10
+
+    async def scenario():
+        scheduler = AutosaveScheduler(save, debounce=0.02, max_wait=1.0)
+        for section in ("prompt", "attachments", "attachments"):
+            scheduler.mark_dirty(section)
+            await asyncio.sleep(0.005)
+        await asyncio.sleep(0.1)
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+    assert saved == [frozenset({"prompt", "attachments"})]
+    metrics = scheduler.metrics()
+    assert metrics["saves"] == 1
+    assert metrics["coalesced"] == 2
+    assert metrics["bytes_written"] == 10
+    assert metrics["last_save_time"] is not None
+    assert not metrics["pending"]
+
+
+def test_max_wait_bounds_latency_under_steady_edits():
+    """Test saves still happen while edits keep arriving faster than the debounce."""
+    saved = []
+
+    async def save(sections):
+        saved.append(sections)
+        return None  # Nothing changed: counted as skipped
+
+    async def scenario():
+        scheduler = AutosaveScheduler(save, debounce=0.05, max_wait=0.1)
+        for _ in range(30):
+            scheduler.mark_dirty("attachments")
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.15)
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+    assert len(saved) >= 3  # ~0.3s of edits with a 0.1s max wait, plus the trailing save
+    assert scheduler.saves_skipped == len(saved)
+    assert scheduler.saves == 0
+
+
+def test_failed_save_is_recorded():
+    """Test save errors are counted rather than raised."""
+    async def save(sections):
+        raise OSError("disk full")
+
+    async def scenario():
+        scheduler = AutosaveScheduler(save, debounce=0.01, max_wait=0.05)
+        scheduler.mark_dirty()
+        await asyncio.sleep(0.05)
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+    assert scheduler.failures == 1
+    assert scheduler.last_error == "disk full"
+
+
+def test_autosave_snapshot_matches_capture_time(tmp_path, monkeypatch):
+    """Test edits made after the session was captured are left for the next autosave."""
+    monkeypatch.setattr(api, "get_autosave_path", lambda: tmp_path / "autosave.json")
+    monkeypatch.setattr(api, "get_blobs_dir", lambda: tmp_path / "blobs")
+    monkeypatch.setattr(api, "_autosave_journal", AutosaveJournal())
+    core = ScriptboardCore()
+    monkeypatch.setattr(api, "core", core)
+
+    core.set_prompt("captured")
+    build = core.snapshot_builder()
+    core.add_response("after capture")
+    assert build()["responses"] == []
+
+    async def scenario():
+        core.reset_journal()
+        assert await api._autosave(frozenset({"prompt"})) > 0  # Snapshot
+        core.add_response("journaled")
+        assert await api._autosave(frozenset({"responses"})) > 0  # Journal append
+        assert await api._autosave(frozenset()) is None  # Nothing new
+
+    asyncio.run(scenario())
+    assert api.read_autosave() == core.to_dict()
+
+
+def test_flush_waits_for_save_in_flight():
+    """Test a flush during a running save waits for it, then saves the newer edits."""
+    events = []
+    release = None
+
+    async def save(sections):
+        events.append(("start", sections))
+        if len(events) == 1:
+            await release.wait()
+        events.append(("end", sections))
+        return 1
+
+    async def scenario():
+        nonlocal release
+        release = asyncio.Event()
+        scheduler = AutosaveScheduler(save, debounce=0, max_wait=0)
+        scheduler.mark_dirty("prompt")
+        await asyncio.sleep(0.01)  # Worker save is now blocked
+        scheduler.mark_dirty("attachments")
+        flush = asyncio.ensure_future(scheduler.flush())
+        await asyncio.sleep(0.01)
+        assert events == [("start", frozenset({"prompt"}))]
+        release.set()
+        await flush
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+    assert events == [
+        ("start", frozenset({"prompt"})),
+        ("end", frozenset({"prompt"})),
+        ("start", frozenset({"attachments"})),
+        ("end", frozenset({"attachments"})),
+    ]
+    assert scheduler.saves == 2
+    assert not scheduler.metrics()["pending"]
@@ -0,0 +1,225 @@
+"""
+Unit tests for the content-addressed blob store.
+"""
+
+import json
+import os
+
+import pytest
+
+import api
+from blob_store import BlobStore, content_hash, externalize_session, hydrate_session
+from core import ScriptboardCore
+
+
+def test_put_get_deduplicates(tmp_path):
+    """Test identical content is stored once and read back intact."""
+    store = BlobStore(tmp_path)
+    big = "def f():\n    return 'ü'\n" * 500
+    digest = store.put(big)
+    assert digest == content_hash(big)
+    assert store.put(big) == digest
+    assert store.get(digest) == big
+    assert len(list(tmp_path.rglob("*"))) == 2  # One shard directory, one blob
+
+    path = store.find(digest)
+    assert path.suffix in (".gz", ".zst")
+    assert path.stat().st_size < len(big)
+
+    small = store.put("tiny")
+    assert store.find(small).suffix == ""
+    assert store.get(small) == "tiny"
+
+
+def test_session_manifest_roundtrip(tmp_path):
+    """Test sessions externalize content to blobs and hydrate back unchanged."""
+    core = ScriptboardCore()
+    core.set_prompt("prompt stays inline")
+    core.add_attachment_from_text("shared file\n" * 200, suggested_name="a.txt")
+    core.add_attachment_from_text("shared file\n" * 200, suggested_name="copy.txt")
+    core.add_attachment_from_path("img.png", "", binary=True)
+    core.add_response("answer", source="gpt")
+    session_data = core.to_dict()
+
+    store = BlobStore(tmp_path)
+    manifest = externalize_session(session_data, store)
+    assert manifest["prompt"] == "prompt stays inline"
+    assert all("content" not in att for att in manifest["attachments"][:2])
+    assert manifest["attachments"][0]["content_ref"] == manifest["attachments"][1]["content_ref"]
+    assert hydrate_session(manifest, store) == session_data
+
+    # Sessions saved with inline content load unchanged
+    assert hydrate_session(session_data, store) == session_data
+
+
+def test_save_session_writes_manifest(tmp_path, monkeypatch):
+    """Test save_session writes a small manifest and load_session resolves it."""
+    monkeypatch.setattr(api, "get_sessions_dir", lambda: tmp_path / "sessions")
+    monkeypatch.setattr(api, "get_blobs_dir", lambda: tmp_path / "blobs")
+    (tmp_path / "sessions").mkdir()
+
+    core = ScriptboardCore()
+    core.add_attachment_from_text("x" * 200000, suggested_name="big.txt")
+    session_data = core.to_dict()
+
+    path = api.save_session(session_data, filename="s.json")
+    assert path.stat().st_size < 2000
+    assert "content_ref" in json.loads(path.read_text(encoding="utf-8"))["attachments"][0]
+    assert api.load_session(path) == session_data
+
+
+def test_lazy_load_session(tmp_path, monkeypatch):
+    """Test a lazily loaded session reads blobs on access and re-saves by reference."""
+    monkeypatch.setattr(api, "get_sessions_dir", lambda: tmp_path / "sessions")
+    monkeypatch.setattr(api, "get_blobs_dir", lambda: tmp_path / "blobs")
+    (tmp_path / "sessions").mkdir()
+
+    core = ScriptboardCore()
+    core.add_attachment_from_text("lazy text\n" * 300, suggested_name="l.txt")
+    path = api.save_session(core.to_dict(), filename="lazy.json")
+
+    store = BlobStore(tmp_path / "blobs")
+    loaded = ScriptboardCore()
+    loaded.load_from_dict(api.load_session(path, lazy=True), content_loader=store.read_ref)
+    att = loaded.attachments[0]
+    assert not att.content_loaded
+    assert att.lines == 301
+    assert loaded.to_dict(keep_refs=True) == json.loads(path.read_text(encoding="utf-8"))
+    assert att.content == "lazy text\n" * 300
+
+    # Missing blobs fail the load up front
+    for blob in (tmp_path / "blobs").rglob("*.gz"):
+        blob.unlink()
+    with pytest.raises(ValueError, match="missing"):
+        api.load_session(path, lazy=True)
+
+
+def test_collect_blob_garbage(tmp_path, monkeypatch):
+    """Test unreferenced blobs are deleted while saved sessions and autosave state stay loadable."""
+    monkeypatch.setattr(api, "get_sessions_dir", lambda: tmp_path / "sessions")
+    monkeypatch.setattr(api, "get_blobs_dir", lambda: tmp_path / "blobs")
+    monkeypatch.setattr(api, "get_autosave_path", lambda: tmp_path / "autosave.json")
+    (tmp_path / "sessions").mkdir()
+    store = BlobStore(tmp_path / "blobs")
+
+    kept = ScriptboardCore()
+    kept.add_attachment_from_text("kept " * 300, suggested_name="kept.txt")
+    kept.add_attachment_from_text("shared " * 300, suggested_name="shared.txt")
+    kept_path = api.save_session(kept.to_dict(), filename="kept.json")
+
+    deleted = ScriptboardCore()
+    deleted.add_attachment_from_text("deleted " * 300, suggested_name="deleted.txt")
+    deleted.add_attachment_from_text("shared " * 300, suggested_name="shared.txt")
+    api.save_session(deleted.to_dict(), filename="deleted.json").unlink()
+
+    # Autosave: one attachment in the snapshot, one only in the journal
+    autosaved = ScriptboardCore()
+    autosaved.add_response("snapshot " * 300, source="gpt")
+    api.flush_autosave([], autosaved.session_metadata(), autosaved.to_dict())
+    autosaved.drain_journal()
+    autosaved.add_attachment_from_text("journaled " * 300, suggested_name="j.txt")
+    api.flush_autosave(autosaved.drain_journal()[0], autosaved.session_metadata())
+    api._generation_writer.flush(timeout=5.0)
+
+    # Only blobs outside the grace period are collected
+    assert api.collect_blob_garbage() == (0, 0)
+    for blob in (tmp_path / "blobs").rglob("*"):
+        if blob.is_file():
+            os.utime(blob, (0, 0))
+    orphan = store.put("orphan " * 300)
+    os.utime(store.find(orphan), (0, 0))
+    fresh = store.put("fresh orphan " * 300)
+
+    count, freed = api.collect_blob_garbage()
+    assert count == 2 and freed > 0
+    assert not store.has(orphan) and not store.has(content_hash("deleted " * 300))
+    assert store.has(fresh)
+    assert api.load_session(kept_path) == kept.to_dict()
+    assert api.read_autosave() == autosaved.to_dict()
+
+    # Any file in the sessions directory that cannot be read stops the collection
+    (tmp_path / "sessions" / "notes").write_bytes(b"{not json")
+    with pytest.raises(ValueError):
+        api.collect_blob_garbage()
+
+
+def test_suffixless_session_survives_garbage_collection(tmp_path, monkeypatch):
+    """Test a session saved without an extension gets one and keeps its blobs through GC."""
+    from fastapi.testclient import TestClient
+
+    monkeypatch.setattr(api, "get_sessions_dir", lambda: tmp_path / "sessions")
+    monkeypatch.setattr(api, "get_blobs_dir", lambda: tmp_path / "blobs")
+    monkeypatch.setattr(api, "get_autosave_path", lambda: tmp_path / "autosave.json")
+    (tmp_path / "sessions").mkdir()
+
+    core = ScriptboardCore()
+    core.add_attachment_from_text("my work " * 300, suggested_name="w.txt")
+    monkeypatch.setattr(api, "core", core)
+    saved = TestClient(api.app).post("/sessions/save", params={"filename": "mywork"}).json()
+    assert saved["filename"] == "mywork.json"
+
+    # A manifest saved without an extension before the fix is still scanned
+    legacy = ScriptboardCore()
+    legacy.add_attachment_from_text("legacy " * 300, suggested_name="l.txt")
+    api.save_session(legacy.to_dict(), filename="legacy.json").rename(tmp_path / "sessions" / "legacy")
+
+    for blob in (tmp_path / "blobs").rglob("*"):
+        if blob.is_file():
+            os.utime(blob, (0, 0))
+    assert api.collect_blob_garbage() == (0, 0)
+    assert api.load_session(tmp_path / "sessions" / "mywork.json") == core.to_dict()
+    assert api.load_session(tmp_path / "sessions" / "legacy") == legacy.to_dict()
+
+
+def test_binary_save_keeps_lazy_content_unloaded(tmp_path, monkeypatch):
+    """Test saving a lazily loaded session as binary writes its content without pinning it."""
+    from fastapi.testclient import TestClient
+
+    from session_format import FORMAT_BINARY
+
+    monkeypatch.setattr(api, "get_sessions_dir", lambda: tmp_path / "sessions")
+    monkeypatch.setattr(api, "get_blobs_dir", lambda: tmp_path / "blobs")
+    (tmp_path / "sessions").mkdir()
+    core = ScriptboardCore()
+    core.add_attachment_from_text("lazy text\n" * 300, suggested_name="l.txt")
+    core.add_response("lazy reply " * 200, source="gpt")
+    path = api.save_session(core.to_dict(), filename="lazy.json")
+
+    loaded = ScriptboardCore()
+    loaded.load_from_dict(api.load_session(path, lazy=True), content_loader=BlobStore(tmp_path / "blobs").read_ref)
+    monkeypatch.setattr(api, "core", loaded)
+    saved = TestClient(api.app).post("/sessions/save", params={"filename": "out.sbs", "format": FORMAT_BINARY}).json()
+
+    assert not loaded.attachments[0].content_loaded
+    assert not loaded.responses[0].content_loaded
+    assert api.load_session(tmp_path / "sessions" / saved["filename"]) == core.to_dict()
+
+
+def test_invalid_refs_are_missing(tmp_path, monkeypatch):
+    """Test refs that are not hex digests never reach the filesystem and count as missing."""
+    from blob_store import BlobNotFoundError, missing_refs
+
+    monkeypatch.setattr(api, "get_sessions_dir", lambda: tmp_path / "sessions")
+    monkeypatch.setattr(api, "get_blobs_dir", lambda: tmp_path / "blobs")
+    (tmp_path / "sessions").mkdir()
+    store = BlobStore(tmp_path / "blobs")
+    secret = tmp_path / "secret"
+    secret.write_text("outside the store", encoding="utf-8")
+    escape = "sha256:../../secret"
+
+    assert not store.has("../../secret")
+    with pytest.raises(BlobNotFoundError):
+        store.read_ref(escape)
+    manifest = {"attachments": [{"id": "att_1", "filename": "a.txt", "content_ref": escape}]}
+    assert missing_refs(manifest, store) == [escape]
+    (tmp_path / "sessions" / "crafted.json").write_text(json.dumps(manifest), encoding="utf-8")
+    with pytest.raises(ValueError, match="missing"):
+        api.load_session(tmp_path / "sessions" / "crafted.json", lazy=True)
+
+    # Garbage collection only ever deletes blobs
+    stray = tmp_path / "blobs" / "ab" / "notes.txt"
+    stray.parent.mkdir(parents=True)
+    stray.write_text("not a blob", encoding="utf-8")
+    os.utime(stray, (0, 0))
+    assert store.collect_garbage([escape], grace_seconds=0) == (0, 0)
+    assert stray.exists() and secret.exists()
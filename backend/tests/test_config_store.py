@@ -0,0 +1,85 @@
+"""
+Unit tests for the cached config store.
+"""
+
+import json
+import os
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import api
+from config_store import ConfigStore
+
+
+def _counting_reader(calls):
+    def reader(path):
+        calls.append(path)
+        return api.read_config_file(path)
+    return reader
+
+
+def test_load_is_cached_until_file_changes(tmp_path):
+    """Test the file is only re-read when its mtime or size changes."""
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({"theme": "dark", "prompts": {"0001": {"label": "A", "text": "a"}}}), encoding="utf-8")
+    calls = []
+    store = ConfigStore(_counting_reader(calls))
+
+    first = store.load(path)
+    assert store.load(path) is first
+    assert len(calls) == 1
+
+    path.write_text(json.dumps({"theme": "light", "prompts": {}}), encoding="utf-8")
+    os.utime(path, ns=(1, 1))  # Force a different mtime even on coarse clocks
+    assert store.load(path)["theme"] == "light"
+    assert len(calls) == 2
+
+
+def test_migration_written_back_once(tmp_path):
+    """Test migrated prompt keys are written back and not re-migrated per load."""
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({"prompts": {"1": {"label": "Mine", "text": "x"}}}), encoding="utf-8")
+    calls = []
+    store = ConfigStore(_counting_reader(calls))
+
+    config = store.load(path)
+    assert "0001" in config["prompts"]
+    assert "0001" in json.loads(path.read_text(encoding="utf-8"))["prompts"]
+    store.load(path)
+    assert len(calls) == 1  # The write-back refreshed the cached signature
+
+
+def test_update_is_atomic_and_abortable(tmp_path):
+    """Test updates write through the cache and failed mutations change nothing."""
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({"favorites": [], "prompts": {}}), encoding="utf-8")
+    store = ConfigStore(api.read_config_file)
+
+    store.update(path, lambda config: config["favorites"].append({"label": "x", "path": "/x"}))
+    assert store.load(path)["favorites"] == [{"label": "x", "path": "/x"}]
+    assert json.loads(path.read_text(encoding="utf-8"))["favorites"] == [{"label": "x", "path": "/x"}]
+
+    def reject(config):
+        config["favorites"].clear()
+        raise HTTPException(status_code=409, detail="duplicate")
+
+    with pytest.raises(HTTPException):
+        store.update(path, reject)
+    assert len(store.load(path)["favorites"]) == 1
+    assert len(json.loads(path.read_text(encoding="utf-8"))["favorites"]) == 1
+    assert [p.name for p in tmp_path.iterdir()] == ["config.json"]
+
+
+def test_favorites_endpoints_use_store(tmp_path, monkeypatch):
+    """Test favorites endpoints update the config file and cached config."""
+    monkeypatch.setattr(api, "get_config_path", lambda: tmp_path / "config.json")
+    (tmp_path / "config.json").write_text(json.dumps({"favorites": [], "prompts": {}}), encoding="utf-8")
+    client = TestClient(api.app)
+
+    assert client.post("/favorites", json={"label": "Repo", "path": "/repo"}).status_code == 200
+    assert client.post("/favorites", json={"label": "Again", "path": "/repo"}).status_code == 409
+    assert client.get("/config").json()["favorites"] == [{"label": "Repo", "path": "/repo"}]
+    assert client.delete("/favorites/0").status_code == 200
+    assert json.loads((tmp_path / "config.json").read_text(encoding="utf-8"))["favorites"] == []
@@ -2,8 +2,11 @@
 Unit tests for ScriptboardCore.
 """
 
+import sys
+
 import pytest
 from core import ScriptboardCore, Attachment, ResponseItem
+from schemas import SearchMode
 
 
 class TestScriptboardCore:
@@ -99,3 +102,396 @@ class TestScriptboardCore:
         assert len(core.attachments) == 1
         assert len(core.responses) == 1
 
+
+    def test_search_index_tracks_mutations(self):
+        """Test search stays correct as content is added and cleared."""
+        core = ScriptboardCore()
+        core.set_prompt("Prompt about Widgets")
+        core.add_attachment_from_text("widget factory notes", suggested_name="a.txt")
+        core.add_response("Nothing relevant", source="GPT")
+
+        assert core.search("WIDGET")["total"] == 2
+
+        core.set_prompt("Something else")
+        assert core.search("widget")["total"] == 1
+
+        core.clear_attachments()
+        assert core.search("widget")["total"] == 0
+
+        core.add_response("Another widget", source="Claude")
+        results = core.search("widget")
+        assert results["total"] == 1
+        assert results["results"][0]["name"] == "Response from Claude"
+
+    def test_search_short_query(self):
+        """Test queries shorter than a trigram still scan every document."""
+        core = ScriptboardCore()
+        core.add_attachment_from_text("ab", suggested_name="a.txt")
+        core.add_response("xaby", source="GPT")
+        assert core.search("ab")["total"] == 2
+
+    def test_search_index_rebuilt_on_load(self):
+        """Test loading a session re-indexes its content."""
+        core = ScriptboardCore()
+        core.add_attachment_from_text("stale content", suggested_name="old.txt")
+        core.load_from_dict({
+            "prompt": "fresh prompt",
+            "attachments": [{"id": "att_1", "filename": "new.txt", "content": "fresh attachment"}],
+        })
+        assert core.search("stale")["total"] == 0
+        assert core.search("fresh")["total"] == 2
+
+    def test_ranked_search(self):
+        """Test ranked search orders by relevance and returns every offset."""
+        core = ScriptboardCore()
+        core.add_attachment_from_text("needle once " + "filler " * 20, suggested_name="low.txt")
+        core.add_attachment_from_text("needle needle NEEDLE", suggested_name="high.txt")
+        core.add_response("no match here", source="GPT")
+
+        results = core.search("needle", ranked=True)
+        assert results["total"] == 2
+        top = results["results"][0]
+        assert top["name"] == "high.txt"
+        assert top["match_count"] == 3
+        assert top["matches"] == [0, 7, 14]
+        assert top["score"] > results["results"][1]["score"]
+
+        page = core.search("needle", limit=1, offset=1, ranked=True)
+        assert page["total"] == 2
+        assert [r["name"] for r in page["results"]] == ["low.txt"]
+
+        # Same response shape as the other modes
+        assert results.keys() == core.search("needle").keys()
+        assert results["timed_out"] is False and core.search("", ranked=True)["timed_out"] is False
+
+    def test_search_modes(self):
+        """Test regex and fuzzy search modes."""
+        core = ScriptboardCore()
+        core.add_attachment_from_text("error code 404 returned", suggested_name="log.txt")
+        core.add_response("Recieved the payload", source="GPT")
+
+        regex_results = core.search(r"code \d+", mode=SearchMode.REGEX)
+        assert regex_results["total"] == 1
+        assert regex_results["timed_out"] is False
+
+        fuzzy_results = core.search("received", mode=SearchMode.FUZZY)
+        assert [r["name"] for r in fuzzy_results["results"]] == ["Response from GPT"]
+
+        with pytest.raises(ValueError):
+            core.search("[", mode=SearchMode.REGEX)
+
+    def test_search_time_budget(self):
+        """Test an exhausted time budget returns partial results."""
+        core = ScriptboardCore()
+        core.add_attachment_from_text("some text", suggested_name="a.txt")
+        results = core.search("text", mode=SearchMode.REGEX, time_budget=-1)
+        assert results["timed_out"] is True
+        assert results["total"] == 0
+
+    def test_incremental_token_totals(self, monkeypatch):
+        """Test token totals track mutations and report pending work."""
+        import token_counter
+        monkeypatch.setattr(token_counter, "get_encoding", lambda model: None)
+
+        core = ScriptboardCore()
+        core.set_prompt("p" * 40)
+        core.add_attachment_from_text("a" * 80, suggested_name="a.txt")
+        core.add_response("r" * 20, source="GPT")
+
+        counts = core.get_token_counts()
+        assert counts["pending"] == 3
+        assert counts["total_tokens"] == 0
+
+        core.count_pending_tokens()
+        counts = core.get_token_counts()
+        assert counts["pending"] == 0
+        assert (counts["prompt_tokens"], counts["attachment_tokens"], counts["response_tokens"]) == (10, 20, 5)
+
+        # Cached content is counted immediately, replaced content leaves the totals
+        core.add_attachment_from_text("a" * 80, suggested_name="b.txt")
+        core.set_prompt("")
+        counts = core.get_token_counts()
+        assert counts["pending"] == 0
+        assert counts["attachment_tokens"] == 40
+        assert counts["prompt_tokens"] == 0
+
+        core.clear_attachments()
+        core.clear_responses()
+        assert core.get_token_counts()["total_tokens"] == 0
+
+    def test_stale_token_counts_ignored(self, monkeypatch):
+        """Test counts for content replaced mid-count are discarded."""
+        import token_counter
+        monkeypatch.setattr(token_counter, "get_encoding", lambda model: None)
+
+        core = ScriptboardCore()
+        core.set_prompt("old prompt text")
+        snapshot = core.pending_token_items()
+        counts = core.count_tokens_for(snapshot)
+        core.set_prompt("x" * 400)
+        core.apply_token_counts(snapshot, counts)
+
+        assert core.get_token_counts()["prompt_tokens"] == 0
+        assert core.get_token_counts()["pending"] == 1
+
+    def test_preview_truncation(self):
+        """Test preview truncation matches line splitting on every line break type."""
+        from core import truncate_lines
+
+        assert truncate_lines("a\nb\r\nc\rd", 3) == "a\nb\nc\n..."
+        assert truncate_lines("a\nb\nc\n", 3) == "a\nb\nc\n"
+        assert truncate_lines("\n\n\nx", 3) == "\n\n\n..."
+        assert truncate_lines("a\nb", 0) == "\n..."
+
+        core = ScriptboardCore()
+        core.set_prompt("1\n2\n3\n4")
+        assert core.build_preview(max_lines=2) == "=== PROMPT ===\n1\n2\n..."
+        core.set_prompt("short")
+        assert core.build_preview(max_lines=2) == "=== PROMPT ===\nshort"
+
+    def test_render_cache_invalidated_on_mutation(self):
+        """Test memoized exports reflect every mutation."""
+        core = ScriptboardCore()
+        core.set_prompt("Prompt", source="clipboard")
+        core.add_attachment_from_text("print(1)", suggested_name="a.py")
+        first = core.build_llm_friendly_export()
+        assert core.build_llm_friendly_export() == first
+        assert "```\nprint(1)\n```" in first
+
+        core.add_response("Answer", source="gpt")
+        assert "## Response 1: gpt" in core.build_llm_friendly_export()
+        assert "[gpt]\nAnswer" in core.build_combined_preview()
+
+        core.clear_attachments()
+        assert "ATTACHMENTS" not in core.build_llm_friendly_export()
+        assert "ATTACHMENTS" not in core.build_combined_preview()
+
+        core.load_from_dict({"prompt": "Loaded", "attachments": [], "responses": []})
+        assert core.build_llm_friendly_prompt() == "# PROMPT\n\nLoaded"
+        assert core.build_combined_preview() == "=== PROMPT ===\nLoaded"
+
+    def test_render_invalidated_while_rendering_is_not_cached(self):
+        """Test a render that races an invalidation (as in a worker thread) is not stored."""
+        core = ScriptboardCore()
+        core.set_prompt("old")
+
+        def render():
+            text = core._render_llm_prompt()
+            core.set_prompt("new")
+            return text
+
+        assert core._cached_render("llm", "prompt", render).endswith("\n\nold")
+        assert core.build_llm_friendly_prompt().endswith("\n\nnew")
+
+    def test_export_generators_match_builders(self):
+        """Test streamed exports produce the same text as the string builders."""
+        from core import chunk_text
+
+        core = ScriptboardCore()
+        assert "".join(core.iter_llm_friendly_export()) == core.build_llm_friendly_export()
+        core.add_attachment_from_text("data " * 1000, suggested_name="notes")
+        core.add_attachment_from_path("img.png", "", binary=True)
+        core.add_response("reply", source="claude")
+        assert "".join(core.iter_llm_friendly_export()) == core.build_llm_friendly_export()
+        assert "".join(core.iter_combined_preview()) == core.build_combined_preview()
+
+        assert list(chunk_text(["abcdefg", "", "h"], size=3)) == ["abc", "def", "g", "h"]
+
+    def test_token_budgeted_export(self, monkeypatch):
+        """Test budgeted exports keep the newest attachments and truncate to fit."""
+        import token_counter
+        monkeypatch.setattr(token_counter, "get_encoding", lambda model: None)
+
+        core = ScriptboardCore()
+        core.set_prompt("Fix the bug")
+        for i in range(4):
+            core.add_attachment_from_text(f"line {i}\n" * 200, suggested_name=f"f{i}.txt")
+
+        full = core.build_llm_friendly_export()
+        assert core.build_llm_friendly_export(token_budget=10 ** 6) == full
+
+        packed = core.build_llm_friendly_export(token_budget=900)
+        assert len(packed) // 4 <= 900
+        assert "f3.txt" in packed and "f2.txt" in packed
+        assert "f0.txt" not in packed
+        assert "truncated to fit token budget" in packed
+        assert "omitted to fit the token budget" in packed
+
+        attachments, omitted = core.pack_attachments(900)
+        assert [att.filename for att in attachments][-2:] == ["f2.txt", "f3.txt"]
+        assert omitted == 4 - len(attachments)
+        assert core.attachments[1].content == "line 1\n" * 200
+
+    def test_token_budgeted_export_stays_within_budget(self, monkeypatch):
+        """Test the assembled export fits the budget when attachments are skipped."""
+        import core as core_module
+        import token_counter
+        from token_counter import count_tokens_batch
+        monkeypatch.setattr(token_counter, "get_encoding", lambda model: None)
+
+        core = ScriptboardCore()
+        core.set_prompt("Summarize these files")
+        core.add_response("earlier answer", source="claude")
+        for i in range(30):
+            core.add_attachment_from_text("x" * (7 + i % 5), suggested_name=f"file_{i}.txt")
+        core.add_attachment_from_text("big\n" * 500, suggested_name="big.txt")
+
+        # The assembled export is counted at most twice, however many attachments are shed
+        export_counts = []
+
+        def counting(texts, model=token_counter.DEFAULT_MODEL):
+            export_counts.extend(text for text in texts if text.startswith(core_module.EXPORT_HEADER))
+            return count_tokens_batch(texts, model)
+
+        monkeypatch.setattr(core_module, "count_tokens_batch", counting)
+        for budget in (60, 150, 300, 450):
+            export_counts.clear()
+            export = core.build_llm_friendly_export(token_budget=budget)
+            assert count_tokens_batch([export])[0] <= budget
+            assert "omitted to fit the token budget" in export
+            assert len(export_counts) <= 2
+
+    def test_lazy_load_defers_content(self, monkeypatch):
+        """Test referenced content is only read when previews, search or exports need it."""
+        import token_counter
+        monkeypatch.setattr(token_counter, "get_encoding", lambda model: None)
+
+        blobs = {"sha256:a": "alpha needle\nline two", "sha256:b": "beta reply"}
+        reads = []
+
+        def loader(ref):
+            reads.append(ref)
+            return blobs[ref]
+
+        core = ScriptboardCore()
+        core.load_from_dict({
+            "prompt": "inline prompt",
+            "attachments": [{"id": "att_1", "filename": "a.txt", "content_ref": "sha256:a", "chars": 21, "lines": 2}],
+            "responses": [{"id": "resp_1", "source": "gpt", "content_ref": "sha256:b", "chars": 10, "lines": 1}],
+        }, content_loader=loader)
+
+        # Metadata comes from the manifest
+        assert core.get_session_summary()["total_chars"] == len("inline prompt") + 31
+        assert core.attachments[0].lines == 2
+        assert core.to_dict(keep_refs=True)["attachments"][0]["content_ref"] == "sha256:a"
+        assert reads == []
+
+        # Token counting and exports read without keeping the content loaded
+        core.count_pending_tokens()
+        assert core.get_token_counts()["attachment_tokens"] == 21 // 4
+        assert "beta reply" in core.build_llm_friendly_export()
+        assert not core.attachments[0].content_loaded
+
+        # Search reads deferred content it has not indexed yet, without keeping it
+        reads.clear()
+        results = core.search("needle")["results"]
+        assert [r["id"] for r in results] == ["att_1"]
+        assert not core.attachments[0].content_loaded
+        assert not core.responses[0].content_loaded
+
+        # Background indexing reads each item once; searches then skip non-candidates
+        items = core.pending_deferred_items(10)
+        core.apply_derived(items, core.derive_deferred(items))
+        assert not core.has_unindexed_content
+        reads.clear()
+        assert core.search("needle")["total"] == 1
+        assert reads == ["sha256:a"]
+        assert core.to_dict()["responses"][0]["content"] == "beta reply"
+
+    def test_compact_slotted_items(self):
+        """Test items have no __dict__, get counter IDs, and never reuse loaded IDs."""
+        core = ScriptboardCore()
+        att = core.add_attachment_from_text("x", suggested_name="a.txt")
+        assert not hasattr(att, "__dict__")
+        assert att.id.startswith("att_") and att.id[4:].isdigit()
+
+        next_id = int(att.id[4:]) + 1000
+        core.load_from_dict({"responses": [{"id": f"resp_{next_id}", "source": "gpt", "content": "hi"}]})
+        assert core.responses[0].source is sys.intern("".join(["g", "pt"]))
+        assert int(core.add_response("again").id[5:]) > next_id
+
+    def test_item_ids_not_reissued_after_restart(self):
+        """Test a new process's counter starts above IDs issued by an earlier one."""
+        import time
+        from core import _ItemIds
+
+        before = _ItemIds()
+        issued = [before.new("att") for _ in range(100)]
+        time.sleep(0.01)
+        after = _ItemIds()
+        assert int(after.new("att")[4:]) > max(int(item_id[4:]) for item_id in issued)
+
+    def test_snapshot_reuses_saved_refs(self):
+        """Test a content saver runs once per content, until the content is replaced."""
+        saved = []
+
+        def saver(text):
+            saved.append(text)
+            return f"sha256:{len(saved)}"
+
+        core = ScriptboardCore()
+        att = core.add_attachment_from_text("one\ntwo", suggested_name="a.txt")
+        core.add_response("reply", source="gpt")
+        first = core.snapshot_builder(keep_refs=True, content_saver=saver)()
+        second = core.snapshot_builder(keep_refs=True, content_saver=saver)()
+        assert saved == ["one\ntwo", "reply"]
+        assert first == second
+        assert first["attachments"][0]["content_ref"] == "sha256:1"
+        assert (first["attachments"][0]["chars"], first["attachments"][0]["lines"]) == (7, 2)
+        assert core.to_dict()["attachments"][0]["content"] == "one\ntwo"
+
+        att.content = "changed"
+        assert att.lines == 1
+        third = core.snapshot_builder(keep_refs=True, content_saver=saver)()
+        assert third["attachments"][0]["content_ref"] == "sha256:3"
+
+    def test_worker_search_does_not_index_replaced_content(self):
+        """Test a worker-thread search never indexes content replaced while it was being read."""
+        import threading
+
+        reading = threading.Event()
+        release = threading.Event()
+
+        def loader(ref):
+            reading.set()
+            release.wait(5)
+            return "old needle"
+
+        core = ScriptboardCore()
+        core.load_from_dict(
+            {"attachments": [{"id": "att_1", "filename": "a.txt", "content_ref": "sha256:a"}]},
+            content_loader=loader,
+        )
+        worker = threading.Thread(target=core.search, args=("zzz",), kwargs={"mode": SearchMode.FUZZY})
+        worker.start()
+        assert reading.wait(5)
+        core.update_attachment("att_1", "fresh haystack")
+        release.set()
+        worker.join()
+
+        assert core.search("haystack")["total"] == 1
+        assert core.search("needle")["total"] == 0
+
+    def test_ranked_search_reads_one_document_at_a_time(self):
+        """Test ranked search over deferred content never holds every match in memory."""
+        import tracemalloc
+
+        size = 1024 * 1024
+        core = ScriptboardCore()
+        core.load_from_dict(
+            {"attachments": [
+                {"id": f"att_{i}", "filename": f"{i}.txt", "content_ref": f"sha256:{i}", "chars": size, "lines": 1}
+                for i in range(20)
+            ]},
+            content_loader=lambda ref: "needle " * (int(ref[7:]) + 1) + "x" * size,
+        )
+
+        tracemalloc.start()
+        results = core.search("needle", limit=2, ranked=True)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        assert results["total"] == 20
+        assert [r["id"] for r in results["results"]] == ["att_19", "att_18"]
+        assert results["results"][0]["match_count"] == 20
+        assert peak < 6 * size
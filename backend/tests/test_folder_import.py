@@ -0,0 +1,217 @@
+"""
+Unit tests for threaded folder import.
+"""
+
+import json
+import threading
+
+from fastapi.testclient import TestClient
+
+import api
+from core import ScriptboardCore
+from folder_import import (
+    BUDGET_EXHAUSTED,
+    STATUS_BINARY,
+    STATUS_SKIPPED,
+    STATUS_TEXT,
+    IgnoreRules,
+    ImportOptions,
+    iter_import,
+)
+
+
+def make_tree(root):
+    (root / "src" / "pkg").mkdir(parents=True)
+    (root / "README.md").write_text("# readme", encoding="utf-8")
+    (root / "src" / "b.py").write_text("b = 2", encoding="utf-8")
+    (root / "src" / "a.py").write_text("a = 1", encoding="utf-8")
+    (root / "src" / "pkg" / "c.js").write_text("c", encoding="utf-8")
+    (root / "logo.png").write_bytes(b"\x89PNG\x00")
+    (root / "data.json").write_bytes(b"{}" + b"\x00" * 10)
+
+
+def test_iter_import_order_and_sniffing(tmp_path):
+    """Test files come back in sorted walk order with binary content detected."""
+    make_tree(tmp_path)
+    records = list(iter_import(str(tmp_path), workers=2))
+
+    assert [r.rel_path for r in records] == [
+        "README.md", "data.json", "logo.png", "src/a.py", "src/b.py", "src/pkg/c.js",
+    ]
+    status = {r.rel_path: r.status for r in records}
+    assert status["data.json"] == STATUS_SKIPPED
+    assert status["logo.png"] == STATUS_BINARY
+    assert status["src/a.py"] == STATUS_TEXT
+    assert records[3].content == "a = 1"
+
+
+def test_iter_import_cancel(tmp_path):
+    """Test a set cancel event stops the import."""
+    for i in range(50):
+        (tmp_path / f"{i:02}.txt").write_text("x", encoding="utf-8")
+    cancel = threading.Event()
+    files = iter_import(str(tmp_path), workers=1, cancel=cancel)
+    next(files)
+    cancel.set()
+    assert len(list(files)) < 49
+
+
+def test_folder_endpoints(tmp_path, monkeypatch):
+    """Test the JSON and streaming import endpoints add the same attachments."""
+    make_tree(tmp_path)
+    client = TestClient(api.app)
+
+    monkeypatch.setattr(api, "core", ScriptboardCore())
+    response = client.post("/attachments/folder", json={"path": str(tmp_path)})
+    assert response.json()["imported"] == 5
+    assert response.json()["skipped"] == 1
+    expected = [att.filename for att in api.core.list_attachments()]
+    assert expected[0] == "README.md"
+
+    monkeypatch.setattr(api, "core", ScriptboardCore())
+    with client.stream("POST", "/attachments/folder/stream", json={"path": str(tmp_path)}) as response:
+        events = [json.loads(line[6:]) for line in response.iter_lines() if line.startswith("data: ")]
+    assert events[0]["type"] == "start"
+    assert events[-1]["type"] == "done"
+    assert events[-1]["imported"] == 5
+    assert events[-1]["cancelled"] is False
+    assert [att.filename for att in api.core.list_attachments()] == expected
+
+    assert client.post("/attachments/folder/cancel/unknown").status_code == 404
+    assert client.post("/attachments/folder/stream", json={"path": str(tmp_path / "missing")}).status_code == 400
+
+
+def test_ignore_rules():
+    """Test gitignore pattern semantics: anchoring, directories, "**", negation."""
+    rules = IgnoreRules(["# comment", "*.log", "!keep.log", "/build", "out/", "docs/**/*.tmp", r"\#notes"])
+    assert rules.match("a/b/debug.log", False) is True
+    assert rules.match("a/keep.log", False) is False
+    assert rules.match("build", True) is True
+    assert rules.match("src/build", True) is None
+    assert rules.match("src/out", True) is True
+    assert rules.match("src/out", False) is None
+    assert rules.match("docs/x.tmp", False) is True
+    assert rules.match("docs/a/b/x.tmp", False) is True
+    assert rules.match("#notes", False) is True
+    assert IgnoreRules(["*.py"], base="src/").match("lib/a.py", False) is None
+
+
+def test_filters_prune_and_cap(tmp_path):
+    """Test skip dirs, nested ignore files, globs, and size and byte budgets."""
+    make_tree(tmp_path)
+    (tmp_path / "node_modules" / "lib").mkdir(parents=True)
+    (tmp_path / "node_modules" / "lib" / "index.js").write_text("x", encoding="utf-8")
+    (tmp_path / ".gitignore").write_text("*.json\ngenerated/\n", encoding="utf-8")
+    (tmp_path / "src" / ".ignore").write_text("b.py\n", encoding="utf-8")
+    (tmp_path / "src" / "generated").mkdir()
+    (tmp_path / "src" / "generated" / "big.txt").write_text("x", encoding="utf-8")
+    (tmp_path / "huge.txt").write_text("x" * 100, encoding="utf-8")
+
+    def imported(**kwargs):
+        options = ImportOptions(**kwargs)
+        return [r.rel_path for r in iter_import(str(tmp_path), options=options) if r.status != STATUS_SKIPPED]
+
+    assert imported(max_file_bytes=50) == [".gitignore", "README.md", "logo.png", "src/.ignore", "src/a.py", "src/pkg/c.js"]
+    assert imported(include=["*.py", "src/**/*.js"]) == ["src/a.py", "src/pkg/c.js"]
+    assert imported(exclude=["src/"]) == [".gitignore", "README.md", "huge.txt", "logo.png"]
+    assert "node_modules/lib/index.js" in imported(use_ignore_files=False, skip_dirs=frozenset())
+
+    records = list(iter_import(str(tmp_path), options=ImportOptions(include=["*.md", "*.py"], max_total_bytes=10)))
+    assert [r.rel_path for r in records] == ["README.md", "src/a.py"]
+    assert records[-1].error == BUDGET_EXHAUSTED
+
+
+def test_folder_endpoint_options(tmp_path, monkeypatch):
+    """Test filter keys are validated and a token budget stops the import."""
+    make_tree(tmp_path)
+    client = TestClient(api.app)
+    monkeypatch.setattr(api, "core", ScriptboardCore())
+
+    assert client.post("/attachments/folder", json={"path": str(tmp_path), "exclude": "*.py"}).status_code == 400
+    assert client.post("/attachments/folder", json={"path": str(tmp_path), "max_tokens": -1}).status_code == 400
+
+    response = client.post("/attachments/folder", json={"path": str(tmp_path), "include": ["*.py"], "max_tokens": 1})
+    assert response.json()["budget_exhausted"] is True
+    assert response.json()["files"] == ["src/a.py"]
+
+
+def test_folder_sync(tmp_path, monkeypatch):
+    """Test sync reads only changed files, keeps IDs, and journals a replayable change."""
+    from autosave_journal import apply_op
+
+    make_tree(tmp_path)
+    client = TestClient(api.app)
+    monkeypatch.setattr(api, "core", ScriptboardCore())
+    assert client.post("/attachments/folder/sync", json={"path": str(tmp_path)}).status_code == 404
+    client.post("/attachments/folder", json={"path": str(tmp_path)})
+    ids = {att.filename: att.id for att in api.core.list_attachments()}
+    api.core.drain_journal()
+    before = api.core.to_dict()
+
+    (tmp_path / "src" / "a.py").write_text("a = 10", encoding="utf-8")
+    (tmp_path / "src" / "pkg" / "c.js").unlink()
+    (tmp_path / "src" / "new.py").write_text("new", encoding="utf-8")
+    response = client.post("/attachments/folder/sync", json={"path": str(tmp_path)}).json()
+
+    assert (response["imported"], response["updated"], response["removed"]) == (1, 1, 1)
+    assert response["unchanged"] == 4
+    attachments = {att.filename: att for att in api.core.list_attachments()}
+    assert attachments["src/a.py"].id == ids["src/a.py"]
+    assert attachments["src/a.py"].content == "a = 10"
+    assert "src/pkg/c.js" not in attachments
+    assert attachments["src/new.py"].content == "new"
+
+    ops, _ = api.core.drain_journal()
+    for op in ops:
+        apply_op(before, op)
+    assert before == api.core.to_dict()
+
+
+def test_folder_sync_keeps_budgets(tmp_path, monkeypatch):
+    """Test a sync applies the import's budgets and only picks up real changes."""
+    make_tree(tmp_path)
+    client = TestClient(api.app)
+    monkeypatch.setattr(api, "core", ScriptboardCore())
+    response = client.post("/attachments/folder", json={"path": str(tmp_path), "max_total_bytes": 10}).json()
+    assert response["budget_exhausted"] is True
+    names = [att.filename for att in api.core.list_attachments()]
+    assert names == ["README.md", "logo.png"]
+
+    response = client.post("/attachments/folder/sync", json={"path": str(tmp_path)}).json()
+    assert (response["imported"], response["removed"], response["budget_exhausted"]) == (0, 0, True)
+    assert [att.filename for att in api.core.list_attachments()] == names
+
+    (tmp_path / "README.md").unlink()
+    response = client.post("/attachments/folder/sync", json={"path": str(tmp_path)}).json()
+    assert (response["imported"], response["removed"]) == (2, 1)
+    assert [att.filename for att in api.core.list_attachments()] == ["logo.png", "src/a.py", "src/b.py"]
+
+
+def test_default_options_map_large_files(tmp_path):
+    """Test files over the default size cap are memory-mapped instead of skipped."""
+    from folder_import import MAP_THRESHOLD_BYTES, MAX_FILE_BYTES
+
+    (tmp_path / "big.txt").write_text("x" * max(MAP_THRESHOLD_BYTES, MAX_FILE_BYTES + 1), encoding="utf-8")
+    (tmp_path / "small.txt").write_text("small", encoding="utf-8")
+    records = {r.rel_path: r for r in iter_import(str(tmp_path), options=ImportOptions())}
+
+    assert records["big.txt"].status == STATUS_TEXT
+    assert records["big.txt"].mapped is not None
+    assert records["big.txt"].content is None
+    assert records["small.txt"].mapped is None
+
+
+def test_default_options_skip_oversized_files(tmp_path):
+    """Test files over the mapped-file cap are skipped unread with default options."""
+    from folder_import import MAX_MAPPED_BYTES, STATUS_SKIPPED
+
+    with open(tmp_path / "dump.txt", "wb") as f:
+        f.truncate(MAX_MAPPED_BYTES + 1)  # Sparse: costs no disk or reads
+    record = next(iter_import(str(tmp_path), options=ImportOptions()))
+
+    assert record.status == STATUS_SKIPPED
+    assert record.mapped is None
+    assert "larger than" in record.error
+
+    options = ImportOptions(max_mapped_bytes=None)
+    assert ImportOptions.from_dict(options.to_dict()).max_mapped_bytes is None
@@ -0,0 +1,237 @@
+"""
+Unit tests for memory-mapped attachments.
+"""
+
+import tracemalloc
+
+from fastapi.testclient import TestClient
+
+import api
+import mapped_file
+from autosave_journal import apply_op
+from core import Attachment, ScriptboardCore
+from mapped_file import MappedText
+
+
+def test_mapped_text_matches_decoded_file(tmp_path, monkeypatch):
+    """Test counts, chunked decoding, and prefixes match the decoded text, across chunk boundaries."""
+    monkeypatch.setattr(mapped_file, "MAP_CHUNK_BYTES", 7)
+    text = "héllo wörld\n" * 20 + "tail ✓"
+    path = tmp_path / "log.txt"
+    path.write_text(text, encoding="utf-8")
+
+    mapped = MappedText(str(path))
+    assert mapped.lines == text.count("\n") + 1
+    assert mapped.chars == len(text)
+    assert mapped.read_text() == text
+    assert "".join(mapped.iter_text(chunk_bytes=5)) == text
+    assert mapped.read_prefix(2) == ("héllo wörld\n" * 3, False)
+    assert mapped.read_prefix(100)[1] is True
+
+    # Reads serve the current mapping; only refresh() re-maps
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("\nmore")
+    assert mapped.read_text() == text
+    mapped.refresh()
+    assert mapped.read_text().endswith("tail ✓\nmore")
+    assert mapped.lines == text.count("\n") + 2
+
+
+def test_mapped_text_truncated_in_place(tmp_path):
+    """Test reads stop at the new end of a file truncated in place, before refresh() re-maps it."""
+    path = tmp_path / "log.txt"
+    path.write_text("first\nsecond\n", encoding="utf-8")
+    mapped = MappedText(str(path))
+    version = mapped.version
+
+    with open(path, "r+b") as f:
+        f.truncate(6)
+    assert mapped.read_text() == "first\n"
+    assert "".join(mapped.iter_text(chunk_bytes=4)) == "first\n"
+    assert mapped.read_prefix(5) == ("first\n", True)
+    assert mapped.version == version
+
+    mapped.refresh()
+    assert (mapped.version, mapped.lines, mapped.size) == (version + 1, 2, 6)
+
+
+def test_refresh_does_not_block_readers(tmp_path, monkeypatch):
+    """Test reads keep serving the current mapping while refresh() counts the changed file."""
+    import threading
+
+    path = tmp_path / "log.txt"
+    path.write_text("old\n", encoding="utf-8")
+    mapped = MappedText(str(path))
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("new\n")
+
+    counting = threading.Event()
+    release = threading.Event()
+    count = mapped_file._count
+
+    def slow_count(view):
+        counting.set()
+        release.wait(5)
+        return count(view)
+
+    monkeypatch.setattr(mapped_file, "_count", slow_count)
+    refresher = threading.Thread(target=mapped.refresh)
+    refresher.start()
+    assert counting.wait(5)
+    assert mapped.read_text() == "old\n"
+    release.set()
+    refresher.join(5)
+    assert mapped.read_text() == "old\nnew\n"
+
+
+def test_mapped_attachment_is_never_cached(tmp_path):
+    """Test listing, preview, and export read the mapped file without keeping its text."""
+    path = tmp_path / "big.log"
+    path.write_text("".join(f"line {i}\n" for i in range(100000)), encoding="utf-8")
+    core = ScriptboardCore()
+    core.add_attachment_from_text("small", suggested_name="a.txt")
+
+    tracemalloc.start()
+    att = core.add_attachment_from_mapped_file(MappedText(str(path)))
+    assert att.lines == 100001
+    assert core.build_preview().endswith("line 0\nline 1\nline 2\n...")
+    exported = "".join(core.iter_llm_friendly_export())
+    assert "line 99999\n" in exported
+    del exported
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert not att.content_loaded
+    assert retained < path.stat().st_size // 4
+
+
+def test_mapped_attachment_round_trip(tmp_path):
+    """Test autosave-style serialization stores the path and replays through the journal."""
+    path = tmp_path / "big.log"
+    path.write_text("alpha\nbeta", encoding="utf-8")
+    core = ScriptboardCore()
+    core.drain_journal()
+    session = core.to_dict(keep_refs=True)
+
+    att = core.add_attachment_from_mapped_file(MappedText(str(path)), suggested_name="big.log")
+    ops, _ = core.drain_journal()
+    for op in ops:
+        apply_op(session, op)
+    assert session["attachments"][0]["mapped_path"] == str(path)
+    assert "content" not in session["attachments"][0]
+    assert core.to_dict()["attachments"][0]["content"] == "alpha\nbeta"
+
+    restored = ScriptboardCore()
+    restored.load_from_dict(session)
+    assert restored.attachments[0].id == att.id
+    assert restored.attachments[0].content_mapped is not None
+    assert restored.search("beta")["total"] == 1
+
+    path.unlink()
+    missing = Attachment.from_dict(session["attachments"][0])
+    assert missing.content == "" and missing.filename == "big.log"
+
+
+def test_attach_file_endpoint(tmp_path, monkeypatch):
+    """Test /attachments/file maps on request and reads small files normally."""
+    monkeypatch.setattr(api, "core", ScriptboardCore())
+    client = TestClient(api.app)
+    path = tmp_path / "app.log"
+    path.write_text("one\ntwo\n", encoding="utf-8")
+
+    mapped = client.post("/attachments/file", json={"path": str(path), "mmap": True}).json()
+    loaded = client.post("/attachments/file", json={"path": str(path)}).json()
+    assert (mapped["mapped"], mapped["lines"]) == (True, 3)
+    assert (loaded["mapped"], loaded["lines"]) == (False, 3)
+    assert client.post("/attachments/file", json={"path": str(tmp_path / "missing")}).status_code == 400
+
+    # Undecodable files are rejected rather than attached empty
+    garbage = tmp_path / "garbage.txt"
+    garbage.write_bytes(b"\xff\xfe\xff" * 10)
+    response = client.post("/attachments/file", json={"path": str(garbage)})
+    assert response.status_code == 400
+    assert len(api.core.attachments) == 2
+
+
+def test_search_follows_changed_mapped_file(tmp_path, monkeypatch):
+    """Test exact search, regex search, and token counts agree after the mapped file grows."""
+    monkeypatch.setattr(api, "core", ScriptboardCore())
+    client = TestClient(api.app)
+    path = tmp_path / "app.log"
+    path.write_text("start\n", encoding="utf-8")
+    client.post("/attachments/file", json={"path": str(path), "mmap": True})
+    api.core.count_pending_tokens()
+    assert client.get("/search", params={"q": "needle"}).json()["total"] == 0
+    tokens = api.core.get_token_counts()["attachment_tokens"]
+
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("a needle appended later\n" * 10)
+    assert client.get("/search", params={"q": "needle"}).json()["total"] == 1
+    assert client.get("/search", params={"q": "need.e", "mode": "regex"}).json()["total"] == 1
+    api.core.count_pending_tokens()
+    assert api.core.get_token_counts()["attachment_tokens"] > tokens
+    assert api.core.refresh_mapped_attachments() is False
+
+
+def test_changed_mapped_file_is_remapped_off_the_event_loop(tmp_path, monkeypatch):
+    """Test searches stat and re-map mapped files in a worker and match without decoding them whole."""
+    import asyncio
+
+    monkeypatch.setattr(api, "core", ScriptboardCore())
+    client = TestClient(api.app)
+    path = tmp_path / "app.log"
+    path.write_text("start\n", encoding="utf-8")
+    client.post("/attachments/file", json={"path": str(path), "mmap": True})
+    mapped = api.core.attachments[0].content_mapped
+    assert api.core.mapped_files() == [mapped]
+
+    calls = []
+
+    def recording(method):
+        def wrapper(self, *args, **kwargs):
+            try:
+                asyncio.get_running_loop()
+                calls.append((method.__name__, True))
+            except RuntimeError:
+                calls.append((method.__name__, False))
+            return method(self, *args, **kwargs)
+        return wrapper
+
+    monkeypatch.setattr(MappedText, "_remap", recording(MappedText._remap))
+    monkeypatch.setattr(MappedText, "is_stale", recording(MappedText.is_stale))
+    monkeypatch.setattr(MappedText, "read_text", recording(MappedText.read_text))
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("grown\n")
+    assert client.get("/search", params={"q": "grown"}).json()["total"] == 1
+    assert ("_remap", False) in calls
+    assert all(not on_loop for _, on_loop in calls)
+
+    # Exact and ranked searches scan the mapping in chunks rather than decoding it
+    calls.clear()
+    assert api.core.search("grown")["results"][0]["snippet"] == "start\ngrown\n"
+    ranked = api.core.search("GROWN", ranked=True)["results"][0]
+    assert (ranked["match_count"], ranked["matches"]) == (1, [6])
+    assert not [name for name, _ in calls if name == "read_text"]
+
+
+def test_saved_session_does_not_depend_on_mapped_file(tmp_path, monkeypatch):
+    """Test explicit saves store mapped content, while autosave state keeps the path."""
+    monkeypatch.setattr(api, "core", ScriptboardCore())
+    monkeypatch.setattr(api, "get_sessions_dir", lambda: tmp_path / "sessions")
+    monkeypatch.setattr(api, "get_blobs_dir", lambda: tmp_path / "blobs")
+    (tmp_path / "sessions").mkdir()
+    client = TestClient(api.app)
+    path = tmp_path / "app.log"
+    path.write_text("original line\n" * 100, encoding="utf-8")
+    client.post("/attachments/file", json={"path": str(path), "mmap": True})
+    assert "mapped_path" in api.core.to_dict(keep_refs=True)["attachments"][0]
+
+    for fmt in ("json", "binary"):
+        saved = client.post("/sessions/save", params={"filename": "s", "format": fmt}).json()
+        session_path = tmp_path / "sessions" / saved["filename"]
+        assert "mapped_path" not in api.load_session(session_path)["attachments"][0]
+
+    path.unlink()
+    for name in ("s.json", "s.sbs"):
+        attachment = api.load_session(tmp_path / "sessions" / name)["attachments"][0]
+        assert attachment["content"] == "original line\n" * 100
@@ -112,7 +112,7 @@ def test_token_counting_performance(client, large_dataset):
     # Target: <200ms for tokenization of 10k characters
     start_time = time.time()
     
-    response = client.get("/tokens")
+    response = client.get("/tokens?wait=true")
     
     elapsed_ms = (time.time() - start_time) * 1000
     
@@ -0,0 +1,93 @@
+"""
+Unit tests for the trigram search index.
+"""
+
+import time
+
+import pytest
+
+from search_index import (
+    SearchTimeoutError,
+    TrigramIndex,
+    compile_pattern,
+    extract_trigrams,
+    find_in_chunks,
+    fuzzy_find,
+    regex_find,
+    split_pieces,
+)
+
+
+def test_extract_trigrams():
+    """Test trigram extraction on short and normal text."""
+    assert extract_trigrams("ab") == frozenset()
+    assert extract_trigrams("abcd") == {"abc", "bcd"}
+
+
+def test_candidates_intersect_postings():
+    """Test only documents containing every query trigram are candidates."""
+    index = TrigramIndex()
+    index.add("a", "Hello World")
+    index.add("b", "hello there")
+    index.add("c", "goodbye")
+
+    assert index.candidates("HELLO") == {"a", "b"}
+    assert index.candidates("world") == {"a"}
+    assert index.candidates("missing") == set()
+    assert index.candidates("he") is None
+
+
+def test_replace_and_remove():
+    """Test re-adding a key replaces it and removal drops empty postings."""
+    index = TrigramIndex()
+    index.add("a", "alpha")
+    index.add("a", "beta")
+    assert index.candidates("alpha") == set()
+    assert index.candidates("beta") == {"a"}
+
+    index.remove("a")
+    assert len(index) == 0
+    assert index.candidates("beta") == set()
+    assert index._postings == {}
+
+
+def test_compile_pattern_cache_and_errors():
+    """Test compiled patterns are reused and invalid ones raise ValueError."""
+    assert compile_pattern(r"ab+c") is compile_pattern(r"ab+c")
+    with pytest.raises(ValueError):
+        compile_pattern(r"(unclosed")
+
+
+def test_regex_find_respects_deadline():
+    """Test an expired deadline stops the search."""
+    pattern = compile_pattern(r"needle")
+    assert regex_find(pattern, "hay NEEDLE hay") == (4, 10)
+    with pytest.raises(SearchTimeoutError):
+        regex_find(pattern, "hay needle", deadline=time.monotonic() - 1)
+
+
+def test_fuzzy_find():
+    """Test approximate matching within the edit budget."""
+    text = "the quick brown fox jumps over the lazy dog"
+    assert fuzzy_find(text, "jumsp", 2) is not None
+    assert fuzzy_find(text, "quik brwn", 2) is not None
+    assert fuzzy_find(text, "elephant", 2) is None
+    assert fuzzy_find(text, "lazy", 0) == (35, 39)
+
+
+def test_split_pieces_cover_query():
+    """Test query pieces are contiguous and cover the whole query."""
+    pieces = split_pieces("abcdefgh", 2)
+    assert len(pieces) == 3
+    assert "".join(piece for _, piece in pieces) == "abcdefgh"
+
+
+def test_find_in_chunks_matches_joined_text():
+    """Test chunked matching finds matches across chunk boundaries, like searching the joined text."""
+    text = "Alpha needle beta NEEDLE gamma needleneedle"
+    for size in (1, 2, 5, 7, 100):
+        chunks = [text[i:i + size] for i in range(0, len(text), size)]
+        assert find_in_chunks(chunks, "needle", 6) == (4, [6, 18, 31, 37], "Alpha needle beta ...")
+        assert find_in_chunks(chunks, "needle", 0, max_matches=2, max_offsets=1) == (2, [6], "...needle...")
+        assert find_in_chunks(chunks, "missing", 6) == (0, [], "")
+
@@ -0,0 +1,85 @@
+"""
+Unit tests for the session file formats.
+"""
+
+import io
+
+import pytest
+
+import api
+from core import ScriptboardCore
+from session_format import (
+    BINARY_MAGIC,
+    FORMAT_BINARY,
+    FORMAT_JSON,
+    detect_format,
+    dump_session,
+    json_dumps,
+    json_loads,
+    loads_session,
+)
+
+
+def _sample_session():
+    core = ScriptboardCore()
+    core.set_prompt("Summarize — ünïcödé 🚀\n")
+    core.add_attachment_from_text("def f():\n    return '\"quoted\"'\n" * 100, suggested_name="a.py")
+    core.add_attachment_from_path("img.png", "", binary=True)
+    core.add_response("", source="empty")
+    core.add_response("answer\r\nwith\ttabs", source="gpt")
+    return core.to_dict()
+
+
+@pytest.mark.parametrize("fmt", [FORMAT_JSON, FORMAT_BINARY])
+def test_format_roundtrip(fmt):
+    """Test both formats decode back to the original session."""
+    session_data = _sample_session()
+    buffer = io.BytesIO()
+    dump_session(session_data, buffer, fmt)
+    data = buffer.getvalue()
+
+    assert detect_format(data) == fmt
+    assert data.startswith(BINARY_MAGIC) == (fmt == FORMAT_BINARY)
+    assert loads_session(data) == session_data
+
+
+def test_binary_keeps_content_out_of_header():
+    """Test content is stored verbatim in the body and references pass through."""
+    session_data = _sample_session()
+    session_data["attachments"].append({"id": "att_9", "filename": "r.txt", "content_ref": "sha256:ab", "chars": 5})
+    buffer = io.BytesIO()
+    dump_session(session_data, buffer, FORMAT_BINARY)
+    data = buffer.getvalue()
+
+    body = session_data["attachments"][0]["content"].encode("utf-8")
+    assert body in data  # No JSON escaping of quotes or newlines
+    assert loads_session(data) == session_data
+
+    with pytest.raises(ValueError, match="Truncated"):
+        loads_session(data[:-10])
+    with pytest.raises(ValueError):
+        loads_session(b"{not json")
+
+
+def test_json_dumps_is_compact_utf8():
+    """Test the JSON fast path writes compact, unescaped UTF-8."""
+    data = json_dumps({"text": "é", "n": [1, 2]})
+    assert data == '{"text":"é","n":[1,2]}'.encode("utf-8")
+    assert json_loads(data) == {"text": "é", "n": [1, 2]}
+
+
+def test_save_session_binary(tmp_path, monkeypatch):
+    """Test binary sessions are self-contained and load like JSON sessions."""
+    monkeypatch.setattr(api, "get_sessions_dir", lambda: tmp_path / "sessions")
+    monkeypatch.setattr(api, "get_blobs_dir", lambda: tmp_path / "blobs")
+    (tmp_path / "sessions").mkdir()
+
+    session_data = _sample_session()
+    path = api.save_session(session_data, fmt=FORMAT_BINARY)
+    assert path.suffix == ".sbs"
+    assert not (tmp_path / "blobs").exists()
+    assert api.load_session(path) == session_data
+    assert api.load_session(path, lazy=True) == session_data
+
+    with pytest.raises(ValueError, match="Unsupported"):
+        api.save_session(session_data, fmt="msgpack")
@@ -0,0 +1,192 @@
+"""
+Unit tests for the saved session index and the /sessions listing endpoint.
+"""
+
+import json
+
+from fastapi.testclient import TestClient
+
+import api
+from core import ScriptboardCore
+from mapped_file import MappedText
+from session_format import FORMAT_BINARY
+from session_index import SessionIndex, session_stats
+
+
+def _use_tmp_dirs(tmp_path, monkeypatch):
+    sessions_dir = tmp_path / "sessions"
+    sessions_dir.mkdir()
+    monkeypatch.setattr(api, "get_sessions_dir", lambda: sessions_dir)
+    monkeypatch.setattr(api, "get_blobs_dir", lambda: tmp_path / "blobs")
+    return sessions_dir
+
+
+def _session(attachments: int) -> dict:
+    core = ScriptboardCore()
+    core.set_prompt("prompt")
+    for i in range(attachments):
+        core.add_attachment_from_text("x" * 2000, suggested_name=f"f{i}.txt")
+    core.add_response("ok", source="gpt")
+    return core.to_dict()
+
+
+def test_session_stats_manifest_and_inline(tmp_path, monkeypatch):
+    """Test stats match for inline sessions and blob manifests."""
+    sessions_dir = _use_tmp_dirs(tmp_path, monkeypatch)
+    session_data = _session(2)
+    path = api.save_session(session_data, filename="a.json")
+    manifest = json.loads(path.read_text(encoding="utf-8"))
+
+    expected = {"attachment_count": 2, "response_count": 1, "total_chars": 6 + 4000 + 2}
+    assert session_stats(session_data) == expected
+    assert session_stats(manifest) == expected
+
+    total, entries = SessionIndex(sessions_dir).list()
+    assert total == 1
+    assert entries[0]["name"] == "a.json"
+    assert entries[0]["total_chars"] == expected["total_chars"]
+
+
+def test_sync_reconciles_external_changes(tmp_path, monkeypatch):
+    """Test files added or deleted outside save_session are reconciled."""
+    sessions_dir = _use_tmp_dirs(tmp_path, monkeypatch)
+    api.save_session(_session(1), filename="saved.json", total_tokens=42)
+    (sessions_dir / "legacy.json").write_text(json.dumps(_session(3)), encoding="utf-8")
+    (sessions_dir / "broken.json").write_text("{", encoding="utf-8")
+    (sessions_dir / "notes.txt").write_text("ignored", encoding="utf-8")
+
+    index = SessionIndex(sessions_dir)
+    assert index.sync() == 1
+    assert index.sync() == 0  # Unchanged files are not re-read
+
+    total, entries = index.list(sort="attachment_count")
+    assert total == 2
+    assert [e["name"] for e in entries] == ["legacy.json", "saved.json"]
+    assert entries[0]["total_tokens"] is None
+    assert entries[1]["total_tokens"] == 42
+
+    (sessions_dir / "legacy.json").unlink()
+    assert index.sync() == 1
+    assert index.list()[0] == 1
+
+
+def test_list_sessions_endpoint(tmp_path, monkeypatch):
+    """Test /sessions pages, sorts, and validates its parameters."""
+    _use_tmp_dirs(tmp_path, monkeypatch)
+    for i in range(5):
+        api.save_session(_session(i), filename=f"s{i}.json")
+    api.save_session(_session(9), filename="big.sbs", fmt=FORMAT_BINARY)
+
+    client = TestClient(api.app)
+    response = client.get("/sessions", params={"sort": "total_chars", "order": "desc", "limit": 2})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 6
+    assert [s["name"] for s in data["sessions"]] == ["big.sbs", "s4.json"]
+    assert data["sessions"][0]["format"] == "binary"
+
+    page = client.get("/sessions", params={"sort": "name", "order": "asc", "offset": 4}).json()
+    assert [s["name"] for s in page["sessions"]] == ["s3.json", "s4.json"]
+
+    assert client.get("/sessions", params={"sort": "prompt"}).status_code == 400
+    assert client.get("/sessions", params={"order": "up"}).status_code == 400
+
+
+def test_search_sessions_endpoint(tmp_path, monkeypatch):
+    """Test /sessions/search finds items across saved sessions, including blob content."""
+    sessions_dir = _use_tmp_dirs(tmp_path, monkeypatch)
+    core = ScriptboardCore()
+    core.set_prompt("Refactor the parser")
+    core.add_attachment_from_text("def tokenize(src):\n    return src.split()\n" * 50, suggested_name="lexer.py")
+    api.save_session(core.to_dict(), filename="monday.json")
+    attachment_id = core.attachments[0].id
+
+    core = ScriptboardCore()
+    core.add_response("The flaky test was a race in the file watcher.", source="gpt")
+    api.save_session(core.to_dict(), filename="friday.sbs", fmt=FORMAT_BINARY)
+
+    # A session saved before the index existed is picked up on search
+    legacy = ScriptboardCore()
+    legacy.add_response("Another watcher race, same fix.", source="claude")
+    (sessions_dir / "legacy.json").write_text(json.dumps(legacy.to_dict()), encoding="utf-8")
+
+    client = TestClient(api.app)
+    data = client.get("/sessions/search", params={"q": "tokenize"}).json()
+    assert data["total"] == 1
+    hit = data["results"][0]
+    assert (hit["session"], hit["type"], hit["name"]) == ("monday.json", "attachment", "lexer.py")
+    assert hit["id"] == attachment_id
+    assert "tokenize" in hit["snippet"]
+
+    data = client.get("/sessions/search", params={"q": "Watcher RACE"}).json()
+    assert {r["session"] for r in data["results"]} == {"friday.sbs", "legacy.json"}
+    assert all(r["type"] == "response" for r in data["results"])
+
+    # Quotes and FTS5 operators are matched literally rather than parsed
+    assert client.get("/sessions/search", params={"q": 'parser" OR NOT'}).status_code == 200
+    assert client.get("/sessions/search", params={"q": "   "}).status_code == 400
+
+    # Re-saving replaces a session's documents
+    api.save_session(ScriptboardCore().to_dict(), filename="monday.json")
+    assert client.get("/sessions/search", params={"q": "tokenize"}).json()["total"] == 0
+
+
+def test_search_sessions_indexes_mapped_attachments(tmp_path, monkeypatch):
+    """Test memory-mapped attachments saved as paths are searchable by their file content."""
+    _use_tmp_dirs(tmp_path, monkeypatch)
+    log = tmp_path / "server.log"
+    log.write_text("boot ok\n" * 100 + "segfault in worker 7\n", encoding="utf-8")
+    core = ScriptboardCore()
+    core.add_attachment_from_mapped_file(MappedText(str(log)), suggested_name="server.log")
+    session_data = core.to_dict(keep_refs=True)
+    assert "content" not in session_data["attachments"][0]
+    api.save_session(session_data, filename="crash.json")
+
+    client = TestClient(api.app)
+    data = client.get("/sessions/search", params={"q": "segfault"}).json()
+    assert data["total"] == 1
+    assert (data["results"][0]["session"], data["results"][0]["name"]) == ("crash.json", "server.log")
+
+    # A file that is gone leaves the attachment findable by name
+    log.unlink()
+    api.save_session(session_data, filename="crash.json")
+    assert client.get("/sessions/search", params={"q": "segfault"}).json()["total"] == 0
+    assert client.get("/sessions/search", params={"q": "server"}).json()["total"] == 1
+
+
+def test_full_text_index_stores_no_text(tmp_path, monkeypatch):
+    """Test the FTS table keeps no copy of the text, and tombstones are skipped and rebuilt away."""
+    import sqlite3
+
+    import session_index
+    from session_index import make_snippet
+
+    sessions_dir = _use_tmp_dirs(tmp_path, monkeypatch)
+    monkeypatch.setattr(session_index, "REBUILD_MIN_TOMBSTONES", 0)
+    core = ScriptboardCore()
+    core.add_response("unique marker " + "padding words " * 5000, source="gpt")
+    for _ in range(3):
+        api.save_session(core.to_dict(), filename="a.json")  # Re-saves leave tombstones
+
+    index = api.get_session_index()
+    with sqlite3.connect(index.path) as conn:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master")}
+        assert "session_docs_content" not in tables
+        assert conn.execute("SELECT COUNT(*) FROM session_docs").fetchone()[0] == 3
+
+    total, results = index.search("marker")
+    assert total == 1
+    assert results[0]["snippet"].startswith("unique marker padding")
+
+    index.sync()  # More tombstones than documents: rebuilt
+    with sqlite3.connect(index.path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM session_docs").fetchone()[0] == 1
+    assert index.search("marker")[0] == 1
+
+    (sessions_dir / "a.json").unlink()
+    index.sync()
+    assert index.search("marker")[0] == 0
+
+    text = " ".join(f"w{i}" for i in range(100)) + " Needle " + " ".join(f"x{i}" for i in range(100))
+    assert make_snippet(text, "needle") == "...w96 w97 w98 w99 Needle x0 x1 x2 x3 x4 x5 x6 x7 x8 x9 x10..."
+    assert make_snippet("short text", "absent") == "short text"
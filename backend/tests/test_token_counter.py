@@ -0,0 +1,116 @@
+"""
+Unit tests for token counting helpers.
+"""
+
+import token_counter
+from token_counter import (
+    LRUCache,
+    cached_token_counts,
+    count_tokens_batch,
+    token_count_matrix,
+    truncate_to_tokens,
+)
+
+
+class FakeEncoding:
+    """Whitespace tokenizer that records how it was called."""
+
+    name = "fake_base"
+
+    def __init__(self):
+        self.batch_calls = []
+
+    def encode_ordinary(self, text):
+        return text.split()
+
+    def encode_ordinary_batch(self, texts, num_threads=8):
+        self.batch_calls.append(list(texts))
+        return [text.split() for text in texts]
+
+
+def test_lru_cache_evicts_least_recently_used():
+    """Test the cache stays bounded and keeps recently used keys."""
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert "b" not in cache
+    assert "a" in cache and "c" in cache
+    assert len(cache) == 2
+
+
+def test_fallback_without_encoding(monkeypatch):
+    """Test the len // 4 estimate is used when no encoding is available."""
+    monkeypatch.setattr(token_counter, "get_encoding", lambda model: None)
+    assert count_tokens_batch(["x" * 40, ""], "unknown") == [10, 0]
+
+
+def test_cached_counts_encode_misses_in_one_batch(monkeypatch):
+    """Test only uncached, deduplicated texts are encoded, in one call."""
+    encoding = FakeEncoding()
+    monkeypatch.setattr(token_counter, "get_encoding", lambda model: encoding)
+    cache = LRUCache()
+
+    assert cached_token_counts(cache, ["one two", "three", "one two"]) == [2, 1, 2]
+    assert encoding.batch_calls == [["one two", "three"]]
+
+    assert cached_token_counts(cache, ["three", "four five six", "x y"]) == [1, 3, 2]
+    assert encoding.batch_calls[-1] == ["four five six", "x y"]
+
+
+def test_approximate_counts_sample_large_texts(monkeypatch):
+    """Test approximate mode encodes samples only and scales by length."""
+    encoding = FakeEncoding()
+    monkeypatch.setattr(token_counter, "get_encoding", lambda model: encoding)
+    text = "word " * (token_counter.APPROX_THRESHOLD_CHARS // 5 + 1000)
+
+    [exact] = count_tokens_batch([text], "gpt-4")
+    [approx] = count_tokens_batch([text, "short one"], "gpt-4", approximate=True)[:1]
+
+    sampled = encoding.batch_calls[-1]
+    assert len(sampled) == token_counter.APPROX_SAMPLES + 1
+    assert sum(len(piece) for piece in sampled) < len(text)
+    assert abs(approx - exact) / exact < 0.01
+
+
+def test_token_count_matrix(monkeypatch):
+    """Test per-model section counts, with unknown models falling back."""
+    encoding = FakeEncoding()
+    monkeypatch.setattr(
+        token_counter, "get_encoding", lambda model: encoding if model == "gpt-4" else None
+    )
+    sections = {"prompt_tokens": ["a b c d"], "attachment_tokens": ["x" * 40, "y y"]}
+
+    rows = token_count_matrix(LRUCache(), sections, ["gpt-4", "claude-3", "gpt-4"])
+    assert [row["model"] for row in rows] == ["gpt-4", "claude-3"]
+    assert rows[0]["tokenizer"] == "fake_base"
+    assert rows[0]["prompt_tokens"] == 4
+    assert rows[0]["attachment_tokens"] == 3
+    assert rows[1]["tokenizer"] == token_counter.FALLBACK_TOKENIZER
+    assert rows[1]["attachment_tokens"] == 10
+    assert rows[1]["total_tokens"] == 11
+
+
+def test_truncate_to_tokens(monkeypatch):
+    """Test truncation keeps a prefix within the token limit, cut at a line break."""
+    monkeypatch.setattr(token_counter, "get_encoding", lambda model: FakeEncoding())
+    text = "\n".join(f"word{i} word{i}" for i in range(100))
+
+    prefix = truncate_to_tokens(text, 51, "fake")
+    assert text.startswith(prefix)
+    assert 40 <= len(prefix.split()) <= 51
+    assert text[len(prefix)] == "\n"
+
+    assert truncate_to_tokens(text, 500, "fake") == text
+    assert truncate_to_tokens(text, 0, "fake") == ""
+
+
+def test_truncate_to_tokens_with_uneven_density(monkeypatch):
+    """Test the limit holds when the token density of the text varies too much to estimate."""
+    monkeypatch.setattr(token_counter, "get_encoding", lambda model: FakeEncoding())
+    text = " a" * 5000 + "x" * 1000000  # Dense head, one long token after
+
+    prefix = truncate_to_tokens(text, 3000, "fake")
+    assert text.startswith(prefix)
+    assert len(prefix.split()) == 3000
@@ -0,0 +1,339 @@
+"""
+Token counting helpers for ScriptboardCore.
+
+tiktoken encodings are loaded once per model and reused, and documents are
+encoded in batches (tiktoken encodes batches on its own thread pool with the
+GIL released). Counts are memoized in a bounded LRU keyed by tokenizer and
+content hash, so repeated /tokens calls only encode new content, and models
+sharing an encoding (e.g. gpt-4 and gpt-3.5-turbo) share cache entries.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+DEFAULT_MODEL = "gpt-4"
+
+# Maximum number of (model, content hash) entries kept in a token cache
+TOKEN_CACHE_SIZE = 8192
+
+# Worker threads tiktoken uses for batch encoding
+ENCODE_THREADS = 8
+
+# Maximum models counted concurrently by token_count_matrix
+MAX_MODEL_WORKERS = 4
+
+# Tokenizer name reported for models without a tiktoken encoding
+FALLBACK_TOKENIZER = "chars/4"
+
+# Approximate mode: texts longer than this are estimated from evenly spaced samples
+APPROX_THRESHOLD_CHARS = 256 * 1024
+APPROX_SAMPLES = 8
+APPROX_SAMPLE_CHARS = 8 * 1024
+
+# Re-counts truncate_to_tokens makes before falling back to a proportional cut
+TRUNCATE_REFINE_STEPS = 4
+
+
+class LRUCache:
+    """
+    Bounded mapping that evicts the least recently used entry when full.
+
+    Access is guarded by a lock because the token worker fills the cache from
+    the thread pool while request handlers read it on the event loop.
+    """
+
+    def __init__(self, maxsize: int = TOKEN_CACHE_SIZE) -> None:
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get a value and mark it as most recently used."""
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store a value, evicting the oldest entry if over capacity."""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove a key and return its value."""
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self) -> None:
+        """Remove every entry."""
+        with self._lock:
+            self._data.clear()
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str = DEFAULT_MODEL):
+    """
+    Get the tiktoken encoding for a model, loading it at most once.
+
+    Failures are cached too, so an unknown model or a missing tiktoken
+    install costs one attempt rather than one per call.
+
+    Args:
+        model: Model identifier (e.g. "gpt-4")
+
+    Returns:
+        tiktoken Encoding, or None if unavailable for this model
+    """
+    try:
+        import tiktoken
+        return tiktoken.encoding_for_model(model)
+    except Exception:
+        return None
+
+
+def tokenizer_name(model: str = DEFAULT_MODEL) -> str:
+    """
+    Get the name of the tokenizer used for a model.
+
+    Args:
+        model: Model identifier
+
+    Returns:
+        tiktoken encoding name (e.g. "cl100k_base"), or FALLBACK_TOKENIZER
+    """
+    encoding = get_encoding(model)
+    return encoding.name if encoding is not None else FALLBACK_TOKENIZER
+
+
+def token_cache_key(model: str, text: str, approximate: bool = False) -> Tuple[str, int, bool]:
+    """
+    Build the token cache key for a text.
+
+    Args:
+        model: Model identifier
+        text: Text being counted
+        approximate: Whether the count is a sampled estimate
+
+    Returns:
+        (tokenizer name, content hash, approximate) tuple
+    """
+    return tokenizer_name(model), hash(text), approximate and len(text) > APPROX_THRESHOLD_CHARS
+
+
+def fallback_token_count(text: str) -> int:
+    """Rough estimate used when no tokenizer is available (1 token ≈ 4 characters)."""
+    return len(text) // 4
+
+
+def sample_text(text: str) -> List[str]:
+    """
+    Take APPROX_SAMPLES evenly spaced slices of a long text.
+
+    Args:
+        text: Text longer than APPROX_THRESHOLD_CHARS
+
+    Returns:
+        List of APPROX_SAMPLE_CHARS-character slices
+    """
+    stride = (len(text) - APPROX_SAMPLE_CHARS) // max(APPROX_SAMPLES - 1, 1)
+    return [
+        text[i * stride:i * stride + APPROX_SAMPLE_CHARS]
+        for i in range(APPROX_SAMPLES)
+    ]
+
+
+def count_tokens_batch(
+    texts: Sequence[str],
+    model: str = DEFAULT_MODEL,
+    approximate: bool = False,
+) -> List[int]:
+    """
+    Count tokens for several texts with a single batched encode call.
+
+    Special-token strings such as "<|endoftext|>" are counted as plain text.
+
+    Args:
+        texts: Texts to count
+        model: Model identifier
+        approximate: Estimate texts over APPROX_THRESHOLD_CHARS by encoding
+                     APPROX_SAMPLES slices and scaling by length
+
+    Returns:
+        Token counts in the same order as texts
+    """
+    if not texts:
+        return []
+    encoding = get_encoding(model)
+    if encoding is None:
+        return [fallback_token_count(text) for text in texts]
+
+    # Expand each text into the pieces actually encoded (whole text or samples)
+    pieces: List[str] = []
+    spans: List[Tuple[int, int, float]] = []  # (first piece, piece count, scale)
+    for text in texts:
+        if approximate and len(text) > APPROX_THRESHOLD_CHARS:
+            samples = sample_text(text)
+            spans.append((len(pieces), len(samples), len(text) / sum(len(x) for x in samples)))
+            pieces.extend(samples)
+        else:
+            spans.append((len(pieces), 1, 1.0))
+            pieces.append(text)
+
+    try:
+        if len(pieces) == 1:
+            encoded_lengths = [len(encoding.encode_ordinary(pieces[0]))]
+        else:
+            encoded = encoding.encode_ordinary_batch(pieces, num_threads=ENCODE_THREADS)
+            encoded_lengths = [len(tokens) for tokens in encoded]
+    except Exception:
+        return [fallback_token_count(text) for text in texts]
+
+    return [
+        round(sum(encoded_lengths[start:start + count]) * scale)
+        for start, count, scale in spans
+    ]
+
+
+def cached_token_counts(
+    cache: LRUCache,
+    texts: Sequence[str],
+    model: str = DEFAULT_MODEL,
+    approximate: bool = False,
+) -> List[int]:
+    """
+    Count tokens for several texts, encoding only those not already cached.
+
+    Args:
+        cache: LRU keyed by token_cache_key()
+        texts: Texts to count
+        model: Model identifier
+        approximate: Use sampled estimates for very large texts
+
+    Returns:
+        Token counts in the same order as texts
+    """
+    keys = [token_cache_key(model, text, approximate) for text in texts]
+    counts: List[Optional[int]] = [cache.get(key) for key in keys]
+
+    missing = {}  # cache key -> text, deduplicated
+    for key, count, text in zip(keys, counts, texts):
+        if count is None:
+            missing[key] = text
+
+    if missing:
+        missing_keys = list(missing)
+        new_counts = count_tokens_batch([missing[k] for k in missing_keys], model, approximate)
+        computed = dict(zip(missing_keys, new_counts))
+        for key, count in computed.items():
+            cache.put(key, count)
+        counts = [count if count is not None else computed[key] for key, count in zip(keys, counts)]
+    return counts
+
+
+def token_count_matrix(
+    cache: LRUCache,
+    sections: Dict[str, Sequence[str]],
+    models: Sequence[str],
+    approximate: bool = False,
+) -> List[Dict]:
+    """
+    Count tokens per section for several models, one model per worker thread.
+
+    Args:
+        cache: LRU keyed by token_cache_key()
+        sections: Section name -> texts in that section
+        models: Model identifiers (duplicates are ignored)
+        approximate: Use sampled estimates for very large texts
+
+    Returns:
+        One dictionary per model with model, tokenizer, approximate flag,
+        per-section token counts, and total_tokens
+    """
+    models = list(dict.fromkeys(models))
+    names = list(sections)
+    texts = [text for name in names for text in sections[name]]
+
+    def count_model(model: str) -> Dict:
+        counts = cached_token_counts(cache, texts, model, approximate)
+        row = {"model": model, "tokenizer": tokenizer_name(model), "approximate": approximate}
+        start = 0
+        for name in names:
+            row[name] = sum(counts[start:start + len(sections[name])])
+            start += len(sections[name])
+        row["total_tokens"] = sum(counts)
+        return row
+
+    if len(models) <= 1:
+        return [count_model(model) for model in models]
+    with ThreadPoolExecutor(max_workers=min(len(models), MAX_MODEL_WORKERS)) as pool:
+        return list(pool.map(count_model, models))
+
+
+def truncate_to_tokens(
+    text: str,
+    max_tokens: int,
+    model: str = DEFAULT_MODEL,
+    total_tokens: Optional[int] = None,
+) -> str:
+    """
+    Cut text to a prefix of at most max_tokens tokens.
+
+    The cut point is estimated from the text's token density and refined by
+    re-counting the prefix (at most TRUNCATE_REFINE_STEPS times); if the
+    density varies too much for that to converge, the longest fitting prefix
+    is found by binary search. The cut is then moved back to a line break
+    when one is close.
+
+    Args:
+        text: Text to truncate
+        max_tokens: Token limit for the returned prefix
+        model: Model identifier
+        total_tokens: Token count of the whole text, if already known
+
+    Returns:
+        Prefix of text, or text unchanged if it already fits
+    """
+    if max_tokens <= 0 or not text:
+        return ""
+    if total_tokens is None:
+        total_tokens = count_tokens_batch([text], model)[0]
+    if total_tokens <= max_tokens:
+        return text
+
+    cut = len(text) * max_tokens // max(total_tokens, 1)
+    for _ in range(TRUNCATE_REFINE_STEPS):
+        count = count_tokens_batch([text[:cut]], model)[0]
+        if count <= max_tokens:
+            break
+        cut = max(min(cut - 1, cut * max_tokens // count), 0)
+    else:
+        # Every prefix tried was too long; text[:cut] is the longest candidate
+        low, high = 0, cut
+        while low < high:
+            mid = (low + high + 1) // 2
+            if count_tokens_batch([text[:mid]], model)[0] <= max_tokens:
+                low = mid
+            else:
+                high = mid - 1
+        cut = low
+
+    line_end = text.rfind("\n", 0, cut)
+    if line_end > cut // 2:
+        cut = line_end
+    return text[:cut]